@@ -1,35 +1,71 @@
+import numpy as np
 import pandas as pd
 import openpyxl
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import calendar
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-
-
-def convert_excel_date(date_val):
-    """将Excel日期数字或中文日期转换为datetime对象"""
-    try:
-        if pd.isna(date_val):
-            return pd.NaT
-
-        if isinstance(date_val, (int, float)):
-            return datetime(1899, 12, 30) + timedelta(days=date_val)
-
-        date_str = str(date_val).strip().replace(" ", "")
-        if "月" in date_str and "日" in date_str:
-            month_day = date_str.split("月")
-            month = int(month_day[0])
-            day = int(month_day[1].replace("日", ""))
-            year = datetime.now().year
-            return datetime(year, month, day)
-
-        return pd.to_datetime(date_val)
-
-    except Exception as e:
-        print(f"日期转换错误: {date_val}, 错误: {str(e)}")
-        return pd.NaT
+import re
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+
+import backgroundTask
+import workbookSession
+from profiling import count, format_report, profiled_run, span
+
+
+EXCEL_EPOCH = pd.Timestamp(1899, 12, 30)
+MONTH_DAY_PATTERN = re.compile(r'^(\d{1,2})月(\d{1,2})日$')
+# 未指定进程数时，各地区月汇总的总行数达到该值才使用进程池计算利润明细
+PARALLEL_MIN_ROWS = 5000
+
+
+def parse_dates(values, year=None, label='日期', log=print):
+    """
+    一次转换整列日期
+
+    支持Excel日期序号、'3月13日' 格式的中文日期、日期对象以及 '2025-03-13' 等日期字符串。
+
+    :param values: 日期列
+    :param year: 中文日期所属的年份，默认为当前年份
+    :param label: 报告无法识别的日期时使用的名称
+    :param log: 输出处理信息的函数，无法识别的日期汇总后输出一次
+    :return: datetime64列，无法识别的值为NaT，索引与values相同
+    """
+    values = pd.Series(values, dtype=object)
+    year = year or datetime.now().year
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+
+    kinds = values.map(type)
+    is_number = kinds.isin([int, float, np.int64, np.float64]) & values.notna()
+    if is_number.any():
+        days = pd.to_numeric(values[is_number])
+        result[is_number] = EXCEL_EPOCH + pd.to_timedelta(days, unit='D')
+
+    is_text = kinds == str
+    if is_text.any():
+        text = values[is_text].str.replace(' ', '', regex=False).str.strip()
+        parts = text.str.extract(MONTH_DAY_PATTERN)
+        is_month_day = parts[0].notna()
+        if is_month_day.any():
+            result[parts.index[is_month_day]] = pd.to_datetime(
+                pd.DataFrame({'year': year, 'month': parts.loc[is_month_day, 0].astype(int),
+                              'day': parts.loc[is_month_day, 1].astype(int)}), errors='coerce')
+        other_text = text[~is_month_day]
+        if len(other_text):
+            result[other_text.index] = pd.to_datetime(other_text, errors='coerce', format='mixed')
+
+    # 日期对象等其他类型
+    is_other = ~is_number & ~is_text & values.notna()
+    if is_other.any():
+        result[is_other] = pd.to_datetime(values[is_other], errors='coerce')
+
+    invalid = result.isna() & values.notna()
+    if invalid.any():
+        samples = ', '.join(str(value) for value in values[invalid].unique()[:5])
+        log(f"{label}中有 {invalid.sum()} 个值无法识别为日期，已置为空: {samples}")
+    return result
 
 
 def format_date_as_month_day(date_val):
@@ -63,6 +99,40 @@ def calculate_supplement_insurance(employer_insurance):
         return 0
 
 
+def _round_like_builtin(values, ndigits=2):
+    """
+    与内置round(x, ndigits)结果相同的向量化取整
+
+    np.round先乘以10**ndigits再取整，乘法的误差会改变恰好落在半分附近的值的结果（例如1.115），
+    这些值逐个用内置round计算，其余的值与np.round相同
+    """
+    values = pd.Series(values, dtype=float)
+    scale = 10.0 ** ndigits
+    scaled = values.to_numpy() * scale
+    result = np.round(values.to_numpy(), ndigits)
+    distance = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5)
+    near_tie = np.isfinite(scaled) & (distance <= 4 * np.spacing(np.abs(scaled)) + 1e-9)
+    if near_tie.any():
+        result[near_tie] = [round(float(value), ndigits) for value in values.to_numpy()[near_tie]]
+    return pd.Series(result, index=values.index)
+
+
+def calculate_tax_vectorized(service_fee, salary):
+    """calculate_tax的向量化版本，空值或无法转换为数字的值对应税金为0"""
+    service_fee = pd.to_numeric(pd.Series(service_fee), errors='coerce')
+    salary = pd.to_numeric(pd.Series(salary), errors='coerce').set_axis(service_fee.index)
+    part1 = (service_fee - salary * 1.0442) / (1 + 0.06) * 0.06 * 0.6725
+    part2 = salary * 0.0442
+    tax = -_round_like_builtin(part1 + part2, 2)
+    return tax.where(service_fee.notna() & salary.notna(), 0.0)
+
+
+def calculate_supplement_insurance_vectorized(employer_insurance):
+    """calculate_supplement_insurance的向量化版本，空值或无法转换为数字的值对应补充险为0"""
+    employer_insurance = pd.to_numeric(pd.Series(employer_insurance), errors='coerce')
+    return (-_round_like_builtin(employer_insurance / 2.9 * 1.1, 2)).fillna(0.0)
+
+
 def get_month_range(date_series):
     """获取日期所在月份的第一天和最后一天"""
     if date_series.empty:
@@ -72,67 +142,299 @@ def get_month_range(date_series):
     return first_date.replace(day=1), first_date.replace(day=last_day)
 
 
-def apply_excel_styling(workbook, sheet_name, title):
-    """应用全面的Excel样式"""
-    sheet = workbook[sheet_name]
-
-    # 设置标题行
-    sheet.insert_rows(1)
-    sheet.merge_cells(f'A1:{openpyxl.utils.get_column_letter(len(sheet[1]))}{1}')
-    title_cell = sheet.cell(row=1, column=1, value=title)
-
-    # 标题样式
-    title_cell.font = Font(name='微软雅黑', size=14, bold=True)
-    title_cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 公共样式定义
-    common_font = Font(name='微软雅黑', size=10)
-    header_font = Font(name='微软雅黑', size=10, bold=True)
+def register_profit_styles(workbook):
+    """在工作簿中注册利润明细使用的命名样式，所有单元格共享这些样式"""
     border = Border(
         left=Side(style='thin'),
         right=Side(style='thin'),
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
+    center = Alignment(horizontal='center', vertical='center')
+    styles = [
+        NamedStyle(name='profit_title', font=Font(name='微软雅黑', size=14, bold=True), alignment=center),
+        NamedStyle(name='profit_header', font=Font(name='微软雅黑', size=10, bold=True), alignment=center,
+                   border=border),
+        NamedStyle(name='profit_body', font=Font(name='微软雅黑', size=10), alignment=center, border=border),
+    ]
+    for style in styles:
+        if style.name not in workbook.named_styles:
+            workbook.add_named_style(style)
+
+
+def compute_column_widths(df, title):
+    """根据DataFrame的内容计算列宽，标题位于第一列，计入第一列的宽度"""
+    widths = []
+    for col_idx, column in enumerate(df.columns):
+        values = df[column]
+        lengths = values.where(values.notna(), '').astype(str).str.len()
+        max_length = max(len(str(column)), int(lengths.max()) if len(lengths) else 0)
+        if col_idx == 0:
+            max_length = max(max_length, len(title))
+        # 根据内容调整列宽，确保最小宽度和最大宽度
+        widths.append(max(min((max_length + 2) * 1.2, 50), 10))
+    return widths
 
-    # 样式应用到所有行
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=2, max_row=sheet.max_row), start=2):
-        for col_idx, cell in enumerate(row, start=1):
-            # 字体
-            cell.font = header_font if row_idx == 2 else common_font
 
-            # 对齐
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+def write_styled_sheet(writer, sheet_name, df, title):
+    """
+    写入一个带标题行和样式的工作表，样式在写入时一次性设置，无需重新打开文件
 
-            # 边框
-            cell.border = border
+    :param writer: openpyxl引擎的pd.ExcelWriter
+    """
+    df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1)
+    sheet = writer.sheets[sheet_name]
+    column_count = len(df.columns)
 
-    # 调整列宽
-    for col_idx, col in enumerate(sheet.columns, 1):
-        max_length = 0
-        column_letter = openpyxl.utils.get_column_letter(col_idx)
-
-        for cell in col:
-            try:
-                cell_length = len(str(cell.value)) if cell.value is not None else 0
-                if cell_length > max_length:
-                    max_length = cell_length
-            except:
-                pass
+    # 设置标题行
+    sheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=column_count)
+    title_cell = sheet.cell(row=1, column=1, value=title)
+    title_cell.style = 'profit_title'
 
-        # 根据内容调整列宽，确保最小宽度和最大宽度
-        adjusted_width = max(min((max_length + 2) * 1.2, 50), 10)
-        sheet.column_dimensions[column_letter].width = adjusted_width
+    # 表头和数据行使用共享的命名样式
+    for row in sheet.iter_rows(min_row=2, max_row=len(df) + 2, max_col=column_count):
+        style = 'profit_header' if row[0].row == 2 else 'profit_body'
+        for cell in row:
+            cell.style = style
 
+    # 调整列宽
+    for col_idx, width in enumerate(compute_column_widths(df, title), 1):
+        sheet.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = width
+
+
+def prepare_salary_df(salary_df, year=None, log=print):
+    """转换工资数据的日期列，并将工资数据全部取负"""
+    salary_df = salary_df.copy()
+    salary_df['日期'] = parse_dates(salary_df['日期'], year, '计提工资日期', log)
+    salary_df.iloc[:, 1:] = -salary_df.iloc[:, 1:]  # 工资数据全部取负
+    return salary_df
+
+
+def load_delivery_df(file3_path, year=None, log=print):
+    """读取配送单量数据"""
+    session = workbookSession.open_session(file3_path)
+    if '配送单量' not in workbookSession.sheet_names(session):
+        raise ValueError(f"配送单量文件中缺少'配送单量'sheet")
+    delivery_df = workbookSession.read_sheet(session, '配送单量', header=1)
+    delivery_df['日期'] = parse_dates(delivery_df['日期'], year, '配送单量日期', log)
+    return delivery_df
+
+
+def load_expense_data(file4_path, log=print, year=None):
+    """
+    读取费用明细文件
+
+    :return: (地区到日均摊销金额的映射(取负值), 当日费用支出数据)
+    """
+    # 读取摊提费用数据（第二行是列名）
+    log("读取摊提费用数据...")
+    session = workbookSession.open_session(file4_path)
+    expense_sheets = workbookSession.sheet_names(session)
+    if '摊提费用明细' not in expense_sheets:
+        raise ValueError(f"费用文件中缺少'摊提费用明细'sheet")
+    amortization_df = workbookSession.read_sheet(session, '摊提费用明细', header=1)
+
+    # 查找"日均摊销金额"行
+    daily_amort_row = amortization_df[amortization_df.iloc[:, 0].str.contains('日均摊销金额', na=False)]
+    if daily_amort_row.empty:
+        raise ValueError("摊提费用明细中未找到'日均摊销金额'行")
+
+    # 创建地区到数值的映射字典（取负值）
+    amort_dict = {}
+    for col in daily_amort_row.columns[1:]:
+        region = str(col).strip()
+        value = daily_amort_row[col].values[0]
+        if not pd.isna(value):
+            amort_dict[region] = -float(value)
+
+    # 读取当日费用支出数据（第二行为列名）
+    log("读取当日费用支出数据...")
+    if '当日费用支出' not in expense_sheets:
+        raise ValueError(f"费用文件中缺少'当日费用支出'sheet")
+    daily_expense_df = workbookSession.read_sheet(session, '当日费用支出', header=1)
+    daily_expense_df['日期'] = parse_dates(daily_expense_df['日期'], year, '当日费用支出日期', log)
+    return amort_dict, daily_expense_df
+
+
+def build_region_sheet(sheet, df, salary_df, delivery_df, amort_dict, daily_expense_df, log=print, year=None):
+    """
+    生成单个地区的利润明细
+
+    :param sheet: 地区名称
+    :param df: 该地区的月汇总数据
+    :param year: 月汇总中 'x月x日' 日期所属的年份，默认为当前年份
+    :return: 利润明细DataFrame，缺少日期列时返回None
+    """
+    if '日期' not in df.columns:
+        log(f"跳过 {sheet} - 缺少日期列")
+        return None
+
+    # 过滤汇总行
+    df = df[~df['日期'].astype(str).str.contains('合计|本月累计', na=False)]
+
+    new_df = pd.DataFrame()
+    new_df['日期'] = parse_dates(df['日期'], year, f"{sheet}日期", log)
+
+    # 服务费回款（保持正值）
+    if '合计' in df.columns:
+        new_df['服务费回款'] = df['合计']
+    elif '服务费回款' in df.columns:
+        new_df['服务费回款'] = df['服务费回款']
+    else:
+        new_df['服务费回款'] = 0
+
+    # 添加补充险（从雇主险计算）
+    if '雇主险(元)' in df.columns:
+        new_df['补充险'] = calculate_supplement_insurance_vectorized(df['雇主险(元)'])
+    else:
+        new_df['补充险'] = 0
+        log(f"警告: {sheet} 无雇主险数据")
+
+    # 合并工资数据（已经是负值）
+    if sheet in salary_df.columns:
+        temp_salary = salary_df[['日期', sheet]].rename(columns={sheet: '计提工资'})
+        new_df = pd.merge(new_df, temp_salary, on='日期', how='left')
+    else:
+        new_df['计提工资'] = 0
+        log(f"警告: {sheet} 无工资数据")
+
+    # 合并配送单量（保持原值）
+    if sheet in delivery_df.columns:
+        temp_delivery = delivery_df[['日期', sheet]].rename(columns={sheet: '单量'})
+        new_df = pd.merge(new_df, temp_delivery, on='日期', how='left')
+    else:
+        new_df['单量'] = None
+
+    # 计算税金（函数内已取负）
+    new_df['税金'] = calculate_tax_vectorized(new_df['服务费回款'],
+                                            pd.to_numeric(new_df['计提工资'], errors='coerce').abs())
+
+    # 添加摊提费用（已经是负值）
+    sheet_clean = sheet.strip()
+    new_df['摊提费用'] = amort_dict.get(sheet_clean, 0.0)
+    if sheet_clean not in amort_dict:
+        log(f"警告: {sheet} 无摊提费用数据")
+
+    # 添加当日费用支出（改名为本日费用）
+    if sheet in daily_expense_df.columns:
+        temp_expense = daily_expense_df[['日期', sheet]].rename(columns={sheet: '本日费用'})
+        temp_expense['本日费用'] = temp_expense['本日费用'].fillna(0)
+        new_df = pd.merge(new_df, temp_expense, on='日期', how='left')
+    else:
+        new_df['本日费用'] = 0
+        log(f"警告: {sheet} 无当日费用数据")
+
+    # 添加空列
+    new_df['备注'] = ''
+    new_df['当日代补'] = ''
+    new_df['单均回款'] = ''
+
+    # 计算当日利润
+    new_df['当日利润'] = new_df[
+        ['服务费回款', '补充险', '计提工资', '单量', '税金', '摊提费用', '本日费用']].sum(
+        axis=1)
+
+    # 计算单均回款
+    delivery_count = pd.to_numeric(new_df['单量'], errors='coerce')
+    new_df['单均回款'] = (new_df['服务费回款'] / delivery_count.where(delivery_count != 0)).where(delivery_count != 0, 0)
+
+    # 补全当月日期
+    month_start, month_end = get_month_range(new_df['日期'])
+    if month_start and month_end:
+        full_dates = pd.date_range(month_start, month_end, name='日期')
+        new_df = new_df.set_index('日期').reindex(full_dates).reset_index()
+        new_df['日期'] = new_df['日期'].apply(format_date_as_month_day)
+
+    # 添加合计行
+    sum_row = pd.DataFrame({
+        '日期': ['合计'],
+        '服务费回款': [new_df['服务费回款'].sum()],
+        '单量': [new_df['单量'].sum()],
+        '税金': [new_df['税金'].sum()],
+        '计提工资': [new_df['计提工资'].sum()],
+        '摊提费用': [new_df['摊提费用'].sum()],
+        '补充险': [new_df['补充险'].sum()],
+        '本日费用': [new_df['本日费用'].sum()],
+        '当日利润': [new_df['当日利润'].sum()],
+        '备注': [''],
+        '当日代补': [''],
+        '单均回款': ['']
+    })
+    new_df = pd.concat([new_df, sum_row], ignore_index=True)
+
+    # 调整列顺序
+    column_order = ['日期', '服务费回款', '单量', '税金', '计提工资', '摊提费用',
+                    '补充险', '本日费用', '当日利润', '备注', '当日代补', '单均回款']
+    return new_df[column_order]
+
+
+def _build_region_job(job):
+    """进程池任务：生成一个地区的利润明细，处理信息随结果一起返回"""
+    sheet, df, salary_df, delivery_df, amort_dict, daily_expense_df, year = job
+    messages = [f"处理 {sheet} 地区..."]
+    new_df = build_region_sheet(sheet, df, salary_df, delivery_df, amort_dict, daily_expense_df, messages.append,
+                                year)
+    return sheet, new_df, messages
+
+
+def build_profit_sheets(region_frames, salary_df, delivery_df, amort_dict, daily_expense_df, log=print,
+                        workers=None, year=None, progress=None):
+    """
+    生成所有地区的利润明细
+
+    每个地区的月汇总只有约31行，默认在当前进程中依次计算：启动进程池（Windows和打包后的程序使用spawn）
+    并传递数据的开销比计算本身更大。指定workers大于1，或各地区的总行数达到PARALLEL_MIN_ROWS时才使用进程池。
+
+    :param region_frames: {地区: 月汇总数据}
+    :param workers: 进程数，为1时在当前进程中依次计算；默认在总行数达到PARALLEL_MIN_ROWS时为CPU核数与地区数中的较小值，
+                    否则为1
+    :param year: 月汇总中 'x月x日' 日期所属的年份，默认为当前年份
+    :param progress: 每完成一个地区调用一次 progress(已完成的地区数, 地区总数, '计算地区利润')
+    :return: {地区: 利润明细}，顺序与region_frames一致
+    """
+    jobs = [(sheet, df, salary_df, delivery_df, amort_dict, daily_expense_df, year)
+            for sheet, df in region_frames.items()]
+    if not workers:
+        rows = sum(len(df) for df in region_frames.values())
+        workers = min(len(jobs), os.cpu_count() or 1) if rows >= PARALLEL_MIN_ROWS else 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    results = executor.map(_build_region_job, jobs) if executor else map(_build_region_job, jobs)
+
+    # 按region_frames的顺序整理结果和处理信息
+    sheets = {}
+    try:
+        for done, (sheet, new_df, messages) in enumerate(results, 1):
+            for message in messages:
+                log(message)
+            if new_df is not None:
+                sheets[sheet] = new_df
+            if progress:
+                progress(done, len(jobs), '计算地区利润')
+    finally:
+        if executor:
+            # 取消任务时尚未开始的地区不再计算
+            executor.shutdown(wait=True, cancel_futures=True)
+    return sheets
+
+
+def write_profit_workbook(output_path, sheets, year, month, log=print):
+    """写入利润明细，写入时同时应用Excel样式"""
+    log("写入利润明细并应用Excel样式...")
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        register_profit_styles(writer.book)
+        for sheet_name, new_df in sheets.items():
+            # 创建标题（例如：高碑店2025年3月利润明细）
+            title = f"{sheet_name}{year}年{month}月利润明细"
+            write_styled_sheet(writer, sheet_name, new_df, title)
+            count('cells_written', (len(new_df) + 2) * len(new_df.columns))
 
-def process_files(text_widget):
-    root = tk.Tk()
-    root.withdraw()
 
-    def append_text(message):
-        text_widget.insert('end', message + '\n')
-        text_widget.see('end')
+def ask_inputs(log=print):
+    """
+    输入年份、月份并选择四个输入文件，需要在主线程中调用
 
+    :return: 输入参数字典，取消选择时返回None
+    """
     # 选择年份和月份
     current_year = datetime.now().year
     current_month = datetime.now().month
@@ -141,219 +443,101 @@ def process_files(text_widget):
 
     if not year or not month:
         messagebox.showerror("错误", "年份和月份不能为空")
-        return
+        return None
 
     # 文件选择
-    append_text("请选择包含地区sheet的Excel文件")
+    log("请选择包含地区sheet的Excel文件")
     file1_path = filedialog.askopenfilename(title="选择地区数据文件", filetypes=[("Excel文件", "*.xlsx *.xls")])
     if not file1_path:
-        return
+        return None
 
-    append_text("请选择计提工资Excel文件")
+    log("请选择计提工资Excel文件")
     file2_path = filedialog.askopenfilename(title="选择计提工资文件", filetypes=[("Excel文件", "*.xlsx *.xls")])
     if not file2_path:
-        return
+        return None
 
-    append_text("请选择配送单量Excel文件")
+    log("请选择配送单量Excel文件")
     file3_path = filedialog.askopenfilename(title="选择配送单量文件", filetypes=[("Excel文件", "*.xlsx *.xls")])
     if not file3_path:
-        return
+        return None
 
-    append_text("请选择费用明细Excel文件")
+    log("请选择费用明细Excel文件")
     file4_path = filedialog.askopenfilename(title="选择费用明细文件", filetypes=[("Excel文件", "*.xlsx *.xls")])
     if not file4_path:
-        return
+        return None
 
-    try:
-        append_text("开始读取基础数据...")
-        # 读取基础数据
-        xls = pd.ExcelFile(file1_path)
-        sheet_names = xls.sheet_names
-
-        # 读取工资数据
-        append_text("读取工资数据...")
-        salary_df = pd.read_excel(file2_path, sheet_name=0)
-        salary_df['日期'] = salary_df['日期'].apply(convert_excel_date)
-        salary_df.iloc[:, 1:] = -salary_df.iloc[:, 1:]  # 工资数据全部取负
-
-        # 读取配送单量数据
-        append_text("读取配送单量数据...")
-        delivery_sheets = pd.ExcelFile(file3_path).sheet_names
-        if '配送单量' not in delivery_sheets:
-            raise ValueError(f"配送单量文件中缺少'配送单量'sheet")
-        delivery_df = pd.read_excel(file3_path, sheet_name='配送单量', header=1)
-        delivery_df['日期'] = delivery_df['日期'].apply(convert_excel_date)
-
-        # 读取摊提费用数据（第二行是列名）
-        append_text("读取摊提费用数据...")
-        expense_sheets = pd.ExcelFile(file4_path).sheet_names
-        if '摊提费用明细' not in expense_sheets:
-            raise ValueError(f"费用文件中缺少'摊提费用明细'sheet")
-        amortization_df = pd.read_excel(file4_path, sheet_name='摊提费用明细', header=1)
-
-        # 查找"日均摊销金额"行
-        daily_amort_row = amortization_df[amortization_df.iloc[:, 0].str.contains('日均摊销金额', na=False)]
-        if daily_amort_row.empty:
-            raise ValueError("摊提费用明细中未找到'日均摊销金额'行")
-
-        # 创建地区到数值的映射字典（取负值）
-        amort_dict = {}
-        for col in daily_amort_row.columns[1:]:
-            region = str(col).strip()
-            value = daily_amort_row[col].values[0]
-            if not pd.isna(value):
-                amort_dict[region] = -float(value)
-
-        # 读取当日费用支出数据（第二行为列名）
-        append_text("读取当日费用支出数据...")
-        if '当日费用支出' not in expense_sheets:
-            raise ValueError(f"费用文件中缺少'当日费用支出'sheet")
-        daily_expense_df = pd.read_excel(file4_path, sheet_name='当日费用支出', header=1)
-        daily_expense_df['日期'] = daily_expense_df['日期'].apply(convert_excel_date)
+    return {'year': year, 'month': month, 'file1_path': file1_path, 'file2_path': file2_path,
+            'file3_path': file3_path, 'file4_path': file4_path}
 
-        # 准备输出文件
-        output_path = os.path.splitext(file1_path)[0] + f"_{year}年{month}月_processed.xlsx"
-        writer = pd.ExcelWriter(output_path, engine='openpyxl')
-
-        # 处理每个地区sheet
-        append_text("开始处理每个地区sheet...")
-        for sheet in sheet_names:
-            append_text(f"处理 {sheet} 地区...")
-            df = pd.read_excel(file1_path, sheet_name=sheet)
-            if '日期' not in df.columns:
-                append_text(f"跳过 {sheet} - 缺少日期列")
-                continue
-
-            # 过滤汇总行
-            df = df[~df['日期'].astype(str).str.contains('合计|本月累计', na=False)]
-
-            new_df = pd.DataFrame()
-            new_df['日期'] = df['日期'].apply(convert_excel_date)
-
-            # 服务费回款（保持正值）
-            if '合计' in df.columns:
-                new_df['服务费回款'] = df['合计']
-            elif '服务费回款' in df.columns:
-                new_df['服务费回款'] = df['服务费回款']
-            else:
-                new_df['服务费回款'] = 0
-
-            # 添加补充险（从雇主险计算）
-            if '雇主险(元)' in df.columns:
-                new_df['补充险'] = df['雇主险(元)'].apply(calculate_supplement_insurance)
-            else:
-                new_df['补充险'] = 0
-                append_text(f"警告: {sheet} 无雇主险数据")
-
-            # 合并工资数据（已经是负值）
-            if sheet in salary_df.columns:
-                temp_salary = salary_df[['日期', sheet]].rename(columns={sheet: '计提工资'})
-                new_df = pd.merge(new_df, temp_salary, on='日期', how='left')
-            else:
-                new_df['计提工资'] = 0
-                append_text(f"警告: {sheet} 无工资数据")
-
-            # 合并配送单量（保持原值）
-            if sheet in delivery_df.columns:
-                temp_delivery = delivery_df[['日期', sheet]].rename(columns={sheet: '单量'})
-                new_df = pd.merge(new_df, temp_delivery, on='日期', how='left')
-            else:
-                new_df['单量'] = None
-
-            # 计算税金（函数内已取负）
-            new_df['税金'] = new_df.apply(
-                lambda row: calculate_tax(row['服务费回款'], abs(row['计提工资'])), axis=1)
-
-            # 添加摊提费用（已经是负值）
-            sheet_clean = sheet.strip()
-            new_df['摊提费用'] = amort_dict.get(sheet_clean, 0.0)
-            if sheet_clean not in amort_dict:
-                append_text(f"警告: {sheet} 无摊提费用数据")
-
-            # 添加当日费用支出（改名为本日费用）
-            if sheet in daily_expense_df.columns:
-                temp_expense = daily_expense_df[['日期', sheet]].rename(columns={sheet: '本日费用'})
-                temp_expense['本日费用'] = temp_expense['本日费用'].fillna(0)
-                new_df = pd.merge(new_df, temp_expense, on='日期', how='left')
-            else:
-                new_df['本日费用'] = 0
-                append_text(f"警告: {sheet} 无当日费用数据")
-
-            # 添加空列
-            new_df['备注'] = ''
-            new_df['当日代补'] = ''
-            new_df['单均回款'] = ''
-
-            # 计算当日利润
-            new_df['当日利润'] = new_df[
-                ['服务费回款', '补充险', '计提工资', '单量', '税金', '摊提费用', '本日费用']].sum(
-                axis=1)
-
-            # 计算单均回款
-            new_df['单均回款'] = new_df.apply(lambda row: row['服务费回款'] / row['单量'] if row['单量'] != 0 else 0, axis=1)
-
-            # 补全当月日期
-            month_start, month_end = get_month_range(new_df['日期'])
-            if month_start and month_end:
-                full_dates = pd.date_range(month_start, month_end, name='日期')
-                new_df = new_df.set_index('日期').reindex(full_dates).reset_index()
-                new_df['日期'] = new_df['日期'].apply(format_date_as_month_day)
-
-            # 添加合计行
-            sum_row = pd.DataFrame({
-                '日期': ['合计'],
-                '服务费回款': [new_df['服务费回款'].sum()],
-                '单量': [new_df['单量'].sum()],
-                '税金': [new_df['税金'].sum()],
-                '计提工资': [new_df['计提工资'].sum()],
-                '摊提费用': [new_df['摊提费用'].sum()],
-                '补充险': [new_df['补充险'].sum()],
-                '本日费用': [new_df['本日费用'].sum()],
-                '当日利润': [new_df['当日利润'].sum()],
-                '备注': [''],
-                '当日代补': [''],
-                '单均回款': ['']
-            })
-            new_df = pd.concat([new_df, sum_row], ignore_index=True)
-
-            # 调整列顺序
-            column_order = ['日期', '服务费回款', '单量', '税金', '计提工资', '摊提费用',
-                            '补充险', '本日费用', '当日利润', '备注', '当日代补', '单均回款']
-            new_df = new_df[column_order]
-
-            # 写入sheet
-            new_df.to_excel(writer, sheet_name=sheet, index=False)
-
-        writer.close()
-
-        # 使用openpyxl打开并应用样式
-        append_text("应用Excel样式...")
-        workbook = openpyxl.load_workbook(output_path)
-
-        for sheet_name in sheet_names:
-            # 创建标题（例如：高碑店2025年3月利润明细）
-            title = f"{sheet_name}{year}年{month}月利润明细"
-            apply_excel_styling(workbook, sheet_name, title)
 
-        # 保存工作簿
-        workbook.save(output_path)
+def run_stage(inputs, log=print, progress=None):
+    """
+    生成各地区的利润明细，可在后台线程中执行
 
-        append_text(f"处理完成，结果已保存至:\n{output_path}")
-        messagebox.showinfo("完成", f"处理完成，结果已保存至:\n{output_path}")
+    :param inputs: ask_inputs返回的输入参数
+    :param progress: 报告进度的函数 progress(已完成, 总数, 说明)
+    :return: 输出文件路径
+    """
+    progress = progress or (lambda done, total=None, label=None: None)
+    year, month = inputs['year'], inputs['month']
+    file1_path, file2_path = inputs['file1_path'], inputs['file2_path']
+    file3_path, file4_path = inputs['file3_path'], inputs['file4_path']
 
-    except Exception as e:
-        append_text(f"处理失败:\n{str(e)}")
-        messagebox.showerror("错误", f"处理失败:\n{str(e)}")
+    try:
+        # 准备输出文件
+        output_path = os.path.splitext(file1_path)[0] + f"_{year}年{month}月_processed.xlsx"
+
+        with profiled_run('Statistics', os.path.dirname(output_path)) as run:
+            with span('读取文件'):
+                log("开始读取基础数据...")
+                progress(0, 4, '读取文件')
+                # 读取基础数据
+                region_frames = workbookSession.read_sheets(workbookSession.open_session(file1_path))
+
+                # 读取工资数据
+                log("读取工资数据...")
+                progress(1, 4, '读取文件')
+                salary_df = prepare_salary_df(workbookSession.read_sheet(workbookSession.open_session(file2_path)),
+                                              year, log)
+
+                # 读取配送单量数据
+                log("读取配送单量数据...")
+                progress(2, 4, '读取文件')
+                delivery_df = load_delivery_df(file3_path, year, log)
+
+                progress(3, 4, '读取文件')
+                amort_dict, daily_expense_df = load_expense_data(file4_path, log, year)
+                progress(4, 4, '读取文件')
+
+            # 处理每个地区sheet
+            log("开始处理每个地区sheet...")
+            with span('计算地区利润'):
+                sheets = build_profit_sheets(region_frames, salary_df, delivery_df, amort_dict, daily_expense_df,
+                                             log, year=year, progress=progress)
+            progress(None, None, '写出文件')
+            with span('写出文件'):
+                write_profit_workbook(output_path, sheets, year, month, log)
+
+        log(f"处理完成，结果已保存至:\n{output_path}")
+        log(format_report(run))
+        return output_path
+
+    finally:
+        workbookSession.close_sessions()
 
 
 def main():
+    # 处理在后台线程中执行，窗口保持响应
     root = tk.Tk()
     root.title("文件处理程序")
-
-    text_widget = tk.Text(root, height=20, width=80)
-    text_widget.pack()
-
-    process_files(text_widget)
+    panel = backgroundTask.create_panel(root)
+
+    inputs = ask_inputs(panel['log'])
+    if inputs:
+        backgroundTask.start_task(
+            panel, lambda task: run_stage(inputs, task['log'], task['progress']),
+            on_done=lambda output_path: messagebox.showinfo("完成", f"处理完成，结果已保存至:\n{output_path}"),
+            on_error=lambda e: messagebox.showerror("错误", f"处理失败:\n{str(e)}"))
 
     root.mainloop()
 
@@ -0,0 +1,181 @@
+"""
+Tk界面的后台任务
+
+读取、计算和写出Excel都在后台线程中执行，主线程只负责界面，窗口在处理过程中保持响应。
+后台线程不直接操作Tk组件：处理信息和进度放入线程安全的队列，由主线程用 root.after 定时取出并显示。
+
+用法：
+    panel = create_panel(root)
+    start_task(panel, lambda task: run_stage(inputs, task['log'], task['progress']))
+
+后台函数通过 task['log'](信息) 输出处理信息，通过 task['progress'](已完成, 总数, 说明) 报告进度。
+点击“取消”后，下一次调用 log 或 progress 时抛出 TaskCancelled，任务在该处停止（协作式取消，
+正在读取或写出的单个文件会先完成）。文件选择等对话框仍需在主线程中、启动任务之前完成。
+"""
+import queue
+import threading
+import traceback
+import tkinter as tk
+from tkinter import messagebox, ttk
+
+POLL_INTERVAL = 100  # 检查队列的间隔（毫秒）
+
+
+class TaskCancelled(Exception):
+    """用户取消了正在执行的任务"""
+
+
+def create_panel(root, height=20, width=80):
+    """
+    创建处理信息文本框、进度条、进度说明和取消按钮
+
+    :return: 面板字典，log 为在主线程中追加处理信息的函数，controls 为任务执行期间需要禁用的按钮
+    """
+    text_widget = tk.Text(root, height=height, width=width)
+    text_widget.pack()
+    progress_bar = ttk.Progressbar(root, maximum=100, mode='determinate', length=400)
+    progress_bar.pack(pady=5)
+    status_label = tk.Label(root, text="")
+    status_label.pack()
+    cancel_button = tk.Button(root, text="取消", state=tk.DISABLED)
+    cancel_button.pack(pady=5)
+
+    def log(message):
+        text_widget.insert(tk.END, str(message) + "\n")
+        text_widget.see(tk.END)
+
+    panel = {
+        'root': root,
+        'text': text_widget,
+        'progress_bar': progress_bar,
+        'status_label': status_label,
+        'cancel_button': cancel_button,
+        'log': log,
+        'controls': [],
+        'task': None,
+    }
+    cancel_button.config(command=lambda: cancel_task(panel))
+    return panel
+
+
+def _show_progress(panel, done, total, label):
+    """total为None时表示无法计算进度的步骤，进度条来回滚动"""
+    bar = panel['progress_bar']
+    if total is None:
+        if str(bar.cget('mode')) != 'indeterminate':
+            bar.config(mode='indeterminate')
+            bar.start(POLL_INTERVAL)
+        text = label or ""
+    else:
+        bar.stop()
+        bar.config(mode='determinate', value=min(100.0, done * 100.0 / total) if total else 0)
+        text = f"{label} {done}/{total}" if label and total else (label or "")
+    panel['status_label'].config(text=text)
+
+
+def _set_running(panel, running):
+    state = tk.DISABLED if running else tk.NORMAL
+    for widget in panel['controls']:
+        widget.config(state=state)
+    panel['cancel_button'].config(state=tk.NORMAL if running else tk.DISABLED)
+
+
+def start_task(panel, work, on_done=None, on_error=None, on_cancel=None):
+    """
+    在后台线程中执行 work(task)
+
+    :param work: 后台函数，参数为任务字典（log、progress、check_cancelled），返回值传给on_done
+    :param on_done: 完成后在主线程中调用 on_done(返回值)
+    :param on_error: 出错后在主线程中调用 on_error(异常)，默认弹出错误提示
+    :param on_cancel: 取消后在主线程中调用 on_cancel()
+    :return: 任务字典
+    """
+    if panel['task'] is not None:
+        raise RuntimeError("已有任务正在执行")
+
+    events = queue.Queue()
+    cancel_event = threading.Event()
+
+    def check_cancelled():
+        if cancel_event.is_set():
+            raise TaskCancelled("任务已取消")
+
+    def log(message):
+        check_cancelled()
+        events.put(('log', str(message)))
+
+    def progress(done, total=None, label=None):
+        check_cancelled()
+        events.put(('progress', done, total, label))
+
+    task = {
+        'log': log,
+        'progress': progress,
+        'check_cancelled': check_cancelled,
+        'cancel_event': cancel_event,
+    }
+
+    def runner():
+        try:
+            result = work(task)
+        except TaskCancelled:
+            events.put(('cancelled',))
+        except Exception as e:
+            events.put(('error', e, traceback.format_exc()))
+        else:
+            events.put(('done', result))
+
+    def finish():
+        panel['task'] = None
+        _set_running(panel, False)
+
+    def poll():
+        # 每次把队列中已有的信息全部取出，信息很多时界面也只刷新一次
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == 'log':
+                panel['log'](event[1])
+            elif kind == 'progress':
+                _show_progress(panel, *event[1:])
+            elif kind == 'done':
+                finish()
+                _show_progress(panel, 1, 1, "完成")
+                if on_done:
+                    on_done(event[1])
+                return
+            elif kind == 'cancelled':
+                finish()
+                panel['log']("任务已取消")
+                _show_progress(panel, 0, 0, "已取消")
+                if on_cancel:
+                    on_cancel()
+                return
+            else:
+                finish()
+                panel['log'](event[2])
+                _show_progress(panel, 0, 0, "出错")
+                if on_error:
+                    on_error(event[1])
+                else:
+                    messagebox.showerror("错误", f"处理过程中发生错误: {event[1]}")
+                return
+        panel['root'].after(POLL_INTERVAL, poll)
+
+    panel['task'] = task
+    _set_running(panel, True)
+    _show_progress(panel, None, None, "处理中...")
+    threading.Thread(target=runner, daemon=True).start()
+    panel['root'].after(POLL_INTERVAL, poll)
+    return task
+
+
+def cancel_task(panel):
+    """请求取消正在执行的任务，任务在下一次输出信息或报告进度时停止"""
+    task = panel['task']
+    if task is not None and not task['cancel_event'].is_set():
+        task['cancel_event'].set()
+        panel['log']("正在取消，等待当前步骤完成...")
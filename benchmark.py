@@ -0,0 +1,345 @@
+"""
+性能基准测试：生成与真实输入结构相同的模拟数据，按不同规模分别计时各阶段
+
+生成的模拟数据：
+    乡镇商家明细       商家ID
+    海豚_合作商商家数据  商家ID、商家名称、外卖组织结构
+    日账单             商家ID、订单信息以及statisticDay.COLUMN_MAPPING中的全部费用列
+    总商薪资摊销        wagesCalculation.AREAS引用到的工作表和单元格，以及配送单量工作表
+    盈利模式分析表      摊提费用明细和当日费用支出工作表
+日账单的行数由 --rows 指定，商家数量默认为行数的十分之一，其余文件的大小与真实文件相近。
+
+每个规模的计时结果保存为 benchmark_<行数>_耗时报告_<时间>.json，所有规模的汇总表输出到控制台
+并保存为 benchmark_汇总.csv。
+
+用法：python benchmark.py --rows 10000 100000 1000000 --workdir 基准测试
+
+--startup 测量启动器的冷启动耗时：多次启动打包后的core.exe（或 python core.py），窗口显示后立即退出，
+记录从启动进程到窗口显示的总耗时和core.py内部的耗时，例如：
+    python benchmark.py --startup dist/core/core.exe
+"""
+import argparse
+import calendar
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import dataPreprocessing
+import statisticDay
+import wagesCalculation
+import Statistics
+import billSchema
+import workbookSession
+from excelWriter import write_frame
+from profiling import profiled_run, span
+
+DEFAULT_ROWS = [10000, 100000, 1000000]
+BILL_DAY = 13
+# 不在海豚数据中的商家所占比例，用于产生缺失组织结构的行
+UNKNOWN_MERCHANT_RATIO = 0.02
+TOWNSHIP_MERCHANT_RATIO = 0.05
+
+
+def generate_merchant_ids(count, rng):
+    """生成不重复的8位商家ID"""
+    return rng.choice(np.arange(10000000, 99999999), size=count, replace=False)
+
+
+def generate_merchant_base(merchant_ids, rng):
+    """生成海豚_合作商商家数据，少量商家的外卖组织结构为空"""
+    # 霸州三组由乡镇商家明细决定，海豚数据中不直接出现
+    orgs = np.array([org for org in statisticDay.ORGANIZATION_MAPPING if org != dataPreprocessing.TOWNSHIP_ORG],
+                    dtype=object)
+    org_values = orgs[rng.integers(0, len(orgs), size=len(merchant_ids))]
+    org_values[rng.random(len(merchant_ids)) < 0.01] = None
+    return pd.DataFrame({
+        dataPreprocessing.MERCHANT_ID_COL: merchant_ids,
+        '商家名称': [f"模拟商家{i}" for i in range(len(merchant_ids))],
+        dataPreprocessing.ORG_STRUCTURE_COL: org_values,
+    })
+
+
+def generate_township_merchants(merchant_ids, rng):
+    """从全部商家中随机选取一部分作为乡镇商家"""
+    count = max(1, int(len(merchant_ids) * TOWNSHIP_MERCHANT_RATIO))
+    return pd.DataFrame({dataPreprocessing.MERCHANT_ID_COL: rng.choice(merchant_ids, size=count, replace=False)})
+
+
+def generate_bill(rows, merchant_ids, rng):
+    """
+    生成日账单，每行一个订单
+
+    :param rows: 行数
+    :param merchant_ids: 海豚数据中的商家ID，少量订单使用不存在的商家ID
+    :return: DataFrame
+    """
+    bill_merchants = rng.choice(merchant_ids, size=rows)
+    unknown = rng.random(rows) < UNKNOWN_MERCHANT_RATIO
+    bill_merchants[unknown] = rng.integers(100000000, 199999999, size=unknown.sum())
+
+    df = pd.DataFrame({
+        dataPreprocessing.MERCHANT_ID_COL: bill_merchants,
+        '订单号': np.arange(rows, dtype=np.int64) + 6000000000000000000,
+        '订单状态': np.where(rng.random(rows) < 0.97, '已完成', '已取消'),
+    })
+    for column in statisticDay.COLUMN_MAPPING:
+        values = np.round(rng.normal(3, 2, size=rows), 2)
+        # 大多数费用列只有少数订单有值
+        values[rng.random(rows) < 0.7] = 0
+        df[column] = values
+    return df
+
+
+def generate_payroll_sheets(month, year, rng):
+    """
+    生成总商薪资摊销中被地区工资公式引用的工作表
+
+    :return: {工作表名称: 无表头的DataFrame}，每个引用单元格向下填充当月天数的数值
+    """
+    days = calendar.monthrange(year, month)[1]
+    plans = wagesCalculation.compile_areas(wagesCalculation.AREAS)
+    cells = {}
+    for plan in plans.values():
+        for sheet_name, col_index, base_row in plan:
+            cells.setdefault(sheet_name, []).append((col_index, base_row))
+
+    sheets = {}
+    for sheet_name, refs in cells.items():
+        grid = np.full((max(row for _, row in refs) + days, max(col for col, _ in refs) + 1), None, dtype=object)
+        grid[0, 0] = sheet_name
+        for col_index, base_row in refs:
+            grid[base_row:base_row + days, col_index] = np.round(rng.uniform(500, 5000, size=days), 2)
+        sheets[sheet_name] = pd.DataFrame(grid)
+    return sheets
+
+
+def _month_dates(month, year):
+    days = calendar.monthrange(year, month)[1]
+    return pd.date_range(datetime(year, month, 1), periods=days)
+
+
+def _titled_sheet(title, df):
+    """第一行为标题、第二行为列名的工作表（对应header=1读取）"""
+    rows = [[title] + [None] * (len(df.columns) - 1), list(df.columns)] + df.astype(object).values.tolist()
+    return pd.DataFrame(rows)
+
+
+def generate_delivery_sheet(month, year, rng):
+    """生成配送单量工作表，各区域每天的单量"""
+    dates = _month_dates(month, year)
+    df = pd.DataFrame({'日期': dates})
+    for area in statisticDay.ORGANIZATION_MAPPING.values():
+        df[area] = rng.integers(500, 5000, size=len(dates))
+    return _titled_sheet('配送单量', df)
+
+
+def generate_expense_sheets(month, year, rng):
+    """生成盈利模式分析表中的摊提费用明细和当日费用支出工作表"""
+    areas = list(statisticDay.ORGANIZATION_MAPPING.values())
+    amortization = pd.DataFrame(
+        [['房租'] + list(np.round(rng.uniform(1000, 9000, len(areas)), 2)),
+         ['车辆'] + list(np.round(rng.uniform(1000, 9000, len(areas)), 2)),
+         ['日均摊销金额'] + list(np.round(rng.uniform(100, 900, len(areas)), 2))],
+        columns=['项目'] + areas)
+
+    dates = _month_dates(month, year)
+    daily_expense = pd.DataFrame({'日期': dates})
+    for area in areas:
+        values = np.round(rng.uniform(0, 800, size=len(dates)), 2)
+        values[rng.random(len(dates)) < 0.3] = np.nan
+        daily_expense[area] = values
+    return {'摊提费用明细': _titled_sheet('摊提费用明细', amortization),
+            '当日费用支出': _titled_sheet('当日费用支出', daily_expense)}
+
+
+def _write_sheets(output_path, sheets):
+    """将多个无表头的DataFrame写入同一个工作簿"""
+    with pd.ExcelWriter(output_path) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, header=False, index=False)
+
+
+def generate_inputs(workdir, rows, month, year, merchants=None, seed=0):
+    """
+    生成一组模拟输入文件
+
+    :param rows: 日账单行数
+    :param merchants: 商家数量，默认为行数的十分之一
+    :return: {文件类型: 文件路径}
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(workdir, exist_ok=True)
+    merchant_ids = generate_merchant_ids(merchants or max(100, rows // 10), rng)
+
+    paths = {
+        'township_merchants': os.path.join(workdir, '乡镇商家明细.xlsx'),
+        'merchant_base': os.path.join(workdir, '海豚_合作商商家数据.xlsx'),
+        'bill': os.path.join(workdir, f'模拟账单-{year}-{month:02d}-{BILL_DAY:02d}-日账单【到家】.xlsx'),
+        'salary_workbook': os.path.join(workdir, '总商薪资摊销.xlsx'),
+        'expense_workbook': os.path.join(workdir, '盈利模式分析表.xlsx'),
+    }
+    write_frame((generate_township_merchants(merchant_ids, rng), paths['township_merchants']))
+    write_frame((generate_merchant_base(merchant_ids, rng), paths['merchant_base']))
+    write_frame((generate_bill(rows, merchant_ids, rng), paths['bill']))
+
+    payroll_sheets = generate_payroll_sheets(month, year, rng)
+    payroll_sheets['配送单量'] = generate_delivery_sheet(month, year, rng)
+    _write_sheets(paths['salary_workbook'], payroll_sheets)
+    _write_sheets(paths['expense_workbook'], generate_expense_sheets(month, year, rng))
+    return paths
+
+
+def run_stages(paths, output_folder, month, year, log=print):
+    """
+    依次执行各阶段，每个步骤单独计时，使用单独的缓存文件夹使读取时间为首次解析的时间
+
+    :return: 生成的利润明细文件路径
+    """
+    cache_dir = os.path.join(output_folder, 'cache')
+    month_text = str(month)
+
+    with span('test1'):
+        with span('读取'):
+            df1 = billSchema.read_bill(paths['township_merchants'], cache_dir,
+                                       columns=[dataPreprocessing.MERCHANT_ID_COL])
+            df2 = billSchema.read_bill(paths['merchant_base'], cache_dir)
+            df3 = billSchema.read_bill(paths['bill'], cache_dir)
+        with span('读取缓存'):
+            billSchema.read_bill(paths['bill'], cache_dir)
+        with span('添加组织结构'):
+            df2, df3, missing_ids = dataPreprocessing.tag_organizations(df1, df2, df3, log)
+        with span('写出分组文件'):
+            groups = dataPreprocessing.save_outputs(df2, df3, missing_ids, paths['merchant_base'], paths['bill'],
+                                                    output_folder, log, write_full_copy=False)
+
+    month_folder = statisticDay.create_monthly_folder(output_folder, month_text, year)
+    with span('test2'):
+        with span('汇总'):
+            summary_data = statisticDay.summarize_groups(groups, month_text, BILL_DAY, log)
+        with span('写出当日汇总'):
+            output_path = os.path.join(month_folder, f"{month}月{BILL_DAY}日外卖组织服务费汇总.xlsx")
+            statisticDay.write_daily_summary(output_path, summary_data, log)
+        with span('更新每月总表'):
+            monthly_df = statisticDay.update_monthly_summary_days(month_folder, month_text,
+                                                                  {BILL_DAY: summary_data}, year)
+            statisticDay.export_monthly_summary(month_folder, month_text, year)
+
+    with span('test3'):
+        wb = workbookSession.workbook(workbookSession.open_session(paths['salary_workbook']))
+        headers, rows = wagesCalculation.build_salary_summary(wb, month, BILL_DAY, year)
+        wagesCalculation.write_salary_summary(headers, rows, os.path.join(month_folder, "计提薪资.xlsx"))
+
+    with span('test4'):
+        with span('读取'):
+            salary_df = Statistics.prepare_salary_df(pd.DataFrame(rows, columns=headers), year, log)
+            delivery_df = Statistics.load_delivery_df(paths['salary_workbook'], year, log)
+            amort_dict, daily_expense_df = Statistics.load_expense_data(paths['expense_workbook'], log, year)
+        with span('计算地区利润'):
+            sheets = Statistics.build_profit_sheets(monthly_df, salary_df, delivery_df, amort_dict,
+                                                    daily_expense_df, log, year=year)
+        with span('写出'):
+            output_path = os.path.join(month_folder, f"{month}月汇总表_{year}年{month}月_processed.xlsx")
+            Statistics.write_profit_workbook(output_path, sheets, year, month, log)
+    return output_path
+
+
+def run_benchmark(rows_list, workdir, month=3, year=None, merchants=None, seed=0, keep=False, log=print):
+    """
+    按每个规模生成数据并计时
+
+    :param rows_list: 日账单行数列表
+    :param keep: 是否保留生成的数据和输出文件
+    :return: 汇总表DataFrame，每行一个步骤，每列一个规模（秒）
+    """
+    year = year or datetime.now().year
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    for rows in rows_list:
+        scale_folder = os.path.join(workdir, str(rows))
+        input_folder = os.path.join(scale_folder, '输入')
+        output_folder = os.path.join(scale_folder, '输出')
+        os.makedirs(output_folder, exist_ok=True)
+
+        log(f"\n===== {rows} 行 =====")
+        log("生成模拟数据...")
+        paths = generate_inputs(input_folder, rows, month, year, merchants, seed)
+
+        # 阶段内部的处理信息不输出，只保留计时结果
+        with profiled_run(f'benchmark_{rows}', workdir) as run:
+            run_stages(paths, output_folder, month, year, log=lambda message: None)
+        workbookSession.close_sessions()
+        log(f"总耗时 {run['total_seconds']:.2f} 秒")
+        results[rows] = {path: entry['seconds'] for path, entry in run['spans'].items()}
+        results[rows]['合计'] = run['total_seconds']
+
+        if not keep:
+            shutil.rmtree(scale_folder, ignore_errors=True)
+
+    summary = pd.DataFrame(results)
+    summary.index.name = '步骤'
+    summary.columns = [f"{rows}行(秒)" for rows in summary.columns]
+    summary.to_csv(os.path.join(workdir, 'benchmark_汇总.csv'), encoding='utf-8-sig')
+    return summary
+
+
+def measure_startup(command, runs=5, log=print):
+    """
+    多次启动启动器并测量冷启动耗时
+
+    :param command: 启动器路径，例如 dist/core/core.exe；为 .py 文件时使用当前的Python解释器运行
+    :param runs: 启动次数
+    :return: DataFrame，每次启动一行：总耗时（启动进程到窗口显示后退出）和core.py内部耗时（秒）
+    """
+    args = [sys.executable, command] if command.endswith('.py') else [command]
+    records = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report_path = os.path.join(temp_dir, 'startup.jsonl')
+        for run_index in range(1, runs + 1):
+            start = time.perf_counter()
+            subprocess.run(args + ['--startup-time', report_path], check=True, timeout=120)
+            total = time.perf_counter() - start
+            with open(report_path, encoding='utf-8') as f:
+                report = json.loads(f.read().splitlines()[-1])
+            records.append({'次数': run_index, '总耗时(秒)': total, '窗口显示(秒)': report['window_seconds'],
+                            '已导入模块数': report['modules']})
+            log(f"第 {run_index} 次启动: {total:.3f} 秒")
+    return pd.DataFrame(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用模拟数据对各阶段进行性能基准测试")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="日账单行数，可指定多个规模")
+    parser.add_argument('--merchants', type=int, help="商家数量，默认为行数的十分之一")
+    parser.add_argument('--month', type=int, default=3, help="模拟数据的月份")
+    parser.add_argument('--year', type=int, help="模拟数据的年份，默认为当前年份")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    parser.add_argument('--workdir', help="保存数据和结果的文件夹，默认为临时文件夹")
+    parser.add_argument('--keep', action='store_true', help="保留生成的数据和输出文件")
+    parser.add_argument('--startup', metavar='COMMAND', help="测量启动器的冷启动耗时，例如 dist/core/core.exe 或 core.py")
+    parser.add_argument('--runs', type=int, default=5, help="--startup 的启动次数")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = measure_startup(args.startup, args.runs)
+        print(startup.round(3).to_string(index=False))
+        print(f"\n第一次（冷启动）: {startup['总耗时(秒)'].iloc[0]:.3f} 秒，"
+              f"中位数: {startup['总耗时(秒)'].median():.3f} 秒")
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='merchant_benchmark_')
+    summary = run_benchmark(args.rows, workdir, args.month, args.year, args.merchants, args.seed, args.keep)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(summary.round(3))
+    print(f"\n结果已保存到 {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+多个月份日账单的分批汇总
+
+逐个读取 test1 输出的外卖组织分组文件，每个文件按固定行数分批读取费用列，只保留
+(外卖组织, 日期, 费用列) 的累计金额，内存占用与文件数量和大小无关，可用于季度、年度汇总。
+每天的汇总结果与 statisticDay 生成的当日汇总相同。
+
+用法：python billAggregator.py 分组文件夹 汇总.xlsx --period quarter
+"""
+import argparse
+import os
+from collections import defaultdict
+from datetime import date
+
+import pandas as pd
+
+import columnResolver
+import feeColumns
+import regionRegistry
+from xlsxReader import iter_frames
+
+BATCH_SIZE = 20000
+PERIODS = ['day', 'month', 'quarter', 'year']
+
+
+def find_history_files(input_folder, organizations=None):
+    """
+    在文件夹（包括子文件夹）中查找所有外卖组织分组文件，日期取自文件名中的 yyyy-mm-dd
+
+    :param organizations: {外卖组织: 区域}，默认为regionRegistry.organization_mapping()
+    :return: [(日期, 外卖组织, 文件路径)]，按日期和外卖组织排序
+    """
+    organizations = organizations or regionRegistry.organization_mapping()
+    files = {}
+    for folder, _, file_names in os.walk(input_folder):
+        for file_name in sorted(file_names):
+            if not file_name.endswith('.xlsx') or file_name.startswith(('updated_', '~$')):
+                continue
+            match = feeColumns.BILL_DATE_PATTERN.search(file_name)
+            if not match:
+                continue
+            bill_date = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            for org_group in organizations:
+                if org_group in file_name:
+                    files.setdefault((bill_date, org_group), os.path.join(folder, file_name))
+    return [(bill_date, org_group, path) for (bill_date, org_group), path in sorted(files.items())]
+
+
+def aggregate_file(file_path, org_group, bill_date, totals, batch_size=BATCH_SIZE):
+    """
+    分批读取一个分组文件，将各费用列的合计累加到totals
+
+    :param totals: {(外卖组织, 日期, 目标列名): 金额}
+    :return: 读取的行数
+    """
+    rows = 0
+    found_columns = None
+    for batch in iter_frames(file_path, columns=feeColumns.is_fee_column, batch_size=batch_size):
+        if found_columns is None:
+            found_columns = columnResolver.resolve_columns(batch.columns, feeColumns.FEE_TARGETS)
+        for target, col in found_columns.items():
+            totals[(org_group, bill_date, target)] += pd.to_numeric(batch[col], errors='coerce').sum()
+        rows += len(batch)
+    # 文件中没有数据行时iter_frames仍会输出只有表头的空批次，费用列记为0，与summarize_org_frame一致
+    for target in found_columns or {}:
+        totals[(org_group, bill_date, target)] += 0.0
+    return rows
+
+
+def aggregate_history(input_folder, organizations=None, batch_size=BATCH_SIZE, log=print, totals=None):
+    """
+    汇总文件夹中所有分组文件
+
+    :param totals: 已有的累计结果，传入时在其基础上继续累加
+    :return: {(外卖组织, 日期, 目标列名): 金额}
+    """
+    totals = totals if totals is not None else defaultdict(float)
+    files = find_history_files(input_folder, organizations)
+    log(f"共找到 {len(files)} 个分组文件")
+    for bill_date, org_group, path in files:
+        rows = aggregate_file(path, org_group, bill_date, totals, batch_size)
+        log(f"已汇总 {bill_date:%Y-%m-%d} {org_group}，{rows} 行")
+    return totals
+
+
+def period_label(bill_date, period):
+    """汇总周期的名称，例如 3月13日、2025年3月、2025年第1季度、2025年"""
+    if period == 'day':
+        return f"{bill_date.month}月{bill_date.day}日"
+    if period == 'month':
+        return f"{bill_date.year}年{bill_date.month}月"
+    if period == 'quarter':
+        return f"{bill_date.year}年第{(bill_date.month - 1) // 3 + 1}季度"
+    if period == 'year':
+        return f"{bill_date.year}年"
+    raise ValueError(f"不支持的汇总周期: {period}")
+
+
+def rollup(totals, period='month', organizations=None):
+    """
+    按区域和周期汇总，表格格式与当日汇总相同
+
+    :param period: day、month、quarter 或 year
+    :return: {区域: DataFrame}，每个周期一行，列为日期、替换后的费用列和合计，顺序与organizations一致
+    """
+    organizations = organizations or regionRegistry.organization_mapping()
+    records = pd.DataFrame(
+        [(organizations[org_group], bill_date, period_label(bill_date, period), target, value)
+         for (org_group, bill_date, target), value in totals.items() if org_group in organizations],
+        columns=['区域', '日期', '周期', '目标列', '金额'])
+
+    result = {}
+    for area in dict.fromkeys(organizations.values()):
+        area_records = records[records['区域'] == area]
+        if area_records.empty:
+            continue
+        # 周期按日期先后排列，费用列按COLUMN_MAPPING的顺序排列
+        period_order = area_records.sort_values('日期')['周期'].unique()
+        targets = [target for target in feeColumns.FEE_TARGETS if target in set(area_records['目标列'])]
+        table = area_records.pivot_table(index='周期', columns='目标列', values='金额', aggfunc='sum')
+        table = table.reindex(index=period_order, columns=targets)
+        table.columns = [feeColumns.COLUMN_MAPPING[target] for target in targets]
+        table['合计'] = table.sum(axis=1)
+        result[area] = table.rename_axis('日期').reset_index()
+    return result
+
+
+def write_rollup(output_path, rollups):
+    """将各区域的汇总写入同一个Excel文件，每个区域一个工作表"""
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        for area, df in rollups.items():
+            df.to_excel(writer, sheet_name=area, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分批汇总多个月份的外卖组织分组文件")
+    parser.add_argument('input_folder', help="包含外卖组织分组文件的文件夹，会同时查找子文件夹")
+    parser.add_argument('output_file', help="输出的Excel文件")
+    parser.add_argument('--period', choices=PERIODS, default='month', help="汇总周期")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="每批读取的行数")
+    args = parser.parse_args()
+
+    totals = aggregate_history(args.input_folder, batch_size=args.batch_size)
+    write_rollup(args.output_file, rollup(totals, args.period))
+    print(f"汇总结果已保存到 {args.output_file}")
+
+
+if __name__ == '__main__':
+    main()
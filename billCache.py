@@ -0,0 +1,235 @@
+"""
+日账单等Excel文件的列式缓存
+
+首次读取某个工作簿时，将解析结果保存为Arrow(Feather)文件，缓存键为文件内容的哈希值，
+之后读取内容相同的文件（包括复制到其他文件夹的副本）时直接以内存映射方式加载。
+缓存键还包括读取参数、CACHE_VERSION和读取函数（以及列选择函数）所在模块的源码哈希，
+修改billSchema.normalize_bill等读取代码后旧缓存自动失效，不会读到按旧规则转换的结果。
+未安装pyarrow时退化为直接调用pd.read_excel。
+
+用法：
+    python billCache.py --evict    按大小和时间清理缓存
+    python billCache.py --clear    清空全部缓存
+    python billCache.py --clear 文件.xlsx    只清除指定文件的缓存
+"""
+import argparse
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from profiling import count, span
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+CACHE_DIR = os.environ.get('MERCHANT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.merchant_data_cache'))
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # 缓存总大小上限
+MAX_CACHE_AGE_DAYS = 30  # 超过该天数未使用的缓存将被清理
+CACHE_SUFFIX = '.arrow'
+# 缓存格式版本：缓存内容的含义发生变化、但读取函数所在模块的源码没有变化时（例如读取函数调用的其他模块
+# 修改了类型转换规则）需要加1，使旧缓存失效
+CACHE_VERSION = 3
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA1哈希值"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _module_fingerprint(module_name):
+    """模块源码的哈希值，取不到源码时（例如打包后的程序）为空"""
+    module = sys.modules.get(module_name)
+    try:
+        source = inspect.getsource(module) if module is not None else ''
+    except (OSError, TypeError):
+        source = ''
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def _callable_fingerprint(func):
+    """函数的源码哈希，lambda等同名函数也能区分；取不到源码时使用字节码和常量"""
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = getattr(func, '__code__', None)
+        source = code.co_code.hex() + repr(code.co_consts) if code is not None else repr(func)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def _stable_repr(value):
+    """
+    函数类参数（读取函数、列选择函数）按模块、名称和源码生成缓存键，避免受内存地址影响，
+    函数或其所在模块修改后缓存键随之变化
+    """
+    if callable(value):
+        module_name = getattr(value, '__module__', '') or ''
+        name = getattr(value, '__qualname__', repr(value))
+        return f"{module_name}.{name}:{_callable_fingerprint(value)}:{_module_fingerprint(module_name)}"
+    return str(value)
+
+
+def _cache_path(cache_dir, content_digest, read_kwargs):
+    """缓存文件名由文件内容哈希和读取参数哈希组成，便于按文件失效"""
+    kwargs_key = json.dumps(dict(read_kwargs, cache_version=CACHE_VERSION), sort_keys=True, ensure_ascii=False,
+                            default=_stable_repr)
+    kwargs_digest = hashlib.sha1(kwargs_key.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{content_digest}_{kwargs_digest}{CACHE_SUFFIX}")
+
+
+def read_excel_cached(file_path, cache_dir=None, reader=None, log=print, **read_kwargs):
+    """
+    带缓存的pd.read_excel
+
+    :param file_path: Excel文件路径
+    :param cache_dir: 缓存目录，默认为CACHE_DIR
+    :param reader: 读取函数，默认为pd.read_excel，也可以是xlsxReader.read_columns等返回DataFrame的函数
+    :param log: 输出处理信息的函数
+    :param read_kwargs: 传给读取函数的参数
+    :return: DataFrame
+    """
+    reader = reader or pd.read_excel
+    # 未安装pyarrow或一次读取多个sheet时不使用缓存
+    if pa is None or read_kwargs.get('sheet_name', 0) is None or isinstance(read_kwargs.get('sheet_name'), list):
+        count('bytes_read', os.path.getsize(file_path))
+        with span('解析Excel'):
+            return reader(file_path, **read_kwargs)
+
+    cache_dir = cache_dir or CACHE_DIR
+    cache_key = dict(read_kwargs, reader=reader)
+    cache_path = _cache_path(cache_dir, file_digest(file_path), cache_key)
+
+    if os.path.exists(cache_path):
+        try:
+            with span('读取缓存'):
+                table = feather.read_table(cache_path, memory_map=True)
+                os.utime(cache_path)  # 记录最近使用时间，供清理时参考
+                df = table.to_pandas()
+            count('cache_hits')
+            count('rows_read', len(df))
+            return df
+        except (pa.ArrowException, OSError):
+            # 缓存文件损坏时重新解析
+            _remove_quietly(cache_path)
+
+    # 只有实际解析Excel时才计入读取的字节数，命中缓存时不计
+    count('bytes_read', os.path.getsize(file_path))
+    with span('解析Excel'):
+        df = reader(file_path, **read_kwargs)
+    count('cache_misses')
+    count('rows_read', len(df))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(df, temp_path, compression='uncompressed')
+        os.replace(temp_path, cache_path)
+    except (pa.ArrowException, ValueError, TypeError, OSError) as e:
+        # 混合类型的列无法转换为Arrow格式，这种文件不缓存
+        log(f"无法缓存文件 {file_path}: {e}")
+        _remove_quietly(temp_path)
+    else:
+        evict_cache(cache_dir)
+    return df
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _cache_entries(cache_dir):
+    """列出缓存文件，返回 [(路径, 大小, 最近使用时间)]"""
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def evict_cache(cache_dir=None, max_bytes=MAX_CACHE_BYTES, max_age_days=MAX_CACHE_AGE_DAYS):
+    """
+    清理过期缓存，并在总大小超过上限时按最近使用时间从旧到新删除
+
+    :return: 删除的缓存文件数量
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    entries = _cache_entries(cache_dir)
+    expire_before = time.time() - max_age_days * 86400
+    removed = 0
+
+    kept = []
+    for path, size, mtime in entries:
+        if mtime < expire_before:
+            _remove_quietly(path)
+            removed += 1
+        else:
+            kept.append((path, size, mtime))
+
+    total_size = sum(size for _, size, _ in kept)
+    for path, size, _ in sorted(kept, key=lambda entry: entry[2]):
+        if total_size <= max_bytes:
+            break
+        _remove_quietly(path)
+        total_size -= size
+        removed += 1
+    return removed
+
+
+def clear_cache(cache_dir=None, file_path=None):
+    """
+    使缓存失效
+
+    :param file_path: 只清除该文件的缓存，为None时清空全部缓存
+    :return: 删除的缓存文件数量
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    prefix = file_digest(file_path) + '_' if file_path else ''
+    removed = 0
+    for path, _, _ in _cache_entries(cache_dir):
+        if os.path.basename(path).startswith(prefix):
+            _remove_quietly(path)
+            removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理Excel列式缓存")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="缓存目录")
+    parser.add_argument('--clear', nargs='?', const='', metavar='文件', help="清除缓存，可指定只清除某个文件的缓存")
+    parser.add_argument('--evict', action='store_true', help="按大小和时间清理缓存")
+    args = parser.parse_args()
+
+    if args.clear is not None:
+        removed = clear_cache(args.cache_dir, args.clear or None)
+        print(f"已删除 {removed} 个缓存文件")
+    if args.evict:
+        removed = evict_cache(args.cache_dir)
+        print(f"已清理 {removed} 个缓存文件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+日账单和商家文件在内存中的统一类型
+
+读取文件后调用一次（read_bill 在读取和缓存时自动调用），之后各阶段直接使用，不再重复转换：
+    商家ID                    int64（有空值时为可空的Int64）；存在无法转换为整数的值时统一转换为字符串
+    外卖组织结构、区域          category
+    其余数值列（费用列等）       float64，名称中含ID的列（订单ID、合作商ID等）保持原样
+    其余文本列                 取值重复较多的（如商家名称、订单状态）转换为category；drop_text=True 时丢弃
+
+转换后的结果保存在billCache的缓存中，再次读取同一文件时直接得到转换后的类型。
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_bool_dtype, is_numeric_dtype
+
+from billCache import read_excel_cached
+from xlsxReader import read_columns
+
+MERCHANT_ID_COL = "商家ID"
+ORG_STRUCTURE_COL = "外卖组织结构"
+CATEGORY_COLUMNS = (ORG_STRUCTURE_COL, "区域")
+# 不同取值的数量不超过行数的该比例时，文本列转换为category
+CATEGORY_RATIO = 0.5
+
+
+def normalize_merchant_ids(values):
+    """
+    将商家ID转换为整数
+
+    :return: int64的Series，有空值时为Int64；存在无法转换为整数的值时返回字符串Series（空值保持为空）
+    """
+    series = pd.Series(values)
+    numeric = pd.to_numeric(series, errors='coerce')
+    present = series.notna()
+    if numeric[present].isna().any() or (numeric[present] % 1 != 0).any():
+        return series.where(~present, series.astype(str))
+    if not present.all():
+        return numeric.astype('Int64')
+    return numeric.astype(np.int64)
+
+
+def merchant_keys(*columns):
+    """
+    返回可以直接相互比较的商家ID列
+
+    各列都是整数时直接返回；有任意一列为字符串时，全部转换为字符串（只在这种少见的情况下转换）
+    """
+    if all(pd.api.types.is_integer_dtype(column.dtype) for column in columns):
+        return columns
+    return tuple(column.where(column.isna(), column.astype(str)) for column in columns)
+
+
+def is_text_column(series):
+    """所有非空值都是字符串的列"""
+    return not is_numeric_dtype(series.dtype) and infer_dtype(series, skipna=True) == 'string'
+
+
+def normalize_bill(df, drop_text=False):
+    """
+    按统一类型转换DataFrame，直接修改并返回df
+
+    :param drop_text: 是否丢弃商家ID、组织结构和数值列以外的文本列（只需要汇总费用时使用）
+    """
+    dropped = []
+    for col in df.columns:
+        name = str(col)
+        series = df[col]
+        if name == MERCHANT_ID_COL:
+            df[col] = normalize_merchant_ids(series)
+        elif name in CATEGORY_COLUMNS:
+            df[col] = series.astype('category')
+        elif is_numeric_dtype(series.dtype) and not is_bool_dtype(series.dtype):
+            if 'ID' not in name:
+                df[col] = series.astype(np.float64)
+        elif is_text_column(series):
+            if drop_text:
+                dropped.append(col)
+            elif len(series) and series.nunique() <= CATEGORY_RATIO * len(series):
+                df[col] = series.astype('category')
+    if dropped:
+        df = df.drop(columns=dropped)
+    return df
+
+
+def _read_normalized(file_path, columns=None, drop_text=False):
+    """读取文件并转换类型，作为read_excel_cached的读取函数"""
+    df = pd.read_excel(file_path) if columns is None else read_columns(file_path, columns=columns)
+    return normalize_bill(df, drop_text)
+
+
+def read_bill(file_path, cache_dir=None, columns=None, drop_text=False, log=print):
+    """
+    读取日账单、海豚_合作商商家数据或乡镇商家明细，并转换为统一类型（结果带缓存）
+
+    :param columns: 需要的列名列表或判断函数，为None时读取全部列
+    :param drop_text: 是否丢弃文本列，见normalize_bill
+    :param log: 输出处理信息的函数
+    :return: DataFrame
+    """
+    return read_excel_cached(file_path, cache_dir, reader=_read_normalized, log=log, columns=columns,
+                             drop_text=drop_text)
+
+
+def set_category_value(df, col, mask, value):
+    """
+    将df[col]中mask选中的行设置为value，列为category且没有该取值时先添加
+
+    生成新的列而不是原地修改，从缓存内存映射加载的列是只读的
+    """
+    column = df[col]
+    if isinstance(column.dtype, pd.CategoricalDtype) and value not in column.cat.categories:
+        column = column.cat.add_categories([value])
+    df[col] = column.mask(mask, value)
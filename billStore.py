@@ -0,0 +1,331 @@
+"""
+历史账单明细的本地数据库
+
+test1输出的外卖组织分组文件（或pipeline中按组织结构拆分后的数据）逐行存入一张表，
+每行为 (日期, 外卖组织结构, 商家ID, feeColumns.FEE_TARGETS中的各费用列)，并按
+(日期, 外卖组织结构, 商家ID) 建立索引。跨日期、跨组织的费用合计直接由SQL查询得到，
+不需要重新读取Excel文件。
+
+默认使用SQLite；数据库文件名以 .duckdb 结尾且安装了duckdb时使用DuckDB（列式存储，大量历史数据的
+汇总更快）。同一天同一组织的数据再次导入时覆盖旧数据，文件未变化（大小、修改时间和内容哈希）时跳过。
+
+用法：
+    python billStore.py 账单.db --ingest 分组文件夹
+    python billStore.py 账单.db --start 2025-03-01 --end 2025-03-31 --by org
+"""
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+
+import billAggregator
+import billSchema
+import columnResolver
+import feeColumns
+import regionRegistry
+from billCache import file_digest
+from profiling import count, span
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+FEE_TARGETS = feeColumns.FEE_TARGETS
+GROUP_COLUMNS = {'day': 'day', 'org': 'org', 'merchant': 'merchant_id'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bill_sources (
+    day TEXT NOT NULL,
+    org TEXT NOT NULL,
+    path TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    digest TEXT,
+    row_count INTEGER NOT NULL,
+    targets TEXT NOT NULL,
+    PRIMARY KEY (day, org)
+);
+CREATE TABLE IF NOT EXISTS bill_rows (
+    day TEXT NOT NULL,
+    org TEXT NOT NULL,
+    merchant_id BIGINT
+);
+CREATE INDEX IF NOT EXISTS idx_bill_rows ON bill_rows (day, org, merchant_id);
+"""
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_sqlite(conn):
+    return isinstance(conn, sqlite3.Connection)
+
+
+def open_store(db_path):
+    """
+    打开（必要时创建）账单数据库，缺少的费用列（FEE_TARGETS有新增时）自动添加
+
+    :param db_path: 数据库文件路径，以 .duckdb 结尾且安装了duckdb时使用DuckDB，否则使用SQLite
+    :return: 数据库连接
+    """
+    if db_path.endswith('.duckdb') and duckdb is not None:
+        conn = duckdb.connect(db_path)
+        for statement in SCHEMA.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        existing = {row[0] for row in conn.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'bill_rows'").fetchall()}
+    else:
+        # 多个进程（pipeline的多公司模式）可能同时写入同一个数据库；
+        # 使用自动提交模式，写入由_transaction显式开始和提交事务
+        conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        conn.executescript(SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(bill_rows)").fetchall()}
+    for target in FEE_TARGETS:
+        if target not in existing:
+            conn.execute(f"ALTER TABLE bill_rows ADD COLUMN {_quote(target)} DOUBLE")
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        yield
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _query(conn, sql, params=()):
+    """执行查询并返回DataFrame，SQLite和DuckDB通用"""
+    cursor = conn.execute(sql, list(params))
+    columns = [description[0] for description in cursor.description]
+    return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+
+def _insert_rows(conn, rows):
+    columns = ', '.join(_quote(col) for col in rows.columns)
+    if _is_sqlite(conn):
+        placeholders = ', '.join('?' * len(rows.columns))
+        # NaN写入SQLite后为NULL，求和时与pandas一样被忽略
+        conn.executemany(f"INSERT INTO bill_rows ({columns}) VALUES ({placeholders})",
+                         rows.itertuples(index=False, name=None))
+    else:
+        conn.register('incoming_rows', rows)
+        try:
+            conn.execute(f"INSERT INTO bill_rows ({columns}) SELECT {columns} FROM incoming_rows")
+        finally:
+            conn.unregister('incoming_rows')
+
+
+def ingest_frame(conn, df, day, org, source=None):
+    """
+    导入某一天、某个外卖组织的账单明细，覆盖该天该组织已有的数据
+
+    :param df: 账单数据，包含商家ID和费用列（表头与目标列名的匹配规则见columnResolver）
+    :param day: datetime.date
+    :param source: 来源文件信息 {'path', 'size', 'mtime_ns', 'digest'}，用于判断文件是否需要重新导入
+    :return: 导入的行数
+    """
+    found = columnResolver.resolve_columns(df.columns, FEE_TARGETS)
+    rows = pd.DataFrame({'day': day.isoformat(), 'org': org}, index=range(len(df)))
+    if billSchema.MERCHANT_ID_COL in df.columns:
+        merchant_ids = df[billSchema.MERCHANT_ID_COL].astype(object)
+        rows['merchant_id'] = merchant_ids.where(merchant_ids.notna(), None).to_numpy()
+    else:
+        rows['merchant_id'] = None
+    for target in FEE_TARGETS:
+        if target in found:
+            rows[target] = pd.to_numeric(df[found[target]], errors='coerce').to_numpy(dtype=float)
+        else:
+            rows[target] = float('nan')
+
+    source = source or {}
+    day_key = day.isoformat()
+    with span('写入账单数据库'), _transaction(conn):
+        conn.execute("DELETE FROM bill_rows WHERE day = ? AND org = ?", [day_key, org])
+        conn.execute("DELETE FROM bill_sources WHERE day = ? AND org = ?", [day_key, org])
+        _insert_rows(conn, rows)
+        conn.execute(
+            "INSERT INTO bill_sources (day, org, path, size, mtime_ns, digest, row_count, targets) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [day_key, org, source.get('path'), source.get('size'), source.get('mtime_ns'), source.get('digest'),
+             len(rows), json.dumps(list(found), ensure_ascii=False)])
+    count('store_rows_written', len(rows))
+    return len(rows)
+
+
+def ingest_groups(conn, groups, day, source_path=None):
+    """
+    导入dataPreprocessing按组织结构拆分后的数据
+
+    :param groups: {组织结构: 分组数据}，例如dataPreprocessing.save_outputs的返回值
+    :return: 导入的行数
+    """
+    source = {'path': source_path} if source_path else None
+    return sum(ingest_frame(conn, group_data, day, org, source) for org, group_data in groups.items())
+
+
+def _store_column(name):
+    """导入时读取的列：商家ID和费用列"""
+    return name == billSchema.MERCHANT_ID_COL or feeColumns.is_fee_column(name)
+
+
+def ingest_file(conn, file_path, day, org, log=print):
+    """
+    导入一个分组文件，文件与上次导入时相同则跳过
+
+    :return: 导入的行数，跳过时返回0
+    """
+    stat = os.stat(file_path)
+    known = conn.execute("SELECT size, mtime_ns, digest FROM bill_sources WHERE day = ? AND org = ?",
+                         [day.isoformat(), org]).fetchone()
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return 0
+    digest = file_digest(file_path)
+    if known and known[2] == digest:
+        # 内容未变化（例如文件被复制或touch），记录新的大小和修改时间，下次不再计算哈希
+        conn.execute("UPDATE bill_sources SET size = ?, mtime_ns = ? WHERE day = ? AND org = ?",
+                     [stat.st_size, stat.st_mtime_ns, day.isoformat(), org])
+        return 0
+
+    df = billSchema.read_bill(file_path, columns=_store_column, log=log)
+    source = {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+              'digest': digest}
+    rows = ingest_frame(conn, df, day, org, source)
+    log(f"已导入 {day:%Y-%m-%d} {org}，{rows} 行")
+    return rows
+
+
+def ingest_folder(conn, input_folder, organizations=None, log=print):
+    """
+    导入文件夹（包括子文件夹）中所有外卖组织分组文件，已导入且未变化的文件跳过
+
+    :param organizations: {外卖组织: 区域}，默认为regionRegistry.organization_mapping()
+    :return: 导入的行数
+    """
+    files = billAggregator.find_history_files(input_folder, organizations)
+    total = sum(ingest_file(conn, path, bill_date, org, log) for bill_date, org, path in files)
+    log(f"共 {len(files)} 个分组文件，新导入 {total} 行")
+    return total
+
+
+def fee_totals(conn, start=None, end=None, organizations=None, by=('day', 'org')):
+    """
+    按日期范围查询各费用列的合计
+
+    :param start: 起始日期（含），为None时不限
+    :param end: 截止日期（含），为None时不限
+    :param organizations: 外卖组织列表或 {外卖组织: 区域}，为None时包括全部组织
+    :param by: 分组方式，day、org、merchant 的组合，为空时返回一行总计
+    :return: DataFrame，分组列之后为FEE_TARGETS中的各费用列
+    """
+    group_columns = [GROUP_COLUMNS[key] for key in by]
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("day >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        conditions.append("day <= ?")
+        params.append(end.isoformat())
+    if organizations is not None:
+        orgs = list(organizations)
+        conditions.append(f"org IN ({', '.join('?' * len(orgs))})" if orgs else "1 = 0")
+        params.extend(orgs)
+
+    select = group_columns + [f"SUM({_quote(target)}) AS {_quote(target)}" for target in FEE_TARGETS]
+    sql = f"SELECT {', '.join(select)} FROM bill_rows"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if group_columns:
+        sql += f" GROUP BY {', '.join(group_columns)} ORDER BY {', '.join(group_columns)}"
+    with span('查询账单数据库'):
+        return _query(conn, sql, params)
+
+
+def _latest_year(conn, month):
+    row = conn.execute("SELECT MAX(substr(day, 1, 4)) FROM bill_sources WHERE substr(day, 6, 2) = ?",
+                       [f"{int(month):02d}"]).fetchone()
+    return int(row[0]) if row and row[0] else None
+
+
+def daily_summaries(conn, month, start_day, end_day, year=None, organizations=None):
+    """
+    由数据库查询得到日期范围内每天各区域的当日汇总，结果与statisticDay.summarize_date_range相同
+
+    :param year: 年份，为None时使用数据库中该月份最近的年份
+    :param organizations: {外卖组织: 区域}，默认为regionRegistry.organization_mapping()
+    :return: {日期: {区域: 当日汇总}}，按日期排序
+    """
+    organizations = organizations or regionRegistry.organization_mapping()
+    year = year or _latest_year(conn, month)
+    if year is None:
+        return {}
+    start, end = date(year, int(month), start_day), date(year, int(month), end_day)
+    totals = fee_totals(conn, start, end, organizations)
+    # 只汇总文件中存在的费用列，与summarize_org_frame一致
+    sources = _query(conn, "SELECT day, org, targets FROM bill_sources WHERE day >= ? AND day <= ?",
+                     [start.isoformat(), end.isoformat()])
+    targets = {(row.day, row.org): json.loads(row.targets) for row in sources.itertuples()}
+
+    results = {}
+    for row in totals.itertuples(index=False):
+        day, org = row[0], row[1]
+        found = set(targets.get((day, org), FEE_TARGETS))
+        values = dict(zip(FEE_TARGETS, row[2:]))
+        day_number = int(day[8:10])
+        summary_df = pd.DataFrame({'日期': [f"{month}月{day_number}日"]})
+        for target in FEE_TARGETS:
+            if target in found:
+                summary_df[feeColumns.COLUMN_MAPPING[target]] = [values[target] or 0.0]
+        sum_columns = [col for col in summary_df.columns if col != '日期']
+        summary_df['合计'] = summary_df[sum_columns].sum(axis=1)
+        results[(day_number, org)] = summary_df
+
+    # 按日期和organizations的顺序整理结果
+    summaries = {}
+    for day_number in sorted({day_number for day_number, _ in results}):
+        summaries[day_number] = {area: results[(day_number, org)]
+                                 for org, area in organizations.items() if (day_number, org) in results}
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史账单明细数据库：导入分组文件并查询费用合计")
+    parser.add_argument('db_path', help="数据库文件，以 .duckdb 结尾时使用DuckDB")
+    parser.add_argument('--ingest', metavar='FOLDER', help="导入文件夹（包括子文件夹）中的外卖组织分组文件")
+    parser.add_argument('--start', help="查询的起始日期，例如 2025-03-01")
+    parser.add_argument('--end', help="查询的截止日期，例如 2025-03-31")
+    parser.add_argument('--by', nargs='*', choices=list(GROUP_COLUMNS), default=['org'], help="分组方式")
+    parser.add_argument('--output', help="将查询结果保存为Excel文件")
+    args = parser.parse_args()
+
+    conn = open_store(args.db_path)
+    try:
+        if args.ingest:
+            ingest_folder(conn, args.ingest)
+        start = datetime.strptime(args.start, '%Y-%m-%d').date() if args.start else None
+        end = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else None
+        totals = fee_totals(conn, start, end, by=args.by)
+    finally:
+        conn.close()
+    totals = totals.rename(columns={target: feeColumns.COLUMN_MAPPING[target] for target in FEE_TARGETS})
+    totals['合计'] = totals[[feeColumns.COLUMN_MAPPING[target] for target in FEE_TARGETS]].sum(axis=1)
+    if args.output:
+        totals.to_excel(args.output, index=False)
+        print(f"查询结果已保存到 {args.output}")
+    else:
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(totals)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+账单表头与目标列名的匹配
+
+匹配规则：
+    1. 表头与目标列名完全相同时直接使用该列
+    2. 其余目标列名按长度从长到短依次匹配包含它的表头，已被其他目标占用的表头不再使用，
+       有多个候选时取多余字符最少的表头（相同时取靠前的列）
+因此 '合作商服务费' 不会因为列的顺序而匹配到 '合作商服务费退款'。
+
+同一份表头（按表头内容的哈希值区分）只计算一次，同一进程中处理的所有分组文件和所有日期共用结果。
+"""
+import hashlib
+
+_cache = {}
+
+
+def header_signature(columns):
+    """表头的哈希值，列名和顺序都相同的表头得到相同的值"""
+    return hashlib.sha1('\x1f'.join(str(col) for col in columns).encode('utf-8')).hexdigest()
+
+
+def _match(headers, targets):
+    matches = {}
+    used = set()
+    for target in targets:
+        if target in headers:
+            matches[target] = target
+            used.add(target)
+
+    for target in sorted((t for t in targets if t not in matches), key=len, reverse=True):
+        candidates = [(len(header) - len(target), position, header)
+                      for position, header in enumerate(headers) if target in header and header not in used]
+        if candidates:
+            header = min(candidates)[2]
+            matches[target] = header
+            used.add(header)
+    return matches
+
+
+def resolve_columns(columns, targets):
+    """
+    为每个目标列名找到对应的表头
+
+    :param columns: 表头，例如 df.columns
+    :param targets: 目标列名，按需要的顺序排列
+    :return: {目标列名: 表头}，按targets的顺序排列，找不到的目标列名不包含在内
+    """
+    targets = tuple(targets)
+    key = (header_signature(columns), targets)
+    if key not in _cache:
+        headers = [str(col) for col in columns]
+        matches = _match(headers, targets)
+        # 返回原始的列对象，便于直接用于df[...]
+        originals = dict(zip(headers, columns))
+        _cache[key] = {target: originals[matches[target]] for target in targets if target in matches}
+    return _cache[key]
+
+
+def clear_cache():
+    """清空已缓存的匹配结果"""
+    _cache.clear()
@@ -1,62 +1,135 @@
-import tkinter as tk
-from tkinter import messagebox
+import time
 
-# 假设这四个文件和当前脚本在同一目录下
-# 导入四个模块
-import dataPreprocessing as test1
-import statisticDay as test2
-import wagesCalculation as test3
-import Statistics as test4
+_START = time.perf_counter()
 
-def run_test1():
+import importlib
+import json
+import sys
+import threading
+import tkinter as tk
+from tkinter import messagebox
+import multiprocessing
+
+import backgroundTask
+
+# 四个阶段的模块和当前脚本在同一目录下。各模块会导入pandas、openpyxl和xlrd，
+# 因此只在第一次点击对应按钮时才导入，启动时窗口可以立即显示。
+# 打包时这些模块需要列在core.spec的hiddenimports中。
+# 各阶段都提供 ask_inputs(log)（主线程中弹出对话框）和 run_stage(inputs, log, progress)（后台执行）
+STAGES = [('test1', 'dataPreprocessing'), ('test2', 'statisticDay'), ('test3', 'wagesCalculation'),
+          ('test4', 'Statistics')]
+
+
+def load_stage(module_name, log=print):
+    """导入阶段模块，已导入时直接返回"""
+    if module_name not in sys.modules:
+        log(f"正在加载 {module_name} ...")
+    return importlib.import_module(module_name)
+
+
+def preload_stages():
+    """窗口显示后在后台线程中预先导入各阶段模块，第一次点击按钮时无需等待导入"""
+    def worker():
+        for _, module_name in STAGES:
+            try:
+                importlib.import_module(module_name)
+            except Exception:
+                # 导入失败时点击按钮会再次导入并提示错误
+                return
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def run_stages(panel, stages, on_finished=None):
+    """
+    依次运行多个阶段：每个阶段先在主线程中选择输入，再在后台线程中执行，完成后开始下一个阶段
+
+    后一阶段的输入通常是前一阶段的输出（例如test4的地区数据文件由test2生成），因此在前一阶段
+    完成后才选择。某个阶段取消、出错或未选择输入时，后面的阶段不再运行。
+
+    :param stages: [(阶段名称, 模块名)]
+    :param on_finished: 全部阶段完成后调用
+    """
+    if not stages:
+        if on_finished:
+            on_finished()
+        return
+    name, module_name = stages[0]
+    panel['log'](f"\n===== {name} =====")
     try:
-        test1.main()  # 假设test1.py中的主函数名为main，根据实际情况修改
-        messagebox.showinfo("提示", "test1 执行完成")
+        module = load_stage(module_name, panel['log'])
     except Exception as e:
-        messagebox.showerror("错误", f"test1 执行失败: {str(e)}")
+        messagebox.showerror("错误", f"{name} 加载失败: {str(e)}")
+        return
+    inputs = module.ask_inputs(panel['log'])
+    if not inputs:
+        panel['log'](f"{name} 未选择输入，已停止")
+        return
 
+    def on_done(_):
+        panel['log'](f"{name} 执行完成")
+        run_stages(panel, stages[1:], on_finished)
 
-def run_test2():
-    try:
-        test2.main()  # 假设test2.py中的主函数名为main，根据实际情况修改
-        messagebox.showinfo("提示", "test2 执行完成")
-    except Exception as e:
-        messagebox.showerror("错误", f"test2 执行失败: {str(e)}")
+    def on_error(e):
+        messagebox.showerror("错误", f"{name} 执行失败: {str(e)}")
 
+    backgroundTask.start_task(panel, lambda task: module.run_stage(inputs, task['log'], task['progress']),
+                              on_done=on_done, on_error=on_error)
 
-def run_test3():
-    try:
-        test3.main()  # 假设test3.py中的主函数名为main，根据实际情况修改
-        messagebox.showinfo("提示", "test3 执行完成")
-    except Exception as e:
-        messagebox.showerror("错误", f"test3 执行失败: {str(e)}")
 
+def run_single(panel, name, module_name):
+    run_stages(panel, [(name, module_name)], lambda: messagebox.showinfo("提示", f"{name} 执行完成"))
 
-def run_test4():
-    try:
-        test4.main()  # 假设test4.py中的主函数名为main，根据实际情况修改
-        messagebox.showinfo("提示", "test4 执行完成")
-    except Exception as e:
-        messagebox.showerror("错误", f"test4 执行失败: {str(e)}")
 
+def run_all(panel):
+    run_stages(panel, STAGES, lambda: messagebox.showinfo("提示", "test1 到 test4 全部执行完成"))
+
+
+def main():
+    # 各阶段会使用进程池，打包后的程序需要先调用freeze_support
+    multiprocessing.freeze_support()
+
+    root = tk.Tk()
+    root.title("依次执行测试脚本")
+
+    # 添加提示标签
+    prompt_label = tk.Label(root, text="请按照 test1、test2、test3、test4 的顺序依次执行，或一次依次执行全部。",
+                            justify=tk.CENTER)
+    prompt_label.pack(pady=10)
+
+    button_frame = tk.Frame(root)
+    button_frame.pack(pady=5)
+    panel = backgroundTask.create_panel(root)
+
+    # 处理在后台线程中执行，执行期间禁用按钮，避免同时运行多个阶段
+    for name, module_name in STAGES:
+        button = tk.Button(button_frame, text=f"运行 {name}",
+                           command=lambda name=name, module_name=module_name: run_single(panel, name, module_name))
+        button.pack(side=tk.LEFT, padx=5)
+        panel['controls'].append(button)
 
-root = tk.Tk()
-root.title("依次执行测试脚本")
+    run_all_button = tk.Button(button_frame, text="依次运行 test1→test4", command=lambda: run_all(panel))
+    run_all_button.pack(side=tk.LEFT, padx=5)
+    panel['controls'].append(run_all_button)
 
-# 添加提示标签
-prompt_label = tk.Label(root, text="请按照 test1、test2、test3、test4 的顺序依次执行。", justify=tk.CENTER)
-prompt_label.pack(pady=10)
+    if '--startup-time' in sys.argv:
+        # 测量启动耗时：窗口显示后立即退出，耗时写入参数后面指定的文件（见benchmark.py --startup）
+        root.after_idle(lambda: record_startup(root))
+    else:
+        root.after(500, preload_stages)
 
-button1 = tk.Button(root, text="运行 test1", command=run_test1)
-button1.pack(pady=10)
+    root.mainloop()
 
-button2 = tk.Button(root, text="运行 test2", command=run_test2)
-button2.pack(pady=10)
 
-button3 = tk.Button(root, text="运行 test3", command=run_test3)
-button3.pack(pady=10)
+def record_startup(root):
+    """记录从core.py开始执行到窗口显示的耗时，然后退出"""
+    root.update()
+    seconds = time.perf_counter() - _START
+    index = sys.argv.index('--startup-time')
+    if index + 1 < len(sys.argv):
+        with open(sys.argv[index + 1], 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'window_seconds': seconds, 'modules': len(sys.modules)}) + "\n")
+    root.destroy()
 
-button4 = tk.Button(root, text="运行 test4", command=run_test4)
-button4.pack(pady=10)
 
-root.mainloop()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,132 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# 默认打包为文件夹（onedir）：启动时不需要把全部文件解压到临时目录，打开窗口更快。
+# 需要单个core.exe时设置环境变量 CORE_ONEFILE=1 后再运行 pyinstaller core.spec。
+# 启动耗时可用 python benchmark.py --startup dist/core/core.exe 测量。
+ONEFILE = os.environ.get('CORE_ONEFILE') == '1'
+
+# core.py在点击按钮时才导入各阶段模块，PyInstaller分析不到，需要显式列出
+hiddenimports = [
+    'dataPreprocessing',
+    'statisticDay',
+    'wagesCalculation',
+    'Statistics',
+    'backgroundTask',
+    'billCache',
+    'columnResolver',
+    'excelWriter',
+    'feeColumns',
+    'merchantIndex',
+    'monthlyStore',
+    'profiling',
+    'regionRegistry',
+    'workbookSession',
+    'xlsxReader',
+]
+
+# 各阶段用不到、但会被pandas等库的可选依赖带进来的模块（见build/core/warn-core.txt和xref-core.html）
+excludes = [
+    'IPython',
+    'matplotlib',
+    'scipy',
+    'numba',
+    'pytest',
+    'setuptools',
+    'pkg_resources',
+    '_distutils_hack',
+    'google',
+    'requests',
+    'urllib3',
+    'rsa',
+    'cachetools',
+    'charset_normalizer',
+    'idna',
+    'certifi',
+    'platformdirs',
+    'jinja2',
+    'markupsafe',
+    'bs4',
+    'lxml',
+    'html5lib',
+    'sqlalchemy',
+    'tables',
+    'fsspec',
+    's3fs',
+    'gcsfs',
+    'botocore',
+    'PIL',
+    'PyQt5',
+    'PySide2',
+    'PySide6',
+    'curses',
+    'xmlrpc',
+    'pydoc_data',
+    '_pyrepl',
+    'tkinter.test',
+]
 
 a = Analysis(
     ['core.py'],
     pathex=[],
     binaries=[],
-    datas=[('dataPreprocessing.py', '.'), ('wagesCalculation.py', '.'), ('Statistics.py', '.'), ('statisticDay.py', '.')],
-    hiddenimports=[],
+    datas=[],
+    hiddenimports=hiddenimports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='core',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if ONEFILE:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='core',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='core',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        # 压缩后的dll每次启动都要解压，onedir模式下不使用UPX
+        upx=False,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='core',
+    )
@@ -3,6 +3,14 @@ from tkinter import messagebox
 import pandas as pd
 from tkinter import filedialog
 import os
+import numpy as np
+
+import backgroundTask
+import billSchema
+import merchantIndex
+import regionRegistry
+from excelWriter import write_frames
+from profiling import format_report, profiled_run, span
 
 
 def select_file(title):
@@ -21,179 +29,300 @@ def select_output_folder():
     return output_folder
 
 
-def main():
-    # 创建主界面
-    root = tk.Tk()
-    root.title("文件处理程序")
+# 固定列名
+MERCHANT_ID_COL = "商家ID"  # 三个文件中的商家ID列名
+ORG_STRUCTURE_COL = "外卖组织结构"  # 文件2中的外卖组织结构列名
+TOWNSHIP_ORG = regionRegistry.township_org()  # 文件1中的商家统一归入的组织结构，来自地区配置
+DEFAULT_ORG = "未知组织结构"  # 找不到组织结构时的默认值
+
+
+def check_columns(df1, df2, df3):
+    """检查三个文件中必需的列是否存在，返回错误信息，全部存在时返回None"""
+    if df1 is not None and MERCHANT_ID_COL not in df1.columns:
+        return f"列 '{MERCHANT_ID_COL}' 在文件1中不存在"
+    if MERCHANT_ID_COL not in df2.columns or ORG_STRUCTURE_COL not in df2.columns:
+        return "列名在文件2中不存在"
+    if MERCHANT_ID_COL not in df3.columns:
+        return f"列 '{MERCHANT_ID_COL}' 在文件3中不存在"
+    return None
+
+
+def tag_organizations(df1, df2, df3, log=print, township_org=TOWNSHIP_ORG):
+    """
+    更新文件2的外卖组织结构，并为文件3添加外卖组织结构列
+
+    :param df1: 霸州乡镇商家明细，为None时不调整组织结构
+    :param df2: 海豚_合作商商家数据
+    :param df3: 日账单
+    :param log: 输出处理信息的函数
+    :param township_org: 文件1中的商家统一归入的组织结构，为None时不调整
+    :return: (更新后的df2, 添加组织结构后的df3, 缺失组织结构的商家ID列表)
+    """
+    # 商家ID在读取时已转换为统一类型（见billSchema），这里直接比较，不再转换为字符串
+    if df1 is not None:
+        file1_ids, file2_ids, file3_ids = billSchema.merchant_keys(
+            df1[MERCHANT_ID_COL], df2[MERCHANT_ID_COL], df3[MERCHANT_ID_COL])
+    else:
+        file2_ids, file3_ids = billSchema.merchant_keys(df2[MERCHANT_ID_COL], df3[MERCHANT_ID_COL])
+
+    # 第一步：根据文件1中的商家ID，更新文件2中对应行的外卖组织结构为township_org（如"霸州三组"）
+    if df1 is not None and township_org:
+        # 更新文件2中匹配的行
+        mask = file2_ids.isin(file1_ids.unique())
+        original_structure_count = df2.loc[mask, ORG_STRUCTURE_COL].value_counts().loc[lambda counts: counts > 0]
+        log(f"\n更新前文件2中匹配商家ID的外卖组织结构分布: {original_structure_count.to_dict()}")
+
+        # 统计要更改的行数
+        rows_to_update = mask.sum()
+        log(f"将更改 {rows_to_update} 行数据的外卖组织结构为'{township_org}'")
+
+        # 执行更新
+        billSchema.set_category_value(df2, ORG_STRUCTURE_COL, mask, township_org)
+
+    # 第二步：根据更新后的文件2，向文件3添加外卖组织结构列
+    # 创建商家ID到外卖组织结构的映射，同一商家ID出现多次时以最后一行为准
+    orgs = pd.Series(df2[ORG_STRUCTURE_COL].to_numpy(dtype=object), index=file2_ids.to_numpy())
+    merchant_to_org = orgs[~orgs.index.duplicated(keep='last')]
+
+    # 向文件3添加外卖组织结构列
+    df3[ORG_STRUCTURE_COL] = file3_ids.map(merchant_to_org).to_numpy(dtype=object)
+
+    # 检查文件3中有多少行没有对应的组织结构
+    missing_org_mask = df3[ORG_STRUCTURE_COL].isna()
+    missing_org_count = missing_org_mask.sum()
+    log(f"\n文件3中有 {missing_org_count} 行数据没有对应的外卖组织结构")
+
+    missing_ids = []
+    # 打印前5个缺失组织结构的商家ID
+    if missing_org_count > 0:
+        missing_ids = df3.loc[missing_org_mask, MERCHANT_ID_COL].tolist()
+        log("\n前5个缺失外卖组织结构的商家ID:")
+        for i, id_value in enumerate(missing_ids[:5], 1):
+            log(f"{i}. {id_value}")
+
+        # 额外检查：这些ID是否在文件2中存在
+        missing_keys = file3_ids[missing_org_mask]
+        ids_not_in_file2 = missing_keys[~missing_keys.isin(file2_ids)].unique()
+        if len(ids_not_in_file2):
+            log(f"\n在文件2中不存在的商家ID数量: {len(ids_not_in_file2)}")
+            log("前5个在文件2中不存在的ID样例:")
+            for i, id_value in enumerate(ids_not_in_file2[:5], 1):
+                log(f"{i}. {id_value}")
+
+        # 为缺失的组织结构设置默认值
+        df3[ORG_STRUCTURE_COL] = df3[ORG_STRUCTURE_COL].fillna(DEFAULT_ORG)
+        log(f"\n已将缺失的外卖组织结构设置为 '{DEFAULT_ORG}'")
+
+    # 组织结构只有少数几种取值，以category保存
+    df3[ORG_STRUCTURE_COL] = df3[ORG_STRUCTURE_COL].astype('category')
+
+    # 统计结果
+    org_counts = df3[ORG_STRUCTURE_COL].value_counts().to_dict()
+    log(f"\n文件3中外卖组织结构的分布: {org_counts}")
+
+    return df2, df3, missing_ids
+
+
+def tag_organizations_with_index(df1, df3, index, log=print, township_org=TOWNSHIP_ORG):
+    """
+    使用持久化的商家索引为文件3添加外卖组织结构列，无需读取文件2
+
+    :param df1: 霸州乡镇商家明细，为None时不调整组织结构
+    :param df3: 日账单
+    :param index: merchantIndex.load_index/update_index返回的索引
+    :param log: 输出处理信息的函数
+    :param township_org: 文件1中的商家统一归入的组织结构，为None时不调整
+    :return: (添加组织结构后的df3, 缺失组织结构的商家ID列表)
+    """
+    merchant_ids = merchantIndex.to_merchant_ids(df3[MERCHANT_ID_COL])
+    orgs = merchantIndex.lookup(index, merchant_ids)
+    in_directory = merchantIndex.contains(index, merchant_ids)
+
+    # 文件1中的商家统一归入township_org（如"霸州三组"）
+    if df1 is not None and township_org:
+        township = np.isin(merchant_ids, merchantIndex.to_merchant_ids(df1[MERCHANT_ID_COL])) & in_directory
+        log(f"\n将 {township.sum()} 行账单数据的外卖组织结构设置为'{township_org}'")
+        orgs[township] = township_org
+    df3[ORG_STRUCTURE_COL] = orgs
+
+    missing_org_mask = df3[ORG_STRUCTURE_COL].isna().to_numpy()
+    missing_org_count = missing_org_mask.sum()
+    log(f"\n文件3中有 {missing_org_count} 行数据没有对应的外卖组织结构")
+
+    missing_ids = []
+    if missing_org_count > 0:
+        missing_ids = df3.loc[missing_org_mask, MERCHANT_ID_COL].tolist()
+        log("\n前5个缺失外卖组织结构的商家ID:")
+        for i, id_value in enumerate(missing_ids[:5], 1):
+            log(f"{i}. {id_value}")
+
+        ids_not_in_directory = df3.loc[missing_org_mask & ~in_directory, MERCHANT_ID_COL].unique()
+        if len(ids_not_in_directory):
+            log(f"\n在商家索引中不存在的商家ID数量: {len(ids_not_in_directory)}")
+            log("前5个在商家索引中不存在的ID样例:")
+            for i, id_value in enumerate(ids_not_in_directory[:5], 1):
+                log(f"{i}. {id_value}")
+
+        df3[ORG_STRUCTURE_COL] = df3[ORG_STRUCTURE_COL].fillna(DEFAULT_ORG)
+        log(f"\n已将缺失的外卖组织结构设置为 '{DEFAULT_ORG}'")
+
+    df3[ORG_STRUCTURE_COL] = df3[ORG_STRUCTURE_COL].astype('category')
+    org_counts = df3[ORG_STRUCTURE_COL].value_counts().to_dict()
+    log(f"\n文件3中外卖组织结构的分布: {org_counts}")
+    return df3, missing_ids
+
+
+def split_by_organization(df3):
+    """按外卖组织结构分组，返回 {组织结构: 分组数据}"""
+    return {org_name: group_data for org_name, group_data in df3.groupby(ORG_STRUCTURE_COL, observed=True)}
+
+
+def save_outputs(df2, df3, missing_ids, file2_path, file3_path, output_folder, log=print,
+                 write_full_copy=True, workers=None, progress=None):
+    """
+    保存分组文件、更新后的文件2和文件3以及缺失组织结构的商家ID列表，所有文件在进程池中并行写出
+
+    :param df2: 更新后的文件2，为None时（使用商家索引）不保存文件2
+    :param write_full_copy: 是否保存完整的更新后文件3（内容与分组文件合计相同）
+    :param workers: 写文件的进程数，默认为CPU核数
+    :param progress: 每写完一个文件调用一次 progress(已写出的文件数, 文件总数, 说明)
+    :return: {组织结构: 分组数据}
+    """
+    # 第三步：按外卖组织结构分组并保存为不同的Excel文件
+    base_name = os.path.splitext(os.path.basename(file3_path))[0]
+    groups = split_by_organization(df3)
+    jobs = [(group_data, os.path.join(output_folder, f"{base_name}_{org_name}.xlsx"))
+            for org_name, group_data in groups.items()]
+    group_count = len(jobs)
+
+    # 更新后的文件2
+    if df2 is not None:
+        updated_file2_path = os.path.join(output_folder, "updated_" + os.path.basename(file2_path))
+        jobs.append((df2, updated_file2_path))
 
-    # 创建用于显示信息的Text组件
-    text_widget = tk.Text(root, height=20, width=80)
-    text_widget.pack()
+    # 完整的处理后的文件3（包含组织结构列）
+    if write_full_copy:
+        updated_file3_path = os.path.join(output_folder, "updated_" + os.path.basename(file3_path))
+        jobs.append((df3, updated_file3_path))
 
-    def append_text(message):
-        text_widget.insert(tk.END, message + "\n")
-        text_widget.see(tk.END)
+    # 缺失组织结构的商家ID
+    if missing_ids:
+        missing_ids_path = os.path.join(output_folder, f"{base_name}_缺失组织结构ID列表.xlsx")
+        jobs.append((pd.DataFrame({MERCHANT_ID_COL: missing_ids}), missing_ids_path))
 
-    append_text("请选择第一个包含商家ID的文件(霸州乡镇商家明细)...")
+    results = write_frames(jobs, workers, progress)
+
+    # 记录处理的行数
+    total_processed = 0
+    for output_path, rows in results[:group_count]:
+        log(f"已保存 {rows} 行数据到 {os.path.basename(output_path)}")
+        total_processed += rows
+
+    # 验证所有数据都被处理
+    log(f"\n总共处理了 {total_processed} 行数据，原始文件3有 {len(df3)} 行数据")
+    if total_processed != len(df3):
+        log(f"警告：处理的数据行数与原始文件不一致，差异为 {len(df3) - total_processed} 行")
+    else:
+        log("验证成功：所有数据都已正确处理并保存到各分组文件中")
+
+    for output_path, _ in results[group_count:]:
+        log(f"已保存 {output_path}")
+
+    return groups
+
+
+def ask_inputs(log=print):
+    """
+    依次选择三个输入文件和输出文件夹，需要在主线程中调用
+
+    :return: 输入参数字典，未选择时返回None
+    """
+    log("请选择第一个包含商家ID的文件(霸州乡镇商家明细)...")
     file1_path = select_file("选择第一个文件")
     if not file1_path:
         messagebox.showerror("错误", "未选择文件，程序退出")
-        root.destroy()
-        return
+        return None
 
-    append_text("请选择第二个包含商家ID和外卖组织结构的文件(海豚_合作商商家数据)...")
+    log("请选择第二个包含商家ID和外卖组织结构的文件(海豚_合作商商家数据)...")
     file2_path = select_file("选择第二个文件")
     if not file2_path:
         messagebox.showerror("错误", "未选择文件，程序退出")
-        root.destroy()
-        return
+        return None
 
-    append_text("请选择第三个包含商家ID和一系列数据的文件(淮安卓美网络科技有限公司)...")
+    log("请选择第三个包含商家ID和一系列数据的文件(淮安卓美网络科技有限公司)...")
     file3_path = select_file("选择第三个文件")
     if not file3_path:
         messagebox.showerror("错误", "未选择文件，程序退出")
-        root.destroy()
-        return
+        return None
 
-    append_text("请选择输出文件夹(最好统一存在一个文件夹(用于Test2))")
+    log("请选择输出文件夹(最好统一存在一个文件夹(用于Test2))")
     output_folder = select_output_folder()
     if not output_folder:
         messagebox.showerror("错误", "未选择输出文件夹，程序退出")
-        root.destroy()
-        return
-
-    append_text(f"已选择输出文件夹：{output_folder}")
-
-    # 固定列名
-    merchant_id_col1 = "商家ID"  # 文件1中的商家ID列名
-    merchant_id_col2 = "商家ID"  # 文件2中的商家ID列名
-    org_structure_col = "外卖组织结构"  # 文件2中的外卖组织结构列名
-    merchant_id_col3 = "商家ID"  # 文件3中的商家ID列名
-
-    # 读取三个文件
-    try:
-        df1 = pd.read_excel(file1_path)
-        df2 = pd.read_excel(file2_path)
-        df3 = pd.read_excel(file3_path)
-
-        append_text(f"\n文件1包含 {len(df1)} 行数据")
-        append_text(f"文件2包含 {len(df2)} 行数据")
-        append_text(f"文件3包含 {len(df3)} 行数据")
+        return None
+
+    log(f"已选择输出文件夹：{output_folder}")
+    return {'file1_path': file1_path, 'file2_path': file2_path, 'file3_path': file3_path,
+            'output_folder': output_folder}
+
+
+def run_stage(inputs, log=print, progress=None):
+    """
+    读取三个文件、添加组织结构并写出分组文件，可在后台线程中执行
+
+    :param inputs: ask_inputs返回的输入参数
+    :param progress: 报告进度的函数 progress(已完成, 总数, 说明)
+    :return: 输出文件夹
+    """
+    progress = progress or (lambda done, total=None, label=None: None)
+    file1_path, file2_path, file3_path = inputs['file1_path'], inputs['file2_path'], inputs['file3_path']
+    output_folder = inputs['output_folder']
+
+    with profiled_run('dataPreprocessing', output_folder) as run:
+        with span('读取文件'):
+            # 文件1只用到商家ID列，流式读取该列即可
+            progress(0, 3, '读取文件')
+            df1 = billSchema.read_bill(file1_path, columns=[MERCHANT_ID_COL], log=log)
+            progress(1, 3, '读取文件')
+            df2 = billSchema.read_bill(file2_path, log=log)
+            progress(2, 3, '读取文件')
+            df3 = billSchema.read_bill(file3_path, log=log)
+            progress(3, 3, '读取文件')
+
+        log(f"\n文件1包含 {len(df1)} 行数据")
+        log(f"文件2包含 {len(df2)} 行数据")
+        log(f"文件3包含 {len(df3)} 行数据")
 
         # 检查输入的列名是否存在
-        if merchant_id_col1 not in df1.columns:
-            messagebox.showerror("错误", f"列 '{merchant_id_col1}' 在文件1中不存在")
-            root.destroy()
-            return
-        if merchant_id_col2 not in df2.columns or org_structure_col not in df2.columns:
-            messagebox.showerror("错误", "列名在文件2中不存在")
-            root.destroy()
-            return
-        if merchant_id_col3 not in df3.columns:
-            messagebox.showerror("错误", f"列 '{merchant_id_col3}' 在文件3中不存在")
-            root.destroy()
-            return
-
-        # 第一步：根据文件1中的商家ID，更新文件2中对应行的外卖组织结构为"霸州三组"
-        # 获取文件1中的商家ID列表
-        merchants_in_file1 = set(df1[merchant_id_col1].astype(str))
-
-        # 更新文件2中匹配的行
-        mask = df2[merchant_id_col2].astype(str).isin(merchants_in_file1)
-        original_structure_count = df2[mask][org_structure_col].value_counts().to_dict()
-        append_text(f"\n更新前文件2中匹配商家ID的外卖组织结构分布: {original_structure_count}")
-
-        # 统计要更改的行数
-        rows_to_update = mask.sum()
-        append_text(f"将更改 {rows_to_update} 行数据的外卖组织结构为'霸州三组'")
-
-        # 执行更新
-        df2.loc[mask, org_structure_col] = "霸州三组"
-
-        # 第二步：根据更新后的文件2，向文件3添加外卖组织结构列
-        # 创建商家ID到外卖组织结构的映射
-        merchant_to_org = dict(zip(df2[merchant_id_col2].astype(str), df2[org_structure_col]))
-
-        # 向文件3添加外卖组织结构列
-        df3[org_structure_col] = df3[merchant_id_col3].astype(str).map(merchant_to_org)
-
-        # 检查文件3中有多少行没有对应的组织结构
-        missing_org_mask = df3[org_structure_col].isna()
-        missing_org_count = missing_org_mask.sum()
-        append_text(f"\n文件3中有 {missing_org_count} 行数据没有对应的外卖组织结构")
-
-        # 打印前5个缺失组织结构的商家ID
-        if missing_org_count > 0:
-            missing_ids = df3.loc[missing_org_mask, merchant_id_col3].astype(str).tolist()
-            append_text("\n前5个缺失外卖组织结构的商家ID:")
-            for i, id_value in enumerate(missing_ids[:5], 1):
-                append_text(f"{i}. {id_value}")
-
-            # 额外检查：这些ID是否在文件2中存在
-            missing_ids_set = set(missing_ids)
-            file2_ids_set = set(df2[merchant_id_col2].astype(str))
-            ids_not_in_file2 = missing_ids_set - file2_ids_set
-            if ids_not_in_file2:
-                append_text(f"\n在文件2中不存在的商家ID数量: {len(ids_not_in_file2)}")
-                append_text("前5个在文件2中不存在的ID样例:")
-                for i, id_value in enumerate(list(ids_not_in_file2)[:5], 1):
-                    append_text(f"{i}. {id_value}")
-
-            # 为缺失的组织结构设置默认值
-            default_org = "未知组织结构"
-            df3[org_structure_col].fillna(default_org, inplace=True)
-            append_text(f"\n已将缺失的外卖组织结构设置为 '{default_org}'")
-
-        # 统计结果
-        org_counts = df3[org_structure_col].value_counts().to_dict()
-        append_text(f"\n文件3中外卖组织结构的分布: {org_counts}")
-
-        # 第三步：按外卖组织结构分组并保存为不同的Excel文件
-        base_name = os.path.splitext(os.path.basename(file3_path))[0]
-
-        # 记录处理的行数
-        total_processed = 0
-
-        # 按组织结构分组
-        for org_name, group_data in df3.groupby(org_structure_col):
-            output_name = f"{base_name}_{org_name}.xlsx"
-            output_path = os.path.join(output_folder, output_name)
-            group_data.to_excel(output_path, index=False)
-            append_text(f"已保存 {len(group_data)} 行数据到 {output_name}")
-            total_processed += len(group_data)
-
-        # 验证所有数据都被处理
-        append_text(f"\n总共处理了 {total_processed} 行数据，原始文件3有 {len(df3)} 行数据")
-        if total_processed != len(df3):
-            append_text(f"警告：处理的数据行数与原始文件不一致，差异为 {len(df3) - total_processed} 行")
-        else:
-            append_text("验证成功：所有数据都已正确处理并保存到各分组文件中")
-
-        # 保存更新后的文件2
-        updated_file2_path = os.path.join(output_folder, "updated_" + os.path.basename(file2_path))
-        df2.to_excel(updated_file2_path, index=False)
-        append_text(f"\n已保存更新后的文件2到 {updated_file2_path}")
-
-        # 保存完整的处理后的文件3（包含组织结构列）
-        updated_file3_path = os.path.join(output_folder, "updated_" + os.path.basename(file3_path))
-        df3.to_excel(updated_file3_path, index=False)
-        append_text(f"已保存更新后的文件3到 {updated_file3_path}")
+        error = check_columns(df1, df2, df3)
+        if error:
+            raise ValueError(error)
+
+        progress(None, None, '添加组织结构')
+        with span('添加组织结构'):
+            df2, df3, missing_ids = tag_organizations(df1, df2, df3, log)
+        with span('写出文件'):
+            save_outputs(df2, df3, missing_ids, file2_path, file3_path, output_folder, log, progress=progress)
+
+    log("\n处理完成！")
+    log(format_report(run))
+    return output_folder
 
-        # 保存缺失组织结构的商家ID到单独文件
-        if missing_org_count > 0:
-            missing_ids_df = pd.DataFrame({merchant_id_col3: missing_ids})
-            missing_ids_path = os.path.join(output_folder, f"{base_name}_缺失组织结构ID列表.xlsx")
-            missing_ids_df.to_excel(missing_ids_path, index=False)
-            append_text(f"已保存缺失组织结构的商家ID列表到 {missing_ids_path}")
 
-        append_text("\n处理完成！")
+def main():
+    # 创建主界面，处理在后台线程中执行，窗口保持响应
+    root = tk.Tk()
+    root.title("文件处理程序")
+    panel = backgroundTask.create_panel(root)
 
-    except Exception as e:
-        messagebox.showerror("错误", f"处理过程中发生错误: {e}")
+    inputs = ask_inputs(panel['log'])
+    if not inputs:
         root.destroy()
+        return
 
+    backgroundTask.start_task(panel, lambda task: run_stage(inputs, task['log'], task['progress']))
     root.mainloop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
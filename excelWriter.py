@@ -0,0 +1,91 @@
+"""
+并行写出多个Excel文件
+
+每个DataFrame写成一个单独的xlsx文件，多个文件在进程池中同时写出。安装了xlsxwriter时使用其
+constant_memory模式逐行写入，否则退化为pandas默认的openpyxl引擎。
+单元格总数少于PARALLEL_MIN_CELLS时在当前进程中依次写出：启动进程池（Windows和打包后的程序使用spawn，
+需要重新导入pandas）并传递数据的开销比写出少量小文件更大。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import count, span
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# 未指定进程数时，单元格总数达到该值才使用进程池
+PARALLEL_MIN_CELLS = 200000
+
+
+def _write_with_xlsxwriter(df, output_path):
+    """使用xlsxwriter的constant_memory模式逐行写入，写完一行即释放该行的内存"""
+    workbook = xlsxwriter.Workbook(output_path, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_numbers': False,
+        'strings_to_urls': False,
+    })
+    try:
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, [str(col) for col in df.columns])
+        # 空值写成空单元格
+        values = df.astype(object).where(df.notna(), None)
+        for row_index, row in enumerate(values.itertuples(index=False, name=None), 1):
+            worksheet.write_row(row_index, 0, row)
+    finally:
+        workbook.close()
+
+
+def write_frame(job):
+    """
+    写出单个Excel文件，可作为进程池任务
+
+    :param job: (DataFrame, 输出文件路径)
+    :return: (输出文件路径, 写出的行数)
+    """
+    df, output_path = job
+    if xlsxwriter is not None:
+        _write_with_xlsxwriter(df, output_path)
+    else:
+        df.to_excel(output_path, index=False)
+    return output_path, len(df)
+
+
+def write_frames(jobs, workers=None, progress=None):
+    """
+    并行写出多个Excel文件
+
+    :param jobs: [(DataFrame, 输出文件路径)]
+    :param workers: 进程数，默认为CPU核数与文件数中的较小值（单元格总数少于PARALLEL_MIN_CELLS时为1），
+                    为1时在当前进程中依次写出
+    :param progress: 每写完一个文件调用一次 progress(已写出的文件数, 文件总数, '写出文件')，
+                     progress抛出异常（例如取消任务）时尚未开始的文件不再写出
+    :return: [(输出文件路径, 写出的行数)]，顺序与jobs一致
+    """
+    if not jobs:
+        return []
+    cells = sum((len(df) + 1) * len(df.columns) for df, _ in jobs)
+    if not workers:
+        workers = min(len(jobs), os.cpu_count() or 1) if cells >= PARALLEL_MIN_CELLS else 1
+    results = []
+    with span('写出Excel'):
+        if workers <= 1:
+            for job in jobs:
+                results.append(write_frame(job))
+                if progress:
+                    progress(len(results), len(jobs), '写出文件')
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            try:
+                for result in executor.map(write_frame, jobs):
+                    results.append(result)
+                    if progress:
+                        progress(len(results), len(jobs), '写出文件')
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+    count('files_written', len(jobs))
+    count('cells_written', cells)
+    return results
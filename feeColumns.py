@@ -0,0 +1,51 @@
+"""
+日账单费用列的定义
+
+COLUMN_MAPPING 为日账单中的费用列到当日汇总列名的映射，statisticDay、billAggregator、billStore
+和rollupCube共用，单独放在本模块中避免相互导入。
+"""
+import re
+
+
+# 定义列映射关系
+COLUMN_MAPPING = {
+    '商业支持服务费(元)': '收商家服务费(元)',
+    '企客履约服务费': None,
+    '一口价服务费(元)': '一口价服务费(元)',
+    '配送费(元)': '用户配送费(元)',
+    '活动款(元)': '活动款(元)',
+    '竞价考核': '竞价考核(元)',
+    '罚款(元)': '罚款(元)',
+    '雇主险(元)': '雇主险(元)',
+    '非雇主责任险(元)': '非雇主责任险(元)',
+    '邀新奖励支出(元)': '邀新奖励支出(元)',
+    '省钱包售卖合作商承担': '省钱包售卖合作商承担',
+    '省钱包售卖合作商承担-退款': '省钱包售卖合作商承担-退款',
+    '二次配送费付合作商': '二次配送费付合作商',
+    '二次配送费付合作商-退款': '二次配送费付合作商-退款',
+    '合作商广告分成': '合作商广告分成',
+    '合作商奖励': '合作商奖励',
+    '合作商服务费': '合作商服务费',
+    '合作商服务费退款': '合作商服务费退款',
+    '关爱基金': '关爱基金',
+    '商户服务费返还激励': '商户服务费返还激励',
+    '省钱包售卖返还': '省钱包售卖返还',
+    '合作商售后赔付费用': '合作商售后赔付费用',
+    '合作商成本调账': '合作商成本调账',
+    '春节服务费': '春节服务费',
+    '省钱包核销美团承担': '省钱包核销美团承担',
+    '拼好饭拼单宝': '拼好饭拼单宝',
+    '经营权交易服务费': '经营权交易服务费'
+}
+
+
+# 需要汇总的目标列名（没有替换值的列不汇总）
+FEE_TARGETS = tuple(target for target, replacement in COLUMN_MAPPING.items() if replacement)
+
+# 分组文件名中的账单日期，例如 ...-2025-03-13-日账单【到家】..._高碑店一组.xlsx
+BILL_DATE_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def is_fee_column(column):
+    """判断列名是否对应COLUMN_MAPPING中需要汇总的费用列"""
+    return any(target in column for target in FEE_TARGETS)
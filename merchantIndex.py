@@ -0,0 +1,222 @@
+"""
+商家ID到外卖组织结构的持久化索引
+
+索引由海豚_合作商商家数据构建，保存为一个文件夹：
+    v<版本>/ids.npy    按升序排列的商家ID（int64）
+    v<版本>/codes.npy  与商家ID对应的组织结构编号（int32，-1表示组织结构为空）
+    meta.json          当前版本号、组织结构名称列表、已读取文件的哈希值和当前使用的导出文件的导出时间
+商家ID数组以内存映射方式加载，批量查询使用二分查找。每次保存都写入新的版本文件夹，再替换meta.json
+指向新版本：Windows上无法替换仍被内存映射的文件，已加载的旧版本不受影响，不再使用后才删除。
+
+每个海豚文件都是完整的商家列表：导出时间（取自文件名中的 yyyymmdd_hhmmss，没有时取文件修改时间）
+不早于当前索引的文件会替换整个索引，新文件中已没有的商家随之删除；导出时间更早的文件不会覆盖
+较新的组织结构。同一个文件不会被重复读取。商家ID不是整数的行不导入，并输出提示。
+"""
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from billCache import file_digest
+from xlsxReader import read_columns
+
+MERCHANT_ID_COL = "商家ID"
+ORG_STRUCTURE_COL = "外卖组织结构"
+NO_ORG = -1
+# 海豚文件名中的导出时间，例如 ..._1_20250315_145729_7469372.xlsx
+EXPORT_TIME_PATTERN = re.compile(r'_(\d{8})_(\d{6})(?:_|\.)')
+
+
+def empty_index():
+    """创建空索引"""
+    return {'ids': np.zeros(0, dtype=np.int64), 'codes': np.zeros(0, dtype=np.int32), 'orgs': [], 'sources': [],
+            'exported_at': None, 'version': 0}
+
+
+def _numeric_ids(values):
+    numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+    # 小数和负数不是有效的商家ID
+    return numeric.where((numeric % 1 == 0) & (numeric >= 0))
+
+
+def invalid_merchant_ids(values):
+    """非空但不是非负整数的商家ID（例如文本或小数）的布尔数组"""
+    series = pd.Series(values)
+    return (series.notna() & _numeric_ids(series).isna()).to_numpy()
+
+
+def to_merchant_ids(values):
+    """将商家ID列转换为int64数组，空值和无法转换为整数的值为-1"""
+    return _numeric_ids(values).fillna(-1).astype(np.int64).to_numpy()
+
+
+def export_time(export_path):
+    """海豚文件的导出时间，文件名中没有导出时间时使用文件修改时间"""
+    match = EXPORT_TIME_PATTERN.search(os.path.basename(export_path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S').isoformat()
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(export_path)).isoformat()
+
+
+def _version_dir(index_dir, version):
+    """某个版本的数组所在的文件夹，版本0为旧格式（数组直接保存在索引文件夹中）"""
+    return os.path.join(index_dir, f'v{version}') if version else index_dir
+
+
+def load_index(index_dir):
+    """
+    读取索引，商家ID和组织结构编号以内存映射方式加载
+
+    :return: 索引字典，索引不存在时返回空索引
+    """
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return empty_index()
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    version = meta.get('version', 0)
+    data_dir = _version_dir(index_dir, version)
+    return {
+        'ids': np.load(os.path.join(data_dir, 'ids.npy'), mmap_mode='r'),
+        'codes': np.load(os.path.join(data_dir, 'codes.npy'), mmap_mode='r'),
+        'orgs': meta['orgs'],
+        'sources': meta['sources'],
+        'exported_at': meta.get('exported_at'),
+        'version': version,
+    }
+
+
+def _remove_old_versions(index_dir, current):
+    """删除当前版本以外的数组文件，仍被内存映射（Windows）而无法删除的留到下次保存时再删除"""
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) != current:
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in ('ids.npy', 'codes.npy'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def save_index(index_dir, index):
+    """
+    保存索引：数组写入新的版本文件夹，再替换meta.json指向新版本，不改动正在使用的旧版本文件
+
+    :return: 新的版本号
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    current = 0
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            current = json.load(f).get('version', 0)
+    version = max(current, index.get('version', 0)) + 1
+    data_dir = _version_dir(index_dir, version)
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ('ids', 'codes'):
+        np.save(os.path.join(data_dir, f'{name}.npy'), np.asarray(index[name]))
+    temp_path = os.path.join(index_dir, 'meta.tmp.json')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'orgs': index['orgs'], 'sources': index['sources'],
+                   'exported_at': index.get('exported_at')}, f, ensure_ascii=False)
+    os.replace(temp_path, meta_path)
+    _remove_old_versions(index_dir, version)
+    return version
+
+
+def merge_frame(index, df):
+    """
+    将商家数据合并进索引，df中出现的商家以df为准，同一商家ID出现多次时以最后一行为准
+
+    :param df: 包含商家ID和外卖组织结构列的DataFrame
+    :return: 新的索引字典
+    """
+    orgs = list(index['orgs'])
+    org_codes = {org: code for code, org in enumerate(orgs)}
+    for org in df[ORG_STRUCTURE_COL].dropna().unique():
+        if org not in org_codes:
+            org_codes[org] = len(orgs)
+            orgs.append(org)
+
+    new_ids = to_merchant_ids(df[MERCHANT_ID_COL])
+    new_codes = df[ORG_STRUCTURE_COL].map(org_codes).fillna(NO_ORG).astype(np.int32).to_numpy()
+    valid = new_ids >= 0
+
+    # 旧数据在前、新数据在后，去重时保留最后出现的值
+    ids = np.concatenate([np.asarray(index['ids']), new_ids[valid]])
+    codes = np.concatenate([np.asarray(index['codes']), new_codes[valid]])
+    reversed_unique_ids, reversed_positions = np.unique(ids[::-1], return_index=True)
+    positions = len(ids) - 1 - reversed_positions
+    return {'ids': reversed_unique_ids, 'codes': codes[positions], 'orgs': orgs, 'sources': list(index['sources']),
+            'exported_at': index.get('exported_at'), 'version': index.get('version', 0)}
+
+
+def update_index(index_dir, export_path, log=print):
+    """
+    用海豚_合作商商家数据文件替换索引，已读取过的文件和导出时间早于当前索引的文件直接跳过
+
+    :return: 更新后的索引字典
+    """
+    index = load_index(index_dir)
+    digest = file_digest(export_path)
+    if digest in index['sources']:
+        log(f"商家索引已包含 {os.path.basename(export_path)}，无需重新读取")
+        return index
+    exported_at = export_time(export_path)
+    if index['exported_at'] and exported_at < index['exported_at']:
+        log(f"{os.path.basename(export_path)} 的导出时间 {exported_at} 早于当前商家索引（{index['exported_at']}），跳过")
+        return index
+
+    df = read_columns(export_path, columns=[MERCHANT_ID_COL, ORG_STRUCTURE_COL])
+    if MERCHANT_ID_COL not in df.columns or ORG_STRUCTURE_COL not in df.columns:
+        raise ValueError("列名在文件2中不存在")
+    invalid = invalid_merchant_ids(df[MERCHANT_ID_COL])
+    if invalid.any():
+        samples = ', '.join(str(value) for value in df.loc[invalid, MERCHANT_ID_COL].unique()[:5])
+        log(f"警告: {os.path.basename(export_path)} 中有 {invalid.sum()} 行商家ID不是整数，未导入: {samples}")
+
+    # 每个导出文件都是完整的商家列表，替换旧索引而不是合并
+    removed = np.setdiff1d(np.asarray(index['ids']), to_merchant_ids(df[MERCHANT_ID_COL]))
+    new_index = merge_frame(empty_index(), df[~invalid])
+    new_index['sources'] = list(index['sources']) + [digest]
+    new_index['exported_at'] = exported_at
+    save_index(index_dir, new_index)
+    log(f"商家索引已更新，共 {len(new_index['ids'])} 个商家" + (f"，删除 {len(removed)} 个已不存在的商家" if len(removed) else ""))
+    return load_index(index_dir)
+
+
+def _positions(index, merchant_ids):
+    """返回商家ID在索引中的位置，以及是否存在的布尔数组"""
+    ids = np.asarray(index['ids'])
+    merchant_ids = to_merchant_ids(merchant_ids)
+    if not len(ids):
+        return np.zeros(len(merchant_ids), dtype=np.int64), np.zeros(len(merchant_ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, merchant_ids), len(ids) - 1)
+    return positions, ids[positions] == merchant_ids
+
+
+def contains(index, merchant_ids):
+    """批量判断商家ID是否存在于索引中"""
+    return _positions(index, merchant_ids)[1]
+
+
+def lookup(index, merchant_ids):
+    """
+    批量查询商家ID对应的外卖组织结构
+
+    :return: 与merchant_ids等长的对象数组，找不到或组织结构为空时为NaN
+    """
+    positions, found = _positions(index, merchant_ids)
+    codes = np.full(len(found), NO_ORG, dtype=np.int64)
+    codes[found] = np.asarray(index['codes'])[positions[found]]
+    # 编号-1对应列表末尾的NaN
+    org_names = np.array(list(index['orgs']) + [np.nan], dtype=object)
+    return org_names[codes]
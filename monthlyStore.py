@@ -0,0 +1,162 @@
+"""
+每月汇总数据的增量存储
+
+每个区域每天的汇总值按 (区域, 日期, 列名) 存入SQLite，新的一天只需写入该天的数据，
+月汇总表Excel文件在需要时由存储中的数据导出，日期按真实日期排序。
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import workbookSession
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS areas (
+    area TEXT PRIMARY KEY,
+    area_order INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_summary (
+    area TEXT NOT NULL,
+    day TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    column_order INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (area, day, column_name)
+);
+"""
+
+
+def open_store(db_path):
+    """打开（必要时创建）汇总数据存储"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def is_empty(conn):
+    """存储中是否还没有任何数据"""
+    return conn.execute("SELECT 1 FROM daily_summary LIMIT 1").fetchone() is None
+
+
+def _to_float(value):
+    """转换为浮点数，空值或无法转换的值返回None"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(value) else value
+
+
+def _write_rows(conn, areas, rows):
+    """在一个事务中登记区域并写入 (区域, 日期, 列名, 列序号, 值)，同一天同一列已存在时覆盖"""
+    with conn:
+        for area in areas:
+            conn.execute(
+                "INSERT OR IGNORE INTO areas (area, area_order) "
+                "VALUES (?, (SELECT COALESCE(MAX(area_order), -1) + 1 FROM areas))", (area,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO daily_summary (area, day, column_name, column_order, value) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def _summary_rows(area, day, columns, values):
+    """一个区域一天的汇总值转换为待写入的行，日期列会被忽略"""
+    day_key = day.isoformat()
+    return [(area, day_key, column, order, _to_float(value))
+            for order, (column, value) in enumerate(zip(columns, values)) if column != '日期']
+
+
+def upsert_day(conn, day, summary_data):
+    """
+    写入一天的汇总数据，已存在的同一天数据会被覆盖
+
+    :param day: datetime.date
+    :param summary_data: {区域: 当日汇总}，每个DataFrame只有一行，日期列会被忽略
+    """
+    rows = []
+    for area, summary_df in summary_data.items():
+        rows.extend(_summary_rows(area, day, summary_df.columns, summary_df.iloc[0]))
+    _write_rows(conn, list(summary_data), rows)
+
+
+def load_month(conn, year, month):
+    """
+    读取某月所有区域的汇总数据
+
+    :return: {区域: 月度数据}，日期列格式为 'x月x日'，按真实日期排序
+    """
+    month_prefix = f"{year:04d}-{int(month):02d}-"
+    records = pd.read_sql_query(
+        "SELECT s.area, s.day, s.column_name, s.column_order, s.value "
+        "FROM daily_summary s JOIN areas a ON a.area = s.area "
+        "WHERE s.day LIKE ? ORDER BY a.area_order, s.day, s.column_order",
+        conn, params=(month_prefix + '%',))
+
+    monthly_df = {}
+    for area, area_records in records.groupby('area', sort=False):
+        column_order = (area_records.groupby('column_name')['column_order'].min()
+                        .sort_values().index.tolist())
+        df = area_records.pivot(index='day', columns='column_name', values='value')[column_order]
+        df.columns.name = None
+        days = pd.to_datetime(df.index)
+        df.insert(0, '日期', [f"{d.month}月{d.day}日" for d in days])
+        monthly_df[area] = df.reset_index(drop=True)
+    return monthly_df
+
+
+def export_workbook(conn, monthly_file, year, month):
+    """
+    将某月的汇总数据导出为月汇总表，每个区域一个工作表
+
+    :return: {区域: 月度数据}
+    """
+    monthly_df = load_month(conn, year, month)
+    with pd.ExcelWriter(monthly_file, engine='openpyxl') as writer:
+        for area, df in monthly_df.items():
+            df.to_excel(writer, sheet_name=area, index=False)
+    return monthly_df
+
+
+def _parse_summary_date(value, year):
+    """解析旧版月汇总表中的日期（'3月13日' 或Excel日期序号），无法解析时返回None"""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.date()
+    if isinstance(value, (int, float)) and not pd.isna(value):
+        return (datetime(1899, 12, 30) + timedelta(days=value)).date()
+    text = str(value).strip()
+    if '月' in text and '日' in text:
+        month_text, day_text = text.rstrip('日').split('月')
+        try:
+            return date(year, int(month_text), int(day_text))
+        except ValueError:
+            return None
+    return None
+
+
+def import_workbook(conn, monthly_file, year):
+    """
+    导入已有的月汇总表Excel文件，用于从旧版流程迁移
+
+    :return: 导入的 (区域, 日期) 数量
+    """
+    imported = 0
+    session = workbookSession.open_session(monthly_file)
+    try:
+        sheets = workbookSession.read_sheets(session)
+    finally:
+        # 导入后月汇总表会被重新导出，不保留旧文件的会话
+        workbookSession.close_sessions(monthly_file)
+    areas, rows = [], []
+    for area, df in sheets.items():
+        if '日期' not in df.columns:
+            continue
+        areas.append(area)
+        for values in df.itertuples(index=False, name=None):
+            day = _parse_summary_date(values[df.columns.get_loc('日期')], year)
+            if day is None:
+                continue
+            rows.extend(_summary_rows(area, day, df.columns, values))
+            imported += 1
+    _write_rows(conn, areas, rows)
+    return imported
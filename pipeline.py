@@ -0,0 +1,352 @@
+"""
+无界面批处理流程：在同一进程内依次执行 test1~test4，各阶段之间直接传递DataFrame
+
+配置文件为JSON格式，例如：
+{
+    "year": 2025,
+    "month": 3,
+    "township_merchants": "霸州乡镇商家明细.xlsx",
+    "merchant_base": "海豚_合作商商家数据.xlsx",
+    "bills": {"13": "淮安卓美...-2025-03-13-日账单【到家】.xlsx"},
+    "salary_workbook": "总商薪资摊销2025.3终(1).xls",
+    "delivery_workbook": "总商薪资摊销2025.3终(1).xls",
+    "expense_workbook": "盈利模式分析表2025.3(44).xls",
+    "salary_areas": "地区工资公式.json",
+    "merchant_index": "商家索引",
+    "output_folder": "输出"
+}
+配置了 merchant_index 时，商家组织结构从持久化索引中查询，merchant_base 只在内容变化时才会被读取，并替换导出时间更早的索引（见merchantIndex），
+此时不再输出 updated_ 开头的文件2。
+可选字段：write_split_files（是否输出分组文件）、write_full_copy（是否输出完整的 updated_ 日账单）、
+workers（并行进程数）、regions（地区配置文件，见regionRegistry）、company（地区配置中的合作商公司，
+默认为第一个）、bill_store（账单数据库文件，每天按组织结构拆分后的明细同时导入该数据库，见billStore）、
+rollup_cube（汇总立方体文件夹，每天按商家汇总后合并进立方体，见rollupCube）。
+
+同时处理多个合作商公司时，使用 companies 字段为每个公司指定各自的文件，未指定的字段沿用顶层配置：
+{
+    "year": 2025, "month": 3, "output_folder": "输出", "workers": 4,
+    "merchant_base": "海豚_合作商商家数据.xlsx",
+    "companies": {
+        "淮安卓美网络科技有限公司（高碑店市）": {"township_merchants": "...", "bills": {"13": "..."}},
+        "某某网络科技有限公司（邢台市）": {"bills": {"13": "..."}, "salary_workbook": "..."}
+    }
+}
+各公司的外卖组织结构、乡镇组织结构和工资公式取自地区配置，结果输出到 output_folder 下以公司名称命名的文件夹，
+顶层的 rollup_cube 同样按公司名称分为子文件夹（各公司并行更新，不能共用一个立方体）。
+所有公司共用一个进程池并行处理，多个公司共用的商家文件只解析一次。
+运行结束后在月份文件夹中生成 pipeline_耗时报告_<时间>.json，记录各阶段耗时和读写数量。
+
+用法：python pipeline.py config.json
+"""
+import argparse
+import json
+import os
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import dataPreprocessing
+import statisticDay
+import wagesCalculation
+import Statistics
+import billSchema
+import billStore
+import merchantIndex
+import rollupCube
+import workbookSession
+import regionRegistry
+from profiling import format_report, profiled_run, span
+
+REQUIRED_KEYS = ['year', 'month', 'bills', 'output_folder']
+
+
+def validate_company_config(config, name=''):
+    """校验单个公司的配置"""
+    prefix = f"{name} " if name else ''
+    missing = [key for key in REQUIRED_KEYS if key not in config]
+    if config.get('township_org') and 'township_merchants' not in config:
+        missing.append('township_merchants')
+    if missing:
+        raise ValueError(f"{prefix}配置缺少字段: {', '.join(missing)}")
+    if not config['bills']:
+        raise ValueError(f"{prefix}配置中未指定任何日账单文件")
+    if not config.get('merchant_base') and not config.get('merchant_index'):
+        raise ValueError(f"{prefix}配置中需要指定 merchant_base 或 merchant_index")
+
+
+def resolve_companies(config):
+    """
+    按地区配置展开每个合作商公司的完整配置
+
+    :return: {公司名称: 配置}，配置中增加了 organizations、township_org 和 areas 字段
+    """
+    registry = regionRegistry.load_registry(config.get('regions'))
+    if 'companies' in config:
+        overrides = config['companies']
+    else:
+        overrides = {config.get('company') or next(iter(registry)): {}}
+
+    base = {key: value for key, value in config.items() if key != 'companies'}
+    companies = {}
+    cube_owners = {}
+    for name, override in overrides.items():
+        entry = regionRegistry.get_company(name, registry)
+        company_config = dict(base, **override)
+        if 'companies' in config:
+            # 各公司在不同进程中同时读写，输出文件夹和汇总立方体按公司分开
+            for key in ('output_folder', 'rollup_cube'):
+                if config.get(key) and key not in override:
+                    company_config[key] = os.path.join(config[key], name)
+        if company_config.get('rollup_cube'):
+            cube_dir = os.path.abspath(company_config['rollup_cube'])
+            if cube_dir in cube_owners:
+                raise ValueError(f"公司 {cube_owners[cube_dir]} 和 {name} 的 rollup_cube 相同: "
+                                 f"{company_config['rollup_cube']}")
+            cube_owners[cube_dir] = name
+        company_config.update(company=name, organizations=entry['organizations'],
+                              township_org=entry.get('township_org'), areas=entry.get('salary_areas') or None)
+        validate_company_config(company_config, name)
+        companies[name] = company_config
+    return companies
+
+
+def load_config(config_path):
+    """读取并校验JSON配置文件"""
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    if 'companies' in config and not config['companies']:
+        raise ValueError("配置文件的 companies 中没有任何公司")
+    resolve_companies(config)
+    return config
+
+
+def run_preprocessing_and_daily(config, month_folder, log=print):
+    """
+    执行 test1 和 test2：为每天的日账单添加组织结构并生成当日汇总
+
+    :return: 更新后的月度汇总 {区域: 月度数据}
+    """
+    month = str(config['month'])
+    township_org = config.get('township_org', dataPreprocessing.TOWNSHIP_ORG)
+
+    df1 = None
+    if township_org and config.get('township_merchants'):
+        df1 = billSchema.read_bill(config['township_merchants'], columns=[dataPreprocessing.MERCHANT_ID_COL],
+                                   log=log)
+        log(f"文件1包含 {len(df1)} 行数据")
+
+    index, df2 = None, None
+    if config.get('merchant_index'):
+        if config.get('merchant_base'):
+            index = merchantIndex.update_index(config['merchant_index'], config['merchant_base'], log)
+        else:
+            index = merchantIndex.load_index(config['merchant_index'])
+    else:
+        df2 = billSchema.read_bill(config['merchant_base'], log=log)
+        log(f"文件2包含 {len(df2)} 行数据")
+
+    daily_summaries = {}
+    for day, bill_path in sorted(config['bills'].items(), key=lambda item: int(item[0])):
+        df2, daily_summaries[day] = process_bill(config, bill_path, day, month_folder, df1, df2, index, log)
+
+    # 所有日期处理完后一次性写入每月汇总存储，并导出一次每月总表
+    monthly_df = statisticDay.update_monthly_summary_days(month_folder, month, daily_summaries, config['year'])
+    statisticDay.export_monthly_summary(month_folder, month, config['year'])
+    log("每月总表更新完成。")
+    return monthly_df
+
+
+def process_bill(config, bill_path, day, month_folder, df1, df2, index, log=print):
+    """
+    处理一天的日账单：添加组织结构、按组织结构拆分并生成当日汇总文件（不更新每月总表）
+
+    :param df1: 乡镇商家明细，为None时不调整组织结构
+    :param df2: 海豚_合作商商家数据，使用商家索引时为None
+    :param index: 商家索引，为None时使用df2
+    :return: (更新后的df2, {区域: 当日汇总})
+    """
+    month = str(config['month'])
+    township_org = config.get('township_org', dataPreprocessing.TOWNSHIP_ORG)
+
+    log(f"\n===== 处理 {month}月{day}日 日账单 =====")
+    # 不输出分组文件时只需要汇总费用，读取时丢弃文本列
+    df3 = billSchema.read_bill(bill_path, drop_text=not config.get('write_split_files', True), log=log)
+    log(f"文件3包含 {len(df3)} 行数据")
+
+    if index is not None:
+        if dataPreprocessing.MERCHANT_ID_COL not in df3.columns:
+            raise ValueError(f"列 '{dataPreprocessing.MERCHANT_ID_COL}' 在文件3中不存在")
+        df3, missing_ids = dataPreprocessing.tag_organizations_with_index(df1, df3, index, log, township_org)
+    else:
+        error = dataPreprocessing.check_columns(df1, df2, df3)
+        if error:
+            raise ValueError(error)
+        df2, df3, missing_ids = dataPreprocessing.tag_organizations(df1, df2, df3, log, township_org)
+
+    if config.get('write_split_files', True):
+        groups = dataPreprocessing.save_outputs(df2, df3, missing_ids, config.get('merchant_base'), bill_path,
+                                                config['output_folder'], log, config.get('write_full_copy', True),
+                                                config.get('workers'))
+    else:
+        groups = dataPreprocessing.split_by_organization(df3)
+
+    if config.get('bill_store'):
+        conn = billStore.open_store(config['bill_store'])
+        try:
+            rows = billStore.ingest_groups(conn, groups, date(int(config['year']), int(month), int(day)), bill_path)
+        finally:
+            conn.close()
+        log(f"已将 {rows} 行账单明细导入 {config['bill_store']}")
+    if config.get('rollup_cube'):
+        rollupCube.update_cube(config['rollup_cube'], groups, date(int(config['year']), int(month), int(day)),
+                               bill_path, log)
+
+    summary_data = statisticDay.summarize_groups(groups, month, day, log, config.get('organizations'))
+    output_path = os.path.join(month_folder, f"{month}月{day}日外卖组织服务费汇总.xlsx")
+    statisticDay.write_daily_summary(output_path, summary_data, log)
+    log(f"当日汇总文件已保存到 {output_path}")
+    return df2, summary_data
+
+
+def run_salary(config, month_folder, log=print):
+    """执行 test3：生成工资计提汇总，返回工资数据DataFrame"""
+    end_day = max(int(day) for day in config['bills'])
+    # 地区公式文件优先，其次为地区配置中该公司的公式，都没有时使用wagesCalculation.AREAS
+    areas = wagesCalculation.load_areas(config['salary_areas']) if config.get('salary_areas') else config.get('areas')
+    wb = workbookSession.workbook(workbookSession.open_session(config['salary_workbook']))
+    headers, rows = wagesCalculation.build_salary_summary(wb, config['month'], end_day, config['year'], areas)
+    output_file = os.path.join(month_folder, "计提薪资.xlsx")
+    wagesCalculation.write_salary_summary(headers, rows, output_file)
+    log(f"工资计提汇总表已生成: {output_file}")
+    return pd.DataFrame(rows, columns=headers)
+
+
+def run_profit(config, month_folder, monthly_df, salary_df, log=print):
+    """执行 test4：生成各地区利润明细，返回输出文件路径"""
+    year, month = config['year'], config['month']
+    salary_df = Statistics.prepare_salary_df(salary_df, year, log)
+    delivery_df = Statistics.load_delivery_df(config['delivery_workbook'], year, log)
+    amort_dict, daily_expense_df = Statistics.load_expense_data(config['expense_workbook'], log, year)
+
+    sheets = Statistics.build_profit_sheets(monthly_df, salary_df, delivery_df, amort_dict, daily_expense_df, log,
+                                            config.get('workers'), year)
+    output_path = os.path.join(month_folder, f"{month}月汇总表_{year}年{month}月_processed.xlsx")
+    Statistics.write_profit_workbook(output_path, sheets, year, month, log)
+    log(f"处理完成，结果已保存至: {output_path}")
+    return output_path
+
+
+def run_pipeline(config, log=print):
+    """
+    按配置执行全部阶段，配置了多个合作商公司时并行处理
+
+    :param config: 配置字典，字段见模块说明
+    :param log: 输出处理信息的函数
+    :return: {公司名称: 耗时统计结果}，同时保存为各月份文件夹中的JSON报告
+    """
+    companies = resolve_companies(config)
+    if len(companies) == 1:
+        name, company_config = next(iter(companies.items()))
+        return {name: run_company(company_config, log)}
+    return run_companies(companies, config.get('workers'), log)
+
+
+def prepare_shared_inputs(companies, log=print):
+    """
+    在并行处理前读取多个公司共用的商家文件，各进程随后直接使用缓存，每个文件只解析一次；
+    共用的商家索引也在此时更新，避免多个进程同时写入
+    """
+    usage = {}
+    for company_config in companies.values():
+        for key in ('township_merchants', 'merchant_base'):
+            if company_config.get(key):
+                usage.setdefault((key, company_config[key], company_config.get('merchant_index')), []).append(
+                    company_config['company'])
+
+    for (key, path, index_dir), names in usage.items():
+        if key == 'merchant_base' and index_dir:
+            merchantIndex.update_index(index_dir, path, log)
+        elif len(names) > 1:
+            log(f"读取共用文件 {os.path.basename(path)}（{len(names)} 个公司）")
+            if key == 'township_merchants':
+                billSchema.read_bill(path, columns=[dataPreprocessing.MERCHANT_ID_COL], log=log)
+            else:
+                billSchema.read_bill(path, log=log)
+
+
+def _run_company_job(company_config):
+    """进程池任务：处理一个公司，输出信息前加上公司名称"""
+    name = company_config['company']
+    return name, run_company(company_config, log=lambda message: print(f"[{name}] {message}"))
+
+
+def run_companies(companies, workers=None, log=print):
+    """
+    在同一个进程池中并行处理多个公司，公司内部的文件写出不再另开进程
+
+    :param companies: resolve_companies返回的 {公司名称: 配置}
+    :param workers: 进程数，默认为CPU核数与公司数中的较小值
+    :return: {公司名称: 耗时统计结果}，顺序与companies一致
+    """
+    prepare_shared_inputs(companies, log)
+    jobs = [dict(company_config, workers=1) for company_config in companies.values()]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+
+    if workers <= 1:
+        results = dict(_run_company_job(job) for job in jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = dict(executor.map(_run_company_job, jobs))
+    for name, run in results.items():
+        log(f"{name} 处理完成，总耗时 {run['total_seconds']:.2f} 秒")
+    return results
+
+
+def run_company(config, log=print):
+    """
+    依次执行一个公司的全部阶段
+
+    :param config: resolve_companies展开后的单个公司配置
+    :return: 耗时统计结果，同时保存为月份文件夹中的JSON报告
+    """
+    os.makedirs(config['output_folder'], exist_ok=True)
+    month_folder = statisticDay.create_monthly_folder(config['output_folder'], config['month'], config['year'])
+
+    try:
+        with profiled_run('pipeline', month_folder) as run:
+            _run_stages(config, month_folder, log)
+    finally:
+        # 工资摊销、配送单量和费用明细在各阶段间共用同一次解析，运行结束后关闭
+        workbookSession.close_sessions()
+    log(format_report(run))
+    return run
+
+
+def _run_stages(config, month_folder, log):
+    """依次执行各阶段，每个阶段单独计时"""
+    with span('test1+test2'):
+        monthly_df = run_preprocessing_and_daily(config, month_folder, log)
+
+    if not config.get('salary_workbook'):
+        log("未配置工资摊销文件，跳过 test3 和 test4")
+        return
+    with span('test3'):
+        salary_df = run_salary(config, month_folder, log)
+
+    if not config.get('delivery_workbook') or not config.get('expense_workbook'):
+        log("未配置配送单量或费用明细文件，跳过 test4")
+        return
+    with span('test4'):
+        run_profit(config, month_folder, monthly_df, salary_df, log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批处理：依次执行 test1~test4")
+    parser.add_argument('config', help="JSON配置文件路径")
+    args = parser.parse_args()
+    run_pipeline(load_config(args.config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+阶段耗时统计
+
+用法：
+    with profiled_run('statisticDay', output_folder):
+        with span('读取文件'):
+            ...
+        count('rows_read', len(df))
+
+运行结束后在输出文件夹中生成 <名称>_耗时报告_<时间>.json，记录每个阶段的耗时和计数
+（读取行数、读取字节数、写出单元格数等）。设置环境变量 MERCHANT_PROFILE=1 或传入 profile=True
+时，同时保存cProfile结果 <名称>_<时间>.prof，可用 python -m pstats 或 snakeviz 查看。
+没有正在进行的统计时，span和count不做任何记录。
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_lock = threading.Lock()
+_local = threading.local()
+_current_run = None
+
+
+def _span_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name):
+    """记录一个阶段的耗时，嵌套的阶段名称以 / 连接"""
+    run = _current_run
+    if run is None:
+        yield
+        return
+    stack = _span_stack()
+    stack.append(name)
+    path = '/'.join(stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            entry = run['spans'].setdefault(path, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += elapsed
+            entry['calls'] += 1
+
+
+def count(name, amount=1):
+    """累加计数，例如 count('rows_read', len(df))"""
+    run = _current_run
+    if run is None:
+        return
+    with _lock:
+        run['counters'][name] = run['counters'].get(name, 0) + int(amount)
+
+
+@contextmanager
+def profiled_run(name, output_folder=None, profile=None):
+    """
+    统计一次完整运行，结束时写出JSON耗时报告
+
+    :param name: 运行名称，用于报告文件名
+    :param output_folder: 报告保存的文件夹，为None时不写文件
+    :param profile: 是否同时保存cProfile结果，默认由环境变量MERCHANT_PROFILE决定
+    :return: 上下文中得到运行记录字典，结束后包含完整的统计结果
+    """
+    global _current_run
+    if profile is None:
+        profile = bool(os.environ.get('MERCHANT_PROFILE'))
+    run = {'name': name, 'started_at': datetime.now().isoformat(timespec='seconds'), 'spans': {}, 'counters': {}}
+    previous_run, _current_run = _current_run, run
+    profiler = cProfile.Profile() if profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        if profiler:
+            profiler.disable()
+        run['total_seconds'] = round(time.perf_counter() - start, 4)
+        for entry in run['spans'].values():
+            entry['seconds'] = round(entry['seconds'], 4)
+        _current_run = previous_run
+
+        if output_folder:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            report_path = os.path.join(output_folder, f"{name}_耗时报告_{stamp}.json")
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(run, f, ensure_ascii=False, indent=2)
+            run['report_path'] = report_path
+            if profiler:
+                profile_path = os.path.join(output_folder, f"{name}_{stamp}.prof")
+                profiler.dump_stats(profile_path)
+                run['profile_path'] = profile_path
+
+
+def format_report(run):
+    """将统计结果格式化为便于在界面中显示的文本"""
+    lines = [f"总耗时 {run.get('total_seconds', 0):.2f} 秒"]
+    for path, entry in run['spans'].items():
+        lines.append(f"  {path}: {entry['seconds']:.2f} 秒 ({entry['calls']} 次)")
+    for name, value in run['counters'].items():
+        lines.append(f"  {name}: {value}")
+    return '\n'.join(lines)
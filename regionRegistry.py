@@ -0,0 +1,156 @@
+"""
+合作商公司、外卖组织结构和地区的配置
+
+配置文件为JSON格式，每个合作商公司一项，例如：
+{
+    "淮安卓美网络科技有限公司（高碑店市）": {
+        "organizations": {"高碑店一组": "高碑店", "邢台一组": "邢台"},
+        "township_org": "霸州三组",
+        "salary_areas": {"高碑店": "运营中心!W6+摊销人员!E6", "邢台": "运营中心!AA6"}
+    }
+}
+organizations 为外卖组织结构到统计区域的映射，顺序即输出工作表的顺序；township_org 为乡镇商家明细中的商家
+统一归入的组织结构，不需要时可省略；salary_areas 为各地区的工资计算公式（见wagesCalculation）。
+
+配置文件的位置依次取环境变量 MERCHANT_REGIONS、当前文件夹或程序所在文件夹下的 regions.json，
+都不存在时使用内置的默认配置。新增城市或区域只需修改配置文件，无需修改代码。
+"""
+import json
+import os
+import sys
+
+REGIONS_FILE = 'regions.json'
+DEFAULT_COMPANY = '淮安卓美网络科技有限公司（高碑店市）'
+
+DEFAULT_REGISTRY = {
+    DEFAULT_COMPANY: {
+        'organizations': {
+            '高碑店一组': '高碑店',
+            '高碑店二组': '白沟',
+            '高碑店三组': '新城',
+            '霸州一组': '霸州',
+            '霸州二组': '胜芳',
+            '霸州三组': '霸州乡镇'
+        },
+        'township_org': '霸州三组',
+        # 各地区工资计算公式（对应每月1日所在行）
+        'salary_areas': {
+            '高碑店': '运营中心!W6+摊销人员!E6+后线及站长!M6+业务侧薪资汇总!B3+配送总表!B3',
+            '白沟': '运营中心!X6+摊销人员!F6+后线及站长!AC6+业务侧薪资汇总!C3+配送总表!C3',
+            '新城': '新城工资!F2+配送总表!D3',
+            '霸州': '运营中心!Y6+摊销人员!M6+后线及站长!O46+业务侧薪资汇总!E3+配送总表!E3',
+            '胜芳': '运营中心!Z6+摊销人员!N6+后线及站长!X46+业务侧薪资汇总!F3+配送总表!F3',
+            '霸州乡镇': '配送总表!G3',
+            '邢台': '运营中心!AA6+后线及站长!AD86+业务侧薪资汇总!G3+配送总表!H3',
+            '下花园': '运营中心!AC6+摊销人员!U6+后线及站长!G125+业务侧薪资汇总!H3+配送总表!I3',
+            '万全': '运营中心!AD6+摊销人员!T6+后线及站长!O125+业务侧薪资汇总!I3+配送总表!J3'
+        }
+    }
+}
+
+_registry = None
+
+
+def find_registry_file():
+    """查找配置文件，找不到时返回None"""
+    env_path = os.environ.get('MERCHANT_REGIONS')
+    if env_path:
+        return env_path
+    program_dir = os.path.dirname(os.path.abspath(sys.argv[0] if getattr(sys, 'frozen', False) else __file__))
+    for folder in (os.getcwd(), program_dir):
+        path = os.path.join(folder, REGIONS_FILE)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def validate_registry(registry):
+    """检查配置格式，有错误时抛出ValueError"""
+    if not isinstance(registry, dict) or not registry:
+        raise ValueError("地区配置中没有任何合作商公司")
+    for company, entry in registry.items():
+        organizations = entry.get('organizations')
+        if not isinstance(organizations, dict) or not organizations:
+            raise ValueError(f"{company} 未配置 organizations")
+        township_org = entry.get('township_org')
+        if township_org and township_org not in organizations:
+            raise ValueError(f"{company} 的 township_org '{township_org}' 不在 organizations 中")
+        if not isinstance(entry.get('salary_areas', {}), dict):
+            raise ValueError(f"{company} 的 salary_areas 格式错误")
+    # 合并各公司的配置时同名的外卖组织结构或地区不能对应不同的值
+    _merge_companies(registry, 'organizations')
+    _merge_companies(registry, 'salary_areas')
+
+
+def _merge_companies(registry, key):
+    """
+    按配置顺序合并各公司的某项映射
+
+    多个公司配置了同名的外卖组织结构或地区、且对应的值不同时抛出ValueError，避免后面的公司悄悄覆盖前面的公司
+    """
+    merged, owners = {}, {}
+    for company, entry in registry.items():
+        for name, value in entry.get(key, {}).items():
+            if name in merged and merged[name] != value:
+                raise ValueError(f"{owners[name]} 和 {company} 的 {key} 中都有 '{name}'，但配置不同，"
+                                 f"请使用不同的名称")
+            merged.setdefault(name, value)
+            owners.setdefault(name, company)
+    return merged
+
+
+def load_registry(path=None):
+    """
+    读取地区配置
+
+    :param path: 配置文件路径，默认按模块说明中的顺序查找
+    :return: {公司名称: 配置}，保持文件中的顺序
+    """
+    path = path or find_registry_file()
+    if not path:
+        return DEFAULT_REGISTRY
+    with open(path, encoding='utf-8') as f:
+        registry = json.load(f)
+    validate_registry(registry)
+    return registry
+
+
+def get_registry():
+    """返回当前生效的地区配置，只读取一次"""
+    global _registry
+    if _registry is None:
+        _registry = load_registry()
+    return _registry
+
+
+def get_company(name=None, registry=None):
+    """
+    返回某个合作商公司的配置
+
+    :param name: 公司名称，为None时返回第一个公司
+    """
+    registry = registry or get_registry()
+    if name is None:
+        return next(iter(registry.values()))
+    if name not in registry:
+        raise ValueError(f"地区配置中没有合作商公司: {name}")
+    return registry[name]
+
+
+def organization_mapping(registry=None):
+    """所有公司的外卖组织结构到区域的映射，按配置顺序合并，同名组织结构对应不同区域时抛出ValueError"""
+    return _merge_companies(registry or get_registry(), 'organizations')
+
+
+def salary_areas(registry=None):
+    """所有公司的地区工资计算公式，按配置顺序合并，同名地区的公式不同时抛出ValueError"""
+    return _merge_companies(registry or get_registry(), 'salary_areas')
+
+
+def township_org(registry=None):
+    """第一个配置了乡镇组织结构的公司的 township_org，都未配置时返回None"""
+    registry = registry or get_registry()
+    for entry in registry.values():
+        if entry.get('township_org'):
+            return entry['township_org']
+    return None
@@ -0,0 +1,455 @@
+"""
+按 日期 × 外卖组织结构 × 商家 × 费用列 预先汇总的费用立方体
+
+每处理一天的日账单，就把按组织结构拆分后的数据按商家求和，合并进立方体。之后查询任意日期范围、
+组织结构或区域、商家和费用列的合计（例如“本周白沟哪些商家的商业支持服务费最多”），只需要在
+已汇总的记录中筛选和相加，不需要重新读取日账单或分组文件。
+
+立方体保存为一个文件夹：
+    v<版本>/days.npy       日期（date.toordinal()，int32）
+    v<版本>/orgs.npy       外卖组织结构编号（int16，对应meta.json中的组织结构名称列表）
+    v<版本>/merchants.npy  商家ID（int64，-1表示商家ID为空或无法转换）
+    v<版本>/targets.npy    费用列编号（int16，对应meta.json中的费用列名称列表）
+    v<版本>/values.npy     该商家当天在该组织结构下该费用列的合计（float64）
+    meta.json              当前版本号、组织结构和费用列名称、已导入的 (日期, 组织结构) 及其中存在的费用列、商家名称
+只保存合计不为0的组合（稀疏存储，大部分商家只有少数几个费用列有金额），各数组按
+(日期, 组织结构, 商家, 费用列) 排序并以内存映射方式加载。区域由组织结构按 {外卖组织: 区域}
+在查询时汇总，不单独存储。同一天同一组织结构的数据再次导入时覆盖旧数据。
+每次保存都写入新的版本文件夹再替换meta.json（与merchantIndex相同），Windows上仍被内存映射的旧版本不受影响。
+
+用法：
+    python rollupCube.py 立方体文件夹 --ingest 分组文件夹
+    python rollupCube.py 立方体文件夹 --start 2025-03-10 --end 2025-03-16 --by area day
+    python rollupCube.py 立方体文件夹 --start 2025-03-10 --end 2025-03-16 --area 白沟 --top 商业支持服务费(元)
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import billAggregator
+import billSchema
+import columnResolver
+import feeColumns
+import merchantIndex
+import regionRegistry
+from billCache import file_digest
+from profiling import count, span
+
+FEE_TARGETS = feeColumns.FEE_TARGETS
+MERCHANT_NAME_COL = "商家名称"
+NO_MERCHANT = -1
+ARRAYS = {'days': np.int32, 'orgs': np.int16, 'merchants': np.int64, 'targets': np.int16, 'values': np.float64}
+# 分组方式对应的结果列名
+GROUP_COLUMNS = {'day': '日期', 'org': '外卖组织结构', 'area': '区域', 'merchant': '商家ID'}
+
+
+def empty_cube():
+    """创建空立方体"""
+    cube = {name: np.zeros(0, dtype=dtype) for name, dtype in ARRAYS.items()}
+    cube.update({'org_names': [], 'target_names': [], 'sources': {}, 'merchant_names': {}, 'version': 0})
+    return cube
+
+
+def _version_dir(cube_dir, version):
+    """某个版本的数组所在的文件夹，版本0为旧格式（数组直接保存在立方体文件夹中）"""
+    return os.path.join(cube_dir, f'v{version}') if version else cube_dir
+
+
+def load_cube(cube_dir):
+    """
+    读取立方体，各数组以内存映射方式加载
+
+    :return: 立方体字典，立方体不存在时返回空立方体
+    """
+    meta_path = os.path.join(cube_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return empty_cube()
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    data_dir = _version_dir(cube_dir, meta.get('version', 0))
+    cube = {name: np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+    cube.update(meta)
+    cube.setdefault('version', 0)
+    return cube
+
+
+def _remove_old_versions(cube_dir, current):
+    """删除当前版本以外的数组文件，仍被内存映射（Windows）而无法删除的留到下次保存时再删除"""
+    for name in os.listdir(cube_dir):
+        path = os.path.join(cube_dir, name)
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) != current:
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in {f'{array}.npy' for array in ARRAYS}:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def save_cube(cube_dir, cube):
+    """
+    保存立方体：数组写入新的版本文件夹，再替换meta.json指向新版本，不改动正在使用的旧版本文件
+
+    :return: 新的版本号
+    """
+    os.makedirs(cube_dir, exist_ok=True)
+    meta_path = os.path.join(cube_dir, 'meta.json')
+    current = 0
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            current = json.load(f).get('version', 0)
+    version = max(current, cube.get('version', 0)) + 1
+    data_dir = _version_dir(cube_dir, version)
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(data_dir, f'{name}.npy'), np.asarray(cube[name]))
+    temp_path = os.path.join(cube_dir, 'meta.tmp.json')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict({key: cube[key] for key in ('org_names', 'target_names', 'sources', 'merchant_names')},
+                       version=version), f, ensure_ascii=False)
+    os.replace(temp_path, meta_path)
+    _remove_old_versions(cube_dir, version)
+    cube['version'] = version
+    return version
+
+
+def _code_map(cube, key):
+    """名称列表 cube[key] 对应的 {名称: 编号}，第一次使用时建立，只保存在内存中"""
+    code_maps = cube.setdefault('code_maps', {})
+    if key not in code_maps:
+        code_maps[key] = {name: code for code, name in enumerate(cube[key])}
+    return code_maps[key]
+
+
+def _code(cube, key, name):
+    """返回名称在 cube[key] 中的编号，不存在时追加"""
+    codes = _code_map(cube, key)
+    if name not in codes:
+        codes[name] = len(cube[key])
+        cube[key].append(name)
+    return codes[name]
+
+
+def _day_org_key(days, orgs):
+    """(日期, 组织结构) 合成的排序键，与立方体的前两级排序一致"""
+    return (np.asarray(days, dtype=np.int64) << 16) | np.asarray(orgs, dtype=np.int64)
+
+
+def _source_key(day, org):
+    return f"{day.isoformat()}|{org}"
+
+
+def aggregate_frame(df):
+    """
+    将一个组织结构的账单数据按商家对各费用列求和
+
+    :return: (商家ID数组, 费用列名称列表（与数组一一对应）, 合计数组, 文件中存在的费用列)，只包含合计不为0的组合
+    """
+    found = columnResolver.resolve_columns(df.columns, FEE_TARGETS)
+    if billSchema.MERCHANT_ID_COL in df.columns:
+        merchant_ids = merchantIndex.to_merchant_ids(df[billSchema.MERCHANT_ID_COL])
+    else:
+        merchant_ids = np.full(len(df), NO_MERCHANT, dtype=np.int64)
+    unique_ids, inverse = np.unique(merchant_ids, return_inverse=True)
+
+    merchants, targets, values = [], [], []
+    for target, col in found.items():
+        # 空值按0相加，与pandas求和时忽略空值一致
+        amounts = np.nan_to_num(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float))
+        sums = np.bincount(inverse, weights=amounts, minlength=len(unique_ids))
+        nonzero = np.flatnonzero(sums)
+        merchants.append(unique_ids[nonzero])
+        targets.extend([target] * len(nonzero))
+        values.append(sums[nonzero])
+    if not merchants:
+        return np.zeros(0, dtype=np.int64), [], np.zeros(0), list(found)
+    return np.concatenate(merchants), targets, np.concatenate(values), list(found)
+
+
+def _merchant_names(df):
+    """账单中的 {商家ID: 商家名称}，没有商家名称列时为空"""
+    if billSchema.MERCHANT_ID_COL not in df.columns or MERCHANT_NAME_COL not in df.columns:
+        return {}
+    pairs = pd.DataFrame({'id': merchantIndex.to_merchant_ids(df[billSchema.MERCHANT_ID_COL]),
+                          'name': df[MERCHANT_NAME_COL].astype(object)}).dropna()
+    pairs = pairs[pairs['id'] != NO_MERCHANT].drop_duplicates('id', keep='last')
+    return {str(merchant_id): str(name) for merchant_id, name in zip(pairs['id'], pairs['name'])}
+
+
+def _add_block(blocks, cube, df, day, org, source=None):
+    """
+    将一个组织结构的账单数据汇总为待合并的记录加入blocks（见_merge_blocks），并登记来源和商家名称
+
+    :return: 新增的记录数
+    """
+    merchants, target_names, values, found = aggregate_frame(df)
+    org_code = _code(cube, 'org_names', org)
+    blocks[(day.toordinal(), org_code)] = {
+        'days': np.full(len(merchants), day.toordinal(), dtype=np.int32),
+        'orgs': np.full(len(merchants), org_code, dtype=np.int16),
+        'merchants': merchants.astype(np.int64),
+        'targets': np.array([_code(cube, 'target_names', target) for target in target_names], dtype=np.int16),
+        'values': values.astype(np.float64),
+    }
+    cube['sources'][_source_key(day, org)] = dict(source or {}, targets=found, rows=len(df))
+    cube['merchant_names'].update(_merchant_names(df))
+    count('cube_entries_written', len(merchants))
+    return len(merchants)
+
+
+def _merge_blocks(cube, blocks):
+    """
+    将多个 (日期, 组织结构) 的记录合并进立方体，覆盖这些日期和组织结构已有的数据
+
+    立方体已按 (日期, 组织结构, 商家, 费用列) 排序，只对新记录排序，再按 (日期, 组织结构) 二分查找插入位置，
+    不需要对整个立方体重新排序。
+
+    :param blocks: {(日期序号, 组织结构编号): 记录}，见_add_block
+    """
+    if not blocks:
+        return
+    new = {name: np.concatenate([block[name] for block in blocks.values()]).astype(dtype, copy=False)
+           for name, dtype in ARRAYS.items()}
+    order = np.lexsort((new['targets'], new['merchants'], new['orgs'], new['days']))
+
+    cube_keys = _day_org_key(cube['days'], cube['orgs'])
+    replaced = _day_org_key(*np.array(list(blocks), dtype=np.int64).T)
+    keep = ~np.isin(cube_keys, replaced)
+    positions = np.searchsorted(cube_keys[keep], _day_org_key(new['days'], new['orgs'])[order])
+    for name, dtype in ARRAYS.items():
+        cube[name] = np.insert(np.asarray(cube[name])[keep], positions, new[name][order]).astype(dtype, copy=False)
+
+
+def add_frame(cube, df, day, org, source=None):
+    """
+    将某一天、某个外卖组织的账单数据汇总后合并进立方体，覆盖该天该组织已有的数据
+
+    :param df: 账单数据，包含商家ID和费用列（表头与目标列名的匹配规则见columnResolver）
+    :param day: datetime.date
+    :param source: 来源文件信息 {'path', 'digest'}，用于判断文件是否需要重新导入
+    :return: 新增的记录数
+    """
+    blocks = {}
+    entries = _add_block(blocks, cube, df, day, org, source)
+    _merge_blocks(cube, blocks)
+    return entries
+
+
+def add_groups(cube, groups, day, source_path=None):
+    """
+    合并dataPreprocessing按组织结构拆分后的数据，所有组织结构一次合并
+
+    :param groups: {组织结构: 分组数据}，例如dataPreprocessing.save_outputs的返回值
+    :return: 新增的记录数
+    """
+    source = {'path': source_path} if source_path else None
+    blocks = {}
+    entries = sum(_add_block(blocks, cube, group_data, day, org, source) for org, group_data in groups.items())
+    _merge_blocks(cube, blocks)
+    return entries
+
+
+def update_cube(cube_dir, groups, day, source_path=None, log=print):
+    """读取立方体，合并一天的分组数据后保存（pipeline和watcher每处理一天日账单调用一次）"""
+    with span('更新汇总立方体'):
+        cube = load_cube(cube_dir)
+        entries = add_groups(cube, groups, day, source_path)
+        save_cube(cube_dir, cube)
+    log(f"汇总立方体已更新：{day:%Y-%m-%d} 新增 {entries} 条记录，共 {len(cube['values'])} 条")
+    return cube
+
+
+def _cube_column(name):
+    """导入分组文件时读取的列：商家ID、商家名称和费用列"""
+    return name in (billSchema.MERCHANT_ID_COL, MERCHANT_NAME_COL) or feeColumns.is_fee_column(name)
+
+
+def add_folder(cube, input_folder, organizations=None, log=print):
+    """
+    合并文件夹（包括子文件夹）中所有外卖组织分组文件，内容与上次导入时相同的文件跳过
+
+    :param organizations: {外卖组织: 区域}，默认为regionRegistry.organization_mapping()
+    :return: 新增的记录数
+    """
+    files = billAggregator.find_history_files(input_folder, organizations)
+    total = 0
+    # 每个文件只汇总为待合并的记录，全部读取后一次合并进立方体
+    blocks = {}
+    for day, org, path in files:
+        digest = file_digest(path)
+        if cube['sources'].get(_source_key(day, org), {}).get('digest') == digest:
+            continue
+        df = billSchema.read_bill(path, columns=_cube_column, log=log)
+        entries = _add_block(blocks, cube, df, day, org, {'path': os.path.abspath(path), 'digest': digest})
+        log(f"已导入 {day:%Y-%m-%d} {org}，{entries} 条记录")
+        total += entries
+    _merge_blocks(cube, blocks)
+    log(f"共 {len(files)} 个分组文件，新增 {total} 条记录")
+    return total
+
+
+def _codes(cube, key, selected):
+    """将名称列表转换为 cube[key] 中的编号数组，不存在的名称忽略"""
+    codes = _code_map(cube, key)
+    return np.array([codes[name] for name in selected if name in codes], dtype=np.int64)
+
+
+def _target_name(name):
+    """费用列既可以使用COLUMN_MAPPING中的原列名，也可以使用汇总表中替换后的列名"""
+    if name in FEE_TARGETS:
+        return name
+    for target in FEE_TARGETS:
+        if feeColumns.COLUMN_MAPPING[target] == name:
+            return target
+    raise ValueError(f"未知的费用列: {name}")
+
+
+def select(cube, start=None, end=None, orgs=None, merchants=None, targets=None):
+    """
+    按条件筛选立方体中的记录
+
+    :param start: 起始日期（含），为None时不限
+    :param end: 截止日期（含），为None时不限
+    :param orgs: 外卖组织结构列表，为None时不限
+    :param merchants: 商家ID列表，为None时不限
+    :param targets: 费用列列表，为None时不限
+    :return: 符合条件的记录位置（int64数组）
+    """
+    # 各数组按日期排序，日期范围用二分查找确定
+    days = cube['days']
+    low = 0 if start is None else int(np.searchsorted(days, start.toordinal(), side='left'))
+    high = len(days) if end is None else int(np.searchsorted(days, end.toordinal(), side='right'))
+    mask = np.ones(max(high - low, 0), dtype=bool)
+    if orgs is not None:
+        mask &= np.isin(cube['orgs'][low:high], _codes(cube, 'org_names', orgs))
+    if merchants is not None:
+        mask &= np.isin(cube['merchants'][low:high], np.asarray(list(merchants), dtype=np.int64))
+    if targets is not None:
+        target_names = [_target_name(target) for target in targets]
+        mask &= np.isin(cube['targets'][low:high], _codes(cube, 'target_names', target_names))
+    return low + np.flatnonzero(mask)
+
+
+def rollup(cube, by=('area', 'day'), start=None, end=None, orgs=None, areas=None, merchants=None, targets=None,
+           organizations=None):
+    """
+    按日期范围和筛选条件汇总费用
+
+    :param by: 分组方式，day、org、area、merchant 的组合，为空时返回一行总计
+    :param areas: 区域列表，为None时不限；按区域分组或筛选时，不属于任何区域的组织结构不计入
+    :param organizations: {外卖组织: 区域}，默认为regionRegistry.organization_mapping()
+    :return: DataFrame，分组列之后为各费用列（使用替换后的列名）和合计
+    """
+    organizations = organizations or regionRegistry.organization_mapping()
+    by = list(by)
+    if areas is not None:
+        area_orgs = [org for org, area in organizations.items() if area in areas]
+        orgs = area_orgs if orgs is None else [org for org in orgs if org in area_orgs]
+    elif 'area' in by:
+        orgs = [org for org in organizations if orgs is None or org in orgs]
+
+    with span('查询汇总立方体'):
+        positions = select(cube, start, end, orgs, merchants, targets)
+        entries = pd.DataFrame({'target': np.asarray(cube['targets'])[positions],
+                                'value': np.asarray(cube['values'])[positions]})
+        org_codes = np.asarray(cube['orgs'])[positions]
+        for key in by:
+            if key == 'day':
+                entries[key] = np.asarray(cube['days'])[positions]
+            elif key == 'org':
+                entries[key] = org_codes
+            elif key == 'area':
+                area_names = np.array([organizations.get(name) for name in cube['org_names']] + [None], dtype=object)
+                entries[key] = area_names[org_codes]
+            elif key == 'merchant':
+                entries[key] = np.asarray(cube['merchants'])[positions]
+            else:
+                raise ValueError(f"未知的分组方式: {key}")
+        if by:
+            result = entries.groupby(by + ['target'], sort=True)['value'].sum().unstack('target', fill_value=0.0)
+        else:
+            result = entries.groupby('target')['value'].sum().to_frame().T
+    return _format_result(cube, result, by, targets)
+
+
+def _format_result(cube, result, by, targets):
+    """将编号还原为名称，费用列按FEE_TARGETS排列并使用替换后的列名，最后加上合计"""
+    selected = FEE_TARGETS if targets is None else [_target_name(target) for target in targets]
+    result = result.rename(columns=lambda code: cube['target_names'][code])
+    result = result.reindex(columns=[target for target in FEE_TARGETS if target in selected], fill_value=0.0)
+    result = result.rename(columns=feeColumns.COLUMN_MAPPING)
+    result['合计'] = result.sum(axis=1)
+    result.columns.name = None
+    if not by:
+        return result.reset_index(drop=True)
+    result = result.reset_index()
+    if 'day' in by:
+        result['day'] = [date.fromordinal(int(day)) for day in result['day']]
+    if 'org' in by:
+        result['org'] = [cube['org_names'][code] for code in result['org']]
+    if 'merchant' in by:
+        position = result.columns.get_loc('merchant') + 1
+        result.insert(position, MERCHANT_NAME_COL,
+                      [cube['merchant_names'].get(str(merchant_id)) for merchant_id in result['merchant']])
+    return result.rename(columns=GROUP_COLUMNS)
+
+
+def top_merchants(cube, target, n=10, start=None, end=None, orgs=None, areas=None, organizations=None):
+    """
+    按某个费用列的合计找出金额最大的商家（按绝对值排序，扣款类费用为负数）
+
+    :param target: 费用列，原列名或替换后的列名均可
+    :return: DataFrame，包含商家ID、商家名称、该费用列合计和占筛选范围内合计的比例
+    """
+    result = rollup(cube, ('merchant',), start, end, orgs, areas, targets=[target], organizations=organizations)
+    column = feeColumns.COLUMN_MAPPING[_target_name(target)]
+    result = result.drop(columns=['合计'])
+    total = result[column].sum()
+    result['占比'] = result[column] / total if total else 0.0
+    order = result[column].abs().sort_values(ascending=False, kind='stable').index
+    return result.loc[order].head(n).reset_index(drop=True)
+
+
+def _parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d').date() if text else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="费用汇总立方体：导入分组文件并按日期、组织结构、区域和商家查询")
+    parser.add_argument('cube_dir', help="立方体文件夹")
+    parser.add_argument('--ingest', metavar='FOLDER', help="导入文件夹（包括子文件夹）中的外卖组织分组文件")
+    parser.add_argument('--start', help="查询的起始日期，例如 2025-03-10")
+    parser.add_argument('--end', help="查询的截止日期，例如 2025-03-16")
+    parser.add_argument('--by', nargs='*', choices=list(GROUP_COLUMNS), default=['area'], help="分组方式")
+    parser.add_argument('--org', nargs='*', help="只查询这些外卖组织结构")
+    parser.add_argument('--area', nargs='*', help="只查询这些区域")
+    parser.add_argument('--target', nargs='*', help="只查询这些费用列")
+    parser.add_argument('--top', metavar='TARGET', help="列出该费用列金额最大的商家")
+    parser.add_argument('-n', type=int, default=10, help="--top 列出的商家数量")
+    parser.add_argument('--output', help="将查询结果保存为Excel文件")
+    args = parser.parse_args()
+
+    cube = load_cube(args.cube_dir)
+    if args.ingest:
+        add_folder(cube, args.ingest)
+        save_cube(args.cube_dir, cube)
+    start, end = _parse_date(args.start), _parse_date(args.end)
+    if args.top:
+        result = top_merchants(cube, args.top, args.n, start, end, args.org, args.area)
+    else:
+        result = rollup(cube, args.by, start, end, args.org, args.area, targets=args.target)
+    if args.output:
+        result.to_excel(args.output, index=False)
+        print(f"查询结果已保存到 {args.output}")
+    else:
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
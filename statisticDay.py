@@ -4,6 +4,19 @@ import pandas as pd
 import os
 from tkinter import filedialog
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import re
+import sys
+
+import backgroundTask
+import billSchema
+import billStore
+import monthlyStore
+import columnResolver
+import regionRegistry
+from feeColumns import BILL_DATE_PATTERN, COLUMN_MAPPING, FEE_TARGETS, is_fee_column
+from profiling import format_report, profiled_run, span
 
 
 def select_input_folder():
@@ -38,17 +51,14 @@ def get_date_from_user(month):
     return date
 
 
-def find_column(df, target_column):
-    """模糊匹配列名"""
-    for col in df.columns:
-        if target_column in col:
-            return col
-    return None
+# 外卖组织和对应区域，来自地区配置（见regionRegistry）
+ORGANIZATION_MAPPING = regionRegistry.organization_mapping()
 
 
-def create_monthly_folder(output_folder, month):
+def create_monthly_folder(output_folder, month, year=None):
     """创建月份文件夹"""
-    year = datetime.now().year
+    if year is None:
+        year = datetime.now().year
     month_folder = os.path.join(output_folder, f"{year}年{month}月")
 
     if not os.path.exists(month_folder):
@@ -57,198 +67,380 @@ def create_monthly_folder(output_folder, month):
     return month_folder
 
 
-def update_monthly_summary(month_folder, month, date, summary_data):
-    """更新每月总表"""
-    monthly_file = os.path.join(month_folder, f"{month}月汇总表.xlsx")
-    formatted_date = f"{month}月{date}日"
-
-    if os.path.exists(monthly_file):
-        # 读取现有月度汇总表
-        with pd.ExcelFile(monthly_file) as xls:
-            monthly_df = pd.read_excel(xls, sheet_name=None)
-
-        # 更新每个区域的数据
-        for area, df in summary_data.items():
-            if area in monthly_df:
-                # 检查是否已存在该日期的数据
-                existing_dates = monthly_df[area]['日期'].tolist()
-                if formatted_date not in existing_dates:
-                    # 添加新数据
-                    new_row = summary_data[area].copy()
-                    new_row['日期'] = formatted_date
-                    monthly_df[area] = pd.concat([monthly_df[area], new_row], ignore_index=True)
-                    # 按日期排序
-                    monthly_df[area].sort_values(by='日期', inplace=True)
-            else:
-                # 添加新区域
-                monthly_df[area] = df.copy()
-                monthly_df[area]['日期'] = formatted_date
-    else:
-        # 创建新的月度汇总表
-        monthly_df = {}
-        for area, df in summary_data.items():
-            monthly_df[area] = df.copy()
-            monthly_df[area]['日期'] = formatted_date
-
-    # 保存月度汇总表
-    with pd.ExcelWriter(monthly_file, engine='openpyxl') as writer:
-        for area, df in monthly_df.items():
-            df.to_excel(writer, sheet_name=area, index=False)
-
-
-def main():
-    # 创建主界面
-    root = tk.Tk()
-    root.title("文件处理程序 - test2")
-
-    # 创建用于显示信息的Text组件
-    text_widget = tk.Text(root, height=20, width=80)
-    text_widget.pack()
+def parse_number(text, label="数字"):
+    """
+    从用户输入中取出数字，例如 '3月' -> 3、'13日' -> 13
+
+    :param label: 出错时提示的名称
+    """
+    match = re.search(r'\d+', str(text))
+    if not match:
+        raise ValueError(f"无法识别的{label}: {text}")
+    return int(match.group(0))
+
+
+def _monthly_paths(month_folder, month):
+    """每月总表Excel文件和汇总存储的路径"""
+    return (os.path.join(month_folder, f"{month}月汇总表.xlsx"),
+            os.path.join(month_folder, f"{month}月汇总.db"))
+
+
+def update_monthly_summary(month_folder, month, date, summary_data, year=None):
+    """将一天的汇总数据写入每月汇总存储，返回 {区域: 月度数据}"""
+    return update_monthly_summary_days(month_folder, month, {date: summary_data}, year)
+
+
+def update_monthly_summary_days(month_folder, month, daily_summaries, year=None):
+    """
+    将多天的汇总数据写入每月汇总存储，不导出每月总表
+
+    每月总表Excel文件由export_monthly_summary按需导出（一次运行结束时导出一次），
+    新增一天时不再重写整个文件。
+
+    :param daily_summaries: {日期: {区域: 当日汇总}}
+    :return: {区域: 月度数据}
+    """
+    if year is None:
+        year = datetime.now().year
+    monthly_file, store_path = _monthly_paths(month_folder, month)
+
+    conn = monthlyStore.open_store(store_path)
+    try:
+        # 首次使用存储时导入已有的月汇总表
+        if monthlyStore.is_empty(conn) and os.path.exists(monthly_file):
+            monthlyStore.import_workbook(conn, monthly_file, year)
+
+        for date, summary_data in daily_summaries.items():
+            monthlyStore.upsert_day(conn, datetime(year, int(month), int(date)).date(), summary_data)
+        return monthlyStore.load_month(conn, year, month)
+    finally:
+        conn.close()
+
+
+def export_monthly_summary(month_folder, month, year=None):
+    """
+    由每月汇总存储导出每月总表Excel文件
+
+    :return: 每月总表文件路径，存储不存在时返回None
+    """
+    if year is None:
+        year = datetime.now().year
+    monthly_file, store_path = _monthly_paths(month_folder, month)
+    if not os.path.exists(store_path):
+        return None
+    conn = monthlyStore.open_store(store_path)
+    try:
+        monthlyStore.export_workbook(conn, monthly_file, year, month)
+    finally:
+        conn.close()
+    return monthly_file
+
+
+def summarize_org_frame(df, month, date):
+    """对单个外卖组织的账单数据按列映射求和，生成当日汇总行"""
+    # 查找每个目标列对应的表头，相同的表头只匹配一次
+    found_columns = columnResolver.resolve_columns(df.columns, FEE_TARGETS)
+
+    # 创建汇总DataFrame
+    summary_df = pd.DataFrame()
+    summary_df['日期'] = [f"{month}月{date}日"]
+
+    # 按替换后的列名求和
+    for target, col in found_columns.items():
+        summary_df[COLUMN_MAPPING[target]] = [df[col].sum()]
+
+    # 计算合计
+    sum_columns = [col for col in summary_df.columns if col != '日期']
+    summary_df['合计'] = summary_df[sum_columns].sum(axis=1)
+    return summary_df
+
+
+def summarize_groups(org_frames, month, date, log=print, organizations=None):
+    """
+    按外卖组织生成各区域的当日汇总
+
+    :param org_frames: {外卖组织: 账单数据}
+    :param log: 输出处理信息的函数
+    :param organizations: {外卖组织: 区域}，默认为ORGANIZATION_MAPPING
+    :return: {区域: 当日汇总}，顺序与organizations一致
+    """
+    organizations = organizations or ORGANIZATION_MAPPING
+    all_summary_data = {}
+    for org_group, area in organizations.items():
+        if org_group not in org_frames:
+            log(f"未找到 {org_group} 的文件，跳过")
+            continue
+        all_summary_data[area] = summarize_org_frame(org_frames[org_group], month, date)
+    return all_summary_data
 
-    def append_text(message):
-        text_widget.insert(tk.END, message + "\n")
-        text_widget.see(tk.END)
 
-    append_text("选择包含外卖组织分组文件的文件夹(Test1导出的文件夹)")
+def write_daily_summary(output_path, summary_data, log=print):
+    """将各区域的当日汇总写入同一个Excel文件，每个区域一个工作表"""
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        for area, summary_df in summary_data.items():
+            summary_df.to_excel(writer, sheet_name=area, index=False)
+            log(f"已写入 {area} 工作表")
+
+
+def find_daily_org_files(input_folder, month, start_day, end_day, organizations=None):
+    """
+    在文件夹中查找日期范围内各外卖组织的分组文件，日期取自文件名中的 yyyy-mm-dd
+
+    :param organizations: {外卖组织: 区域}，默认为ORGANIZATION_MAPPING
+    :return: {(日期, 外卖组织): 文件路径}
+    """
+    organizations = organizations or ORGANIZATION_MAPPING
+    org_files = {}
+    for file_name in sorted(os.listdir(input_folder)):
+        if not file_name.endswith('.xlsx') or file_name.startswith(('updated_', '~$')):
+            continue
+        match = BILL_DATE_PATTERN.search(file_name)
+        if not match or int(match.group(2)) != int(month):
+            continue
+        day = int(match.group(3))
+        if not start_day <= day <= end_day:
+            continue
+        for org_group in organizations:
+            if org_group in file_name:
+                org_files.setdefault((day, org_group), os.path.join(input_folder, file_name))
+    return org_files
+
+
+def _summarize_org_file(job):
+    """进程池任务：读取一个分组文件并生成当日汇总"""
+    day, org_group, file_path, month = job
+    df = billSchema.read_bill(file_path, columns=is_fee_column)
+    return day, org_group, summarize_org_frame(df, month, day)
+
+
+def summarize_date_range(input_folder, month, start_day, end_day, workers=None, log=print, organizations=None):
+    """
+    并行汇总日期范围内每一天、每个外卖组织的分组文件
+
+    :param workers: 进程数，默认为CPU核数
+    :param organizations: {外卖组织: 区域}，默认为ORGANIZATION_MAPPING
+    :return: {日期: {区域: 当日汇总}}，按日期排序
+    """
+    organizations = organizations or ORGANIZATION_MAPPING
+    org_files = find_daily_org_files(input_folder, month, start_day, end_day, organizations)
+    jobs = [(day, org_group, file_path, month) for (day, org_group), file_path in sorted(org_files.items())]
+    log(f"共找到 {len(jobs)} 个分组文件，开始并行汇总...")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for day, org_group, summary_df in executor.map(_summarize_org_file, jobs):
+            results[(day, org_group)] = summary_df
+            log(f"已汇总 {month}月{day}日 {org_group}")
+
+    # 按日期和organizations的顺序整理结果
+    daily_summaries = {}
+    for day in sorted({day for day, _ in results}):
+        daily_summaries[day] = {area: results[(day, org_group)]
+                                for org_group, area in organizations.items() if (day, org_group) in results}
+    return daily_summaries
+
+
+def process_date_range(input_folder, output_folder, month, start_day, end_day, year=None, workers=None, log=print,
+                       organizations=None, store=None):
+    """
+    多日模式：汇总日期范围内的所有分组文件，写出每日汇总文件并一次性更新每月总表
+
+    :param organizations: {外卖组织: 区域}，默认为ORGANIZATION_MAPPING
+    :param store: 账单数据库文件（见billStore），指定时先将新的分组文件导入数据库，再由查询得到每日汇总
+    :return: {区域: 月度数据}
+    """
+    month_folder = create_monthly_folder(output_folder, month, year)
+    if store:
+        conn = billStore.open_store(store)
+        try:
+            billStore.ingest_folder(conn, input_folder, organizations, log)
+            daily_summaries = billStore.daily_summaries(conn, month, start_day, end_day, year, organizations)
+        finally:
+            conn.close()
+    else:
+        daily_summaries = summarize_date_range(input_folder, month, start_day, end_day, workers, log, organizations)
+    if not daily_summaries:
+        log("日期范围内未找到任何分组文件")
+        return {}
+
+    for day, summary_data in daily_summaries.items():
+        output_path = os.path.join(month_folder, f"{month}月{day}日外卖组织服务费汇总.xlsx")
+        write_daily_summary(output_path, summary_data, log)
+        log(f"当日汇总文件已保存到 {output_path}")
+
+    log("开始更新每月总表...")
+    monthly_df = update_monthly_summary_days(month_folder, month, daily_summaries, year)
+    # 整个日期范围写入存储后只导出一次每月总表
+    log(f"每月总表已导出到 {export_monthly_summary(month_folder, month, year)}")
+    return monthly_df
+
+
+def ask_inputs(log=print):
+    """
+    选择输入、输出文件夹并输入月份和日期，需要在主线程中调用
+
+    :return: 输入参数字典，未选择时返回None
+    """
+    log("选择包含外卖组织分组文件的文件夹(Test1导出的文件夹)")
     input_folder = select_input_folder()
     if not input_folder:
         messagebox.showerror("错误", "未选择输入文件夹，程序退出")
-        root.destroy()
-        return
+        return None
 
-    append_text("请选择输出文件夹")
+    log("请选择输出文件夹")
     output_folder = select_output_folder()
     if not output_folder:
         messagebox.showerror("错误", "未选择输出文件夹，程序退出")
-        root.destroy()
-        return
+        return None
 
-    append_text("请输入月份（格式：3月）")
+    log("请输入月份（格式：3月）")
     month = get_month_from_user()
     if not month:
         messagebox.showerror("错误", "未输入月份，程序退出")
-        root.destroy()
-        return
+        return None
+
+    # 月份和日期可以带“月”“日”，只取其中的数字
+    try:
+        month = str(parse_number(month, "月份"))
+    except ValueError as e:
+        messagebox.showerror("错误", str(e))
+        return None
 
-    append_text(f"请输入{month}月的日期（格式：3）")
+    log(f"请输入{month}月的日期（格式：3）")
     date = get_date_from_user(month)
     if not date:
         messagebox.showerror("错误", "未输入日期，程序退出")
-        root.destroy()
-        return
+        return None
+    try:
+        date = str(parse_number(date, "日期"))
+    except ValueError as e:
+        messagebox.showerror("错误", str(e))
+        return None
+
+    # 只补充一天时可以不导出每月总表，之后用 python statisticDay.py --export 输出文件夹 --month 3 导出
+    export = messagebox.askyesno("导出每月总表", "是否导出每月总表Excel文件？")
+    return {'input_folder': input_folder, 'output_folder': output_folder, 'month': month, 'date': date,
+            'export': export}
+
+
+def run_stage(inputs, log=print, progress=None):
+    """
+    汇总当天各外卖组织的分组文件并更新每月总表，可在后台线程中执行
+
+    :param inputs: ask_inputs返回的输入参数
+    :param progress: 报告进度的函数 progress(已完成, 总数, 说明)
+    :return: 当日汇总文件路径
+    """
+    progress = progress or (lambda done, total=None, label=None: None)
+    input_folder, output_folder = inputs['input_folder'], inputs['output_folder']
+    month, date = inputs['month'], inputs['date']
 
     # 创建月份文件夹
     month_folder = create_monthly_folder(output_folder, month)
 
-    # 定义外卖组织和对应区域
-    organization_mapping = {
-        '高碑店一组': '高碑店',
-        '高碑店二组': '白沟',
-        '高碑店三组': '新城',
-        '霸州一组': '霸州',
-        '霸州二组': '胜芳',
-        '霸州三组': '霸州乡镇'
-    }
-
-    # 定义列映射关系
-    column_mapping = {
-        '商业支持服务费(元)': '收商家服务费(元)',
-        '企客履约服务费': None,
-        '一口价服务费(元)': '一口价服务费(元)',
-        '配送费(元)': '用户配送费(元)',
-        '活动款(元)': '活动款(元)',
-        '竞价考核': '竞价考核(元)',
-        '罚款(元)': '罚款(元)',
-        '雇主险(元)': '雇主险(元)',
-        '非雇主责任险(元)': '非雇主责任险(元)',
-        '邀新奖励支出(元)': '邀新奖励支出(元)',
-        '省钱包售卖合作商承担': '省钱包售卖合作商承担',
-        '省钱包售卖合作商承担-退款': '省钱包售卖合作商承担-退款',
-        '二次配送费付合作商': '二次配送费付合作商',
-        '二次配送费付合作商-退款': '二次配送费付合作商-退款',
-        '合作商广告分成': '合作商广告分成',
-        '合作商奖励': '合作商奖励',
-        '合作商服务费': '合作商服务费',
-        '合作商服务费退款': '合作商服务费退款',
-        '关爱基金': '关爱基金',
-        '商户服务费返还激励': '商户服务费返还激励',
-        '省钱包售卖返还': '省钱包售卖返还',
-        '合作商售后赔付费用': '合作商售后赔付费用',
-        '合作商成本调账': '合作商成本调账',
-        '春节服务费': '春节服务费',
-        '省钱包核销美团承担': '省钱包核销美团承担',
-        '拼好饭拼单宝': '拼好饭拼单宝',
-        '经营权交易服务费': '经营权交易服务费'
-    }
-
     # 查找所有xlsx文件
     xlsx_files = [f for f in os.listdir(input_folder) if f.endswith('.xlsx') and not f.startswith('updated_')]
 
     # 准备汇总的Excel文件
     output_path = os.path.join(month_folder, f"{month}月{date}日外卖组织服务费汇总.xlsx")
 
-    # 用于存储所有区域的汇总数据，用于更新月度总表
-    all_summary_data = {}
-
-    append_text("开始处理文件...")
-    # 使用ExcelWriter
-    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-        for org_group, area in organization_mapping.items():
-            # 查找对应的文件
-            matching_files = [f for f in xlsx_files if org_group in f]
-
-            if not matching_files:
-                append_text(f"未找到 {org_group} 的文件，跳过")
-                continue
-
-            file_path = os.path.join(input_folder, matching_files[0])
-            append_text(f"处理文件：{matching_files[0]}")
-
-            # 读取文件
-            df = pd.read_excel(file_path)
-
-            # 检查并替换列名
-            new_columns = {}
-            for target, replacement in column_mapping.items():
-                if replacement:  # 只处理有替换值的列
-                    found_column = find_column(df, target)
-                    if found_column:
-                        new_columns[found_column] = replacement
-
-            # 重命名列
-            df = df.rename(columns=new_columns)
-
-            # 创建汇总DataFrame
-            summary_df = pd.DataFrame()
-            summary_df['日期'] = [f"{month}月{date}日"]
-
-            # 求和
-            for col in new_columns.values():
-                if col in df.columns:
-                    summary_df[col] = [df[col].sum()]
+    log("开始处理文件...")
+    with profiled_run('statisticDay', month_folder) as run:
+        org_frames = {}
+        with span('读取文件'):
+            for done, org_group in enumerate(ORGANIZATION_MAPPING):
+                progress(done, len(ORGANIZATION_MAPPING), '读取分组文件')
+                # 查找对应的文件
+                matching_files = [f for f in xlsx_files if org_group in f]
+                if not matching_files:
+                    continue
+
+                log(f"处理文件：{matching_files[0]}")
+                # 读取文件，只保留需要汇总的费用列
+                org_frames[org_group] = billSchema.read_bill(os.path.join(input_folder, matching_files[0]),
+                                                             columns=is_fee_column, log=log)
+            progress(len(ORGANIZATION_MAPPING), len(ORGANIZATION_MAPPING), '读取分组文件')
+
+        # 用于存储所有区域的汇总数据，用于更新月度总表
+        with span('汇总'):
+            all_summary_data = summarize_groups(org_frames, month, date, log)
+        progress(None, None, '写出当日汇总')
+        with span('写出当日汇总'):
+            write_daily_summary(output_path, all_summary_data, log)
+
+        log(f"\n当日汇总文件已保存到 {output_path}")
+
+        # 更新每月总表
+        log("开始更新每月总表...")
+        progress(None, None, '更新每月总表')
+        with span('更新每月总表'):
+            update_monthly_summary(month_folder, month, date, all_summary_data)
+            if inputs.get('export', True):
+                log(f"每月总表已导出到 {export_monthly_summary(month_folder, month)}")
+        log("每月总表更新完成。")
+
+    log(format_report(run))
+    log("处理完成！")
+    return output_path
 
-            # 计算合计
-            sum_columns = [col for col in summary_df.columns if col != '日期']
-            summary_df['合计'] = summary_df[sum_columns].sum(axis=1)
 
-            # 写入Excel
-            summary_df.to_excel(writer, sheet_name=area, index=False)
-            append_text(f"已写入 {area} 工作表")
-
-            # 保存汇总数据用于更新月度总表
-            all_summary_data[area] = summary_df
+def main():
+    # 创建主界面，处理在后台线程中执行，窗口保持响应
+    root = tk.Tk()
+    root.title("文件处理程序 - test2")
+    panel = backgroundTask.create_panel(root)
 
-    append_text(f"\n当日汇总文件已保存到 {output_path}")
+    inputs = ask_inputs(panel['log'])
+    if not inputs:
+        root.destroy()
+        return
 
-    # 更新每月总表
-    append_text("开始更新每月总表...")
-    update_monthly_summary(month_folder, month, date, all_summary_data)
-    append_text("每月总表更新完成。")
+    backgroundTask.start_task(panel, lambda task: run_stage(inputs, task['log'], task['progress']))
+    root.mainloop()
 
-    append_text("处理完成！")
 
-    root.mainloop()
+def export_cli():
+    """按需导出每月总表，例如：python statisticDay.py --export 输出文件夹 --month 3 --year 2025"""
+    parser = argparse.ArgumentParser(description="由每月汇总存储导出每月总表")
+    parser.add_argument('--export', required=True, metavar='OUTPUT_FOLDER', help="输出文件夹（月份文件夹的上一级）")
+    parser.add_argument('--month', required=True, help="月份，例如 3")
+    parser.add_argument('--year', type=int, help="年份，默认为当前年份")
+    args = parser.parse_args()
+    month = str(parse_number(args.month, "月份"))
+    month_folder = os.path.join(args.export, f"{args.year or datetime.now().year}年{month}月")
+    monthly_file = export_monthly_summary(month_folder, month, args.year)
+    print(f"每月总表已导出到 {monthly_file}" if monthly_file else f"{month_folder} 中没有每月汇总数据")
+
+
+def run_cli():
+    """命令行多日模式，例如：python statisticDay.py 输入文件夹 输出文件夹 --month 3 --start 1 --end 31"""
+    parser = argparse.ArgumentParser(description="按日期范围批量生成外卖组织服务费汇总")
+    parser.add_argument('input_folder', help="包含外卖组织分组文件的文件夹(Test1导出的文件夹)")
+    parser.add_argument('output_folder', help="输出文件夹")
+    parser.add_argument('--month', required=True, help="月份，例如 3")
+    parser.add_argument('--start', type=int, default=1, help="起始日期")
+    parser.add_argument('--end', type=int, default=31, help="截止日期")
+    parser.add_argument('--year', type=int, help="年份，默认为当前年份")
+    parser.add_argument('--workers', type=int, help="并行进程数，默认为CPU核数")
+    parser.add_argument('--regions', help="地区配置文件，默认使用regions.json或内置配置")
+    parser.add_argument('--company', help="只汇总地区配置中该合作商公司的外卖组织")
+    parser.add_argument('--store', help="账单数据库文件，导入新的分组文件后由数据库查询汇总（见billStore）")
+    args = parser.parse_args()
+    registry = regionRegistry.load_registry(args.regions)
+    if args.company:
+        organizations = regionRegistry.get_company(args.company, registry)['organizations']
+    else:
+        organizations = regionRegistry.organization_mapping(registry)
+    month = str(parse_number(args.month, "月份"))
+    process_date_range(args.input_folder, args.output_folder, month, args.start, args.end, args.year, args.workers,
+                       organizations=organizations, store=args.store)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 带 --export 时只导出每月总表，带其他命令行参数时使用多日模式，否则打开图形界面
+    if '--export' in sys.argv:
+        export_cli()
+    elif len(sys.argv) > 1:
+        run_cli()
+    else:
+        main()
\ No newline at end of file
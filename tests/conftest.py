@@ -0,0 +1,40 @@
+import os
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 各模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FEE_ORGANIZATIONS = {'白沟一组': '白沟', '白沟二组': '白沟', '新城一组': '新城'}
+FEE_DAY = date(2025, 3, 13)
+
+
+def _fee_bill(seed, rows=200):
+    """合成的分组数据：表头带后缀、含空值，并同时包含 合作商服务费 和 合作商服务费退款"""
+    rng = np.random.default_rng(seed)
+
+    def amounts():
+        values = np.round(rng.uniform(-100, 100, rows), 2)
+        values[rng.random(rows) < 0.1] = np.nan
+        return values
+
+    return pd.DataFrame({
+        '商家ID': rng.integers(1000, 1050, rows),
+        '商家名称': [f"商家{seed}" for _ in range(rows)],
+        '商业支持服务费(元)': amounts(),
+        '配送费(元)': amounts(),
+        '活动款(元)': amounts(),
+        '合作商服务费退款': amounts(),
+        '合作商服务费': amounts(),
+        '罚款(元)': np.zeros(rows),
+    })
+
+
+@pytest.fixture(scope='session')
+def fee_groups():
+    """{外卖组织: 合成的分组数据}，外卖组织与FEE_ORGANIZATIONS一致"""
+    return {org: _fee_bill(seed) for seed, org in enumerate(FEE_ORGANIZATIONS)}
@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+import billStore
+import statisticDay
+from conftest import FEE_DAY as DAY, FEE_ORGANIZATIONS as ORGANIZATIONS
+
+
+def test_daily_summaries_match_summarize_groups(fee_groups, tmp_path):
+    conn = billStore.open_store(str(tmp_path / '账单.db'))
+    try:
+        billStore.ingest_groups(conn, fee_groups, DAY)
+        summaries = billStore.daily_summaries(conn, DAY.month, DAY.day, DAY.day, DAY.year, ORGANIZATIONS)
+    finally:
+        conn.close()
+    expected = statisticDay.summarize_groups(fee_groups, DAY.month, DAY.day, lambda message: None, ORGANIZATIONS)
+    assert list(summaries) == [DAY.day]
+    assert list(summaries[DAY.day]) == list(expected)
+    for area, summary_df in expected.items():
+        pd.testing.assert_frame_equal(summaries[DAY.day][area], summary_df, check_dtype=False)
+
+
+def test_reingesting_a_day_replaces_its_rows(fee_groups, tmp_path):
+    conn = billStore.open_store(str(tmp_path / '账单.db'))
+    try:
+        billStore.ingest_groups(conn, fee_groups, DAY)
+        billStore.ingest_groups(conn, fee_groups, DAY)
+        totals = billStore.fee_totals(conn, DAY, DAY, by=('org',)).set_index('org')
+    finally:
+        conn.close()
+    for org, df in fee_groups.items():
+        expected = statisticDay.summarize_org_frame(df, DAY.month, DAY.day)
+        assert totals.loc[org, '合作商服务费'] == pytest.approx(expected['合作商服务费'][0])
+        assert totals.loc[org, '合作商服务费退款'] == pytest.approx(expected['合作商服务费退款'][0])
+        assert totals.loc[org, '商业支持服务费(元)'] == pytest.approx(expected['收商家服务费(元)'][0])
+
+
+def test_unchanged_file_is_not_hashed_again(fee_groups, tmp_path, monkeypatch):
+    file_path = tmp_path / '高碑店-2025-03-13-日账单_白沟一组.xlsx'
+    fee_groups['白沟一组'].to_excel(file_path, index=False)
+    conn = billStore.open_store(str(tmp_path / '账单.db'))
+    try:
+        assert billStore.ingest_file(conn, str(file_path), DAY, '白沟一组', log=lambda message: None) == 200
+        # 只改变修改时间：内容哈希相同，跳过导入并记录新的修改时间
+        stat = file_path.stat()
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert billStore.ingest_file(conn, str(file_path), DAY, '白沟一组') == 0
+        monkeypatch.setattr(billStore, 'file_digest', lambda path: pytest.fail("文件被重新计算哈希"))
+        assert billStore.ingest_file(conn, str(file_path), DAY, '白沟一组') == 0
+    finally:
+        conn.close()
@@ -0,0 +1,39 @@
+import columnResolver
+from feeColumns import FEE_TARGETS
+
+
+def test_exact_headers_are_used_regardless_of_order():
+    headers = ['合作商服务费退款', '商家ID', '合作商服务费']
+    found = columnResolver.resolve_columns(headers, ['合作商服务费', '合作商服务费退款'])
+    assert found == {'合作商服务费': '合作商服务费', '合作商服务费退款': '合作商服务费退款'}
+
+
+def test_longest_target_claims_its_header_first():
+    # 两个表头都包含 '合作商服务费'，较长的 '合作商服务费退款' 先匹配，剩下的表头才给较短的目标列
+    headers = ['合作商服务费退款(元)', '合作商服务费(元)']
+    found = columnResolver.resolve_columns(headers, ['合作商服务费', '合作商服务费退款'])
+    assert found == {'合作商服务费': '合作商服务费(元)', '合作商服务费退款': '合作商服务费退款(元)'}
+
+
+def test_exact_match_takes_precedence_over_containing_header():
+    headers = ['省钱包售卖合作商承担-退款', '省钱包售卖合作商承担']
+    found = columnResolver.resolve_columns(headers, FEE_TARGETS)
+    assert found['省钱包售卖合作商承担'] == '省钱包售卖合作商承担'
+    assert found['省钱包售卖合作商承担-退款'] == '省钱包售卖合作商承担-退款'
+
+
+def test_candidate_with_fewest_extra_characters_wins():
+    headers = ['罚款(元)及说明', '罚款(元)x']
+    assert columnResolver.resolve_columns(headers, ['罚款(元)']) == {'罚款(元)': '罚款(元)x'}
+
+
+def test_missing_targets_are_left_out_and_order_follows_targets():
+    headers = ['配送费(元)', '活动款(元)']
+    found = columnResolver.resolve_columns(headers, ['活动款(元)', '罚款(元)', '配送费(元)'])
+    assert list(found) == ['活动款(元)', '配送费(元)']
+
+
+def test_original_column_objects_are_returned():
+    headers = [0, '配送费(元)']
+    assert columnResolver.resolve_columns(headers, ['配送费(元)'])['配送费(元)'] == '配送费(元)'
+    assert columnResolver.resolve_columns(headers, ['0'])['0'] == 0
@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import merchantIndex
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=[merchantIndex.MERCHANT_ID_COL, merchantIndex.ORG_STRUCTURE_COL])
+
+
+def _write_export(folder, timestamp, rows):
+    path = folder / f"海豚_合作商商家数据_1_{timestamp}_7469372.xlsx"
+    _frame(rows).to_excel(path, index=False)
+    return str(path)
+
+
+def test_merge_keeps_last_row_per_merchant_and_lookup_is_vectorized():
+    index = merchantIndex.merge_frame(merchantIndex.empty_index(), _frame([(3, '白沟一组'), (1, '新城'), (3, '白沟二组')]))
+    index = merchantIndex.merge_frame(index, _frame([(2, '新城'), (1, None)]))
+    assert list(index['ids']) == [1, 2, 3]
+    result = merchantIndex.lookup(index, pd.Series([3, 2, 1, 99, None, 'x']))
+    assert list(result[:2]) == ['白沟二组', '新城']
+    # 商家1的组织结构被更新为空；不存在、为空和无法转换的商家ID都查不到
+    assert pd.isna(result[2:]).all()
+    assert list(merchantIndex.contains(index, [1, 4, 2.0])) == [True, False, True]
+
+
+def test_invalid_ids_are_detected():
+    values = pd.Series([12, 12.0, 12.5, -3, 'abc', '15', None])
+    assert list(merchantIndex.invalid_merchant_ids(values)) == [False, False, True, True, True, False, False]
+    assert list(merchantIndex.to_merchant_ids(values)) == [12, 12, -1, -1, -1, 15, -1]
+
+
+def test_newer_export_replaces_index_and_older_export_is_skipped(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    messages = []
+    first = _write_export(tmp_path, '20250310_080000', [(1, '白沟一组'), (2, '新城'), ('abc', '新城')])
+    index = merchantIndex.update_index(index_dir, first, messages.append)
+    assert list(index['ids']) == [1, 2]
+    assert any('不是整数' in message and 'abc' in message for message in messages)
+
+    newer = _write_export(tmp_path, '20250315_145729', [(1, '白沟二组'), (3, '高碑店一组')])
+    index = merchantIndex.update_index(index_dir, newer, messages.append)
+    # 新文件中已没有的商家2被删除
+    assert list(index['ids']) == [1, 3]
+    assert list(merchantIndex.lookup(index, [1, 3])) == ['白沟二组', '高碑店一组']
+    assert index['exported_at'] == '2025-03-15T14:57:29'
+
+    older = _write_export(tmp_path, '20250312_080000', [(1, '新城')])
+    index = merchantIndex.update_index(index_dir, older, messages.append)
+    assert list(merchantIndex.lookup(index, [1, 3])) == ['白沟二组', '高碑店一组']
+    assert '早于' in messages[-1]
+
+    merchantIndex.update_index(index_dir, newer, messages.append)
+    assert '无需重新读取' in messages[-1]
+
+
+def test_update_writes_a_new_version_and_leaves_the_loaded_one_alone(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'index')
+    merchantIndex.update_index(index_dir, _write_export(tmp_path, '20250310_080000', [(1, '白沟一组')]), print)
+    loaded = merchantIndex.load_index(index_dir)
+    loaded_files = {os.path.realpath(os.path.join(index_dir, 'v1', name)) for name in ('ids.npy', 'codes.npy')}
+
+    # Windows上无法替换被内存映射的文件：更新时不能写入或替换已加载版本的数组文件
+    real_replace = os.replace
+
+    def replace(src, dst):
+        assert os.path.realpath(dst) not in loaded_files
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', replace)
+    index = merchantIndex.update_index(index_dir, _write_export(tmp_path, '20250315_080000', [(2, '新城')]), print)
+    assert index['version'] == 2
+    assert list(merchantIndex.lookup(index, [2])) == ['新城']
+    assert list(loaded['ids']) == [1]
+    assert sorted(name for name in os.listdir(index_dir)) == ['meta.json', 'v2']
+
+
+def test_index_saved_in_the_old_layout_is_still_loaded(tmp_path):
+    index_dir = tmp_path / 'index'
+    index_dir.mkdir()
+    np.save(index_dir / 'ids.npy', np.array([5, 7], dtype=np.int64))
+    np.save(index_dir / 'codes.npy', np.array([0, -1], dtype=np.int32))
+    (index_dir / 'meta.json').write_text(json.dumps({'orgs': ['白沟一组'], 'sources': []}), encoding='utf-8')
+    index = merchantIndex.load_index(str(index_dir))
+    assert index['version'] == 0
+    assert merchantIndex.lookup(index, [5])[0] == '白沟一组'
+
+    merchantIndex.save_index(str(index_dir), merchantIndex.merge_frame(index, _frame([(9, '新城')])))
+    assert sorted(name for name in os.listdir(index_dir)) == ['meta.json', 'v1']
+    assert list(merchantIndex.load_index(str(index_dir))['ids']) == [5, 7, 9]
@@ -0,0 +1,64 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import monthlyStore
+
+
+def _summary(day, **values):
+    df = pd.DataFrame({'日期': [f"3月{day}日"]})
+    for column, value in values.items():
+        df[column] = [value]
+    df['合计'] = df.drop(columns='日期').sum(axis=1)
+    return df
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = monthlyStore.open_store(str(tmp_path / '3月汇总.db'))
+    yield conn
+    conn.close()
+
+
+def test_days_are_sorted_by_date_and_areas_keep_first_seen_order(conn):
+    monthlyStore.upsert_day(conn, date(2025, 3, 13), {'白沟': _summary(13, 活动款=1.0), '新城': _summary(13, 活动款=2.0)})
+    monthlyStore.upsert_day(conn, date(2025, 3, 2), {'新城': _summary(2, 活动款=5.0), '白沟': _summary(2, 活动款=3.0)})
+    monthly = monthlyStore.load_month(conn, 2025, 3)
+    assert list(monthly) == ['白沟', '新城']
+    assert list(monthly['白沟']['日期']) == ['3月2日', '3月13日']
+    assert list(monthly['新城']['活动款']) == [5.0, 2.0]
+    assert list(monthly['白沟'].columns) == ['日期', '活动款', '合计']
+
+
+def test_rerunning_a_day_replaces_its_values(conn):
+    monthlyStore.upsert_day(conn, date(2025, 3, 13), {'白沟': _summary(13, 活动款=1.0, 罚款=2.0)})
+    monthlyStore.upsert_day(conn, date(2025, 3, 14), {'白沟': _summary(14, 活动款=4.0, 罚款=0.0)})
+    monthlyStore.upsert_day(conn, date(2025, 3, 13), {'白沟': _summary(13, 活动款=10.0, 罚款=20.0)})
+    df = monthlyStore.load_month(conn, 2025, 3)['白沟']
+    assert len(df) == 2
+    assert df.loc[0, ['活动款', '罚款', '合计']].tolist() == [10.0, 20.0, 30.0]
+    assert df.loc[1, ['活动款', '罚款', '合计']].tolist() == [4.0, 0.0, 4.0]
+
+
+def test_other_months_are_not_loaded(conn):
+    monthlyStore.upsert_day(conn, date(2025, 3, 31), {'白沟': _summary(31, 活动款=1.0)})
+    monthlyStore.upsert_day(conn, date(2025, 4, 1), {'白沟': _summary(1, 活动款=2.0)})
+    assert list(monthlyStore.load_month(conn, 2025, 3)['白沟']['日期']) == ['3月31日']
+
+
+def test_exported_workbook_can_be_imported_again(conn, tmp_path):
+    monthlyStore.upsert_day(conn, date(2025, 3, 13), {'白沟': _summary(13, 活动款=1.5), '新城': _summary(13, 活动款=2.0)})
+    monthlyStore.upsert_day(conn, date(2025, 3, 14), {'白沟': _summary(14, 活动款=3.0)})
+    monthly_file = str(tmp_path / '3月汇总表.xlsx')
+    expected = monthlyStore.export_workbook(conn, monthly_file, 2025, 3)
+
+    imported = monthlyStore.open_store(str(tmp_path / 'imported.db'))
+    try:
+        monthlyStore.import_workbook(imported, monthly_file, 2025)
+        result = monthlyStore.load_month(imported, 2025, 3)
+    finally:
+        imported.close()
+    assert list(result) == list(expected)
+    for area in expected:
+        pd.testing.assert_frame_equal(result[area], expected[area])
@@ -0,0 +1,52 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import Statistics
+
+
+def _parse(values, year=None):
+    messages = []
+    return Statistics.parse_dates(pd.Series(values, dtype=object), year, '测试日期', messages.append), messages
+
+
+def test_excel_serial_numbers():
+    result, messages = _parse([45729, 45730.0, np.int64(45731)])
+    assert list(result) == [pd.Timestamp(2025, 3, 13), pd.Timestamp(2025, 3, 14), pd.Timestamp(2025, 3, 15)]
+    assert messages == []
+
+
+def test_month_day_text_uses_the_given_year():
+    # 年份与当前年份不同时，'x月x日' 必须使用指定的年份，否则与单量和费用表合并时对不上
+    year = datetime.now().year - 1
+    result, _ = _parse(['3月13日', ' 12月 1日'], year=year)
+    assert list(result) == [pd.Timestamp(year, 3, 13), pd.Timestamp(year, 12, 1)]
+    result, messages = _parse(['2月29日'], year=2024)
+    assert result[0] == pd.Timestamp(2024, 2, 29) and messages == []
+
+
+def test_month_day_text_defaults_to_the_current_year():
+    result, _ = _parse(['3月13日'])
+    assert result[0] == pd.Timestamp(datetime.now().year, 3, 13)
+
+
+def test_iso_strings_and_date_objects():
+    values = ['2024-03-13', '2024/03/14', date(2024, 3, 15), datetime(2024, 3, 16, 8, 30), pd.Timestamp(2024, 3, 17)]
+    result, messages = _parse(values, year=2025)
+    assert list(result) == [pd.Timestamp(2024, 3, 13), pd.Timestamp(2024, 3, 14), pd.Timestamp(2024, 3, 15),
+                            pd.Timestamp(2024, 3, 16, 8, 30), pd.Timestamp(2024, 3, 17)]
+    assert messages == []
+
+
+def test_total_rows_become_nat_with_one_message():
+    values = pd.Series(['3月1日', '合计', None, '本月累计', '合计'], index=[10, 11, 12, 13, 14], dtype=object)
+    messages = []
+    result = Statistics.parse_dates(values, 2024, '测试日期', messages.append)
+    assert list(result.index) == [10, 11, 12, 13, 14]
+    assert result[10] == pd.Timestamp(2024, 3, 1)
+    assert result[[11, 12, 13, 14]].isna().all()
+    # 空值不算无法识别；无法识别的值汇总为一条提示
+    assert len(messages) == 1
+    assert '测试日期' in messages[0] and '3 个值' in messages[0]
+    assert '合计' in messages[0] and '本月累计' in messages[0]
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+import rollupCube
+import statisticDay
+from conftest import FEE_DAY as DAY, FEE_ORGANIZATIONS as ORGANIZATIONS
+
+
+def _assert_sorted(cube):
+    order = np.lexsort((cube['targets'], cube['merchants'], cube['orgs'], cube['days']))
+    assert np.array_equal(order, np.arange(len(order)))
+
+
+def test_rollup_by_org_matches_summarize_org_frame(fee_groups):
+    cube = rollupCube.empty_cube()
+    rollupCube.add_groups(cube, fee_groups, DAY)
+    # 再次合并同一天的数据覆盖旧数据，不会重复计算
+    rollupCube.add_groups(cube, fee_groups, DAY)
+    _assert_sorted(cube)
+    result = rollupCube.rollup(cube, by=('org',), start=DAY, end=DAY, organizations=ORGANIZATIONS)
+    result = result.set_index(result.columns[0])
+    for org, df in fee_groups.items():
+        expected = statisticDay.summarize_org_frame(df, DAY.month, DAY.day).drop(columns='日期').iloc[0]
+        # 立方体只保存合计不为0的费用列
+        actual = result.loc[org].reindex(expected.index, fill_value=0.0)
+        np.testing.assert_allclose(actual.to_numpy(dtype=float), expected.to_numpy(dtype=float), atol=1e-6)
+
+
+def test_rollup_by_area_sums_its_organizations(fee_groups):
+    cube = rollupCube.empty_cube()
+    rollupCube.add_groups(cube, fee_groups, DAY)
+    result = rollupCube.rollup(cube, by=('area',), organizations=ORGANIZATIONS)
+    result = result.set_index(result.columns[0])
+    expected = sum(statisticDay.summarize_org_frame(fee_groups[org], DAY.month, DAY.day)['合计'][0]
+                   for org in ('白沟一组', '白沟二组'))
+    assert result.loc['白沟', '合计'] == pytest.approx(expected)
+
+
+def test_days_merged_out_of_order_stay_sorted(fee_groups):
+    cube = rollupCube.empty_cube()
+    for day in (DAY.replace(day=14), DAY.replace(day=12), DAY):
+        rollupCube.add_groups(cube, fee_groups, day)
+    rollupCube.add_frame(cube, fee_groups['新城一组'].head(50), DAY.replace(day=12), '新城一组')
+    _assert_sorted(cube)
+    result = rollupCube.rollup(cube, by=('day',), orgs=['新城一组'], organizations=ORGANIZATIONS)
+    expected = statisticDay.summarize_org_frame(fee_groups['新城一组'].head(50), 3, 12)['合计'][0]
+    assert result['合计'].iloc[0] == pytest.approx(expected)
+    assert len(result) == 3
+
+
+def test_update_cube_leaves_the_loaded_version_alone(fee_groups, tmp_path, monkeypatch):
+    cube_dir = str(tmp_path / 'cube')
+    rollupCube.update_cube(cube_dir, fee_groups, DAY.replace(day=12), log=lambda message: None)
+    loaded = rollupCube.load_cube(cube_dir)
+    loaded_files = {os.path.realpath(os.path.join(cube_dir, 'v1', f'{name}.npy')) for name in rollupCube.ARRAYS}
+
+    # Windows上无法替换被内存映射的文件：更新时不能写入或替换已加载版本的数组文件
+    real_replace = os.replace
+
+    def replace(src, dst):
+        assert os.path.realpath(dst) not in loaded_files
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', replace)
+    cube = rollupCube.update_cube(cube_dir, fee_groups, DAY, log=lambda message: None)
+    assert cube['version'] == 2
+    assert len(cube['values']) == 2 * len(loaded['values'])
+    assert sorted(os.listdir(cube_dir)) == ['meta.json', 'v2']
+    assert len(rollupCube.load_cube(cube_dir)['values']) == len(cube['values'])
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Statistics
+
+SPECIAL_VALUES = [np.nan, None, 'abc', '', '12.5', ' 8 ', '1,000', 0, -0.0, 1.115, 2.675, 0.125, -1.005, 1e9 + 0.005]
+
+
+def _random_values(seed, size=5000):
+    rng = np.random.default_rng(seed)
+    # 三位小数的值中有大量恰好落在半分上的值
+    return np.round(rng.uniform(-50000, 50000, size), 3)
+
+
+def _assert_same(vectorized, scalar):
+    np.testing.assert_array_equal(np.asarray(vectorized, dtype=float), np.asarray(scalar, dtype=float))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_tax_matches_scalar_on_random_values(seed):
+    service_fee = _random_values(seed)
+    salary = _random_values(seed + 100)
+    expected = [Statistics.calculate_tax(fee, pay) for fee, pay in zip(service_fee, salary)]
+    _assert_same(Statistics.calculate_tax_vectorized(service_fee, salary), expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_supplement_insurance_matches_scalar_on_random_values(seed):
+    insurance = _random_values(seed)
+    expected = [Statistics.calculate_supplement_insurance(value) for value in insurance]
+    _assert_same(Statistics.calculate_supplement_insurance_vectorized(insurance), expected)
+
+
+def test_half_cent_ties_round_like_builtin():
+    # 补充险恰好为半分的雇主险金额：np.round与内置round在这些值上结果不同
+    insurance = [value * 2.9 / 1.1 for value in (1.115, 2.675, 0.125, 10.005, -3.335)]
+    expected = [Statistics.calculate_supplement_insurance(value) for value in insurance]
+    _assert_same(Statistics.calculate_supplement_insurance_vectorized(insurance), expected)
+    assert Statistics.calculate_supplement_insurance_vectorized([1.115 * 2.9 / 1.1])[0] == -1.11
+
+
+def test_nan_and_non_numeric_inputs():
+    values = pd.Series(SPECIAL_VALUES, dtype=object)
+    salary = pd.Series(list(reversed(SPECIAL_VALUES)), dtype=object)
+    _assert_same(Statistics.calculate_tax_vectorized(values, salary),
+                 [Statistics.calculate_tax(fee, pay) for fee, pay in zip(values, salary)])
+    _assert_same(Statistics.calculate_supplement_insurance_vectorized(values),
+                 [Statistics.calculate_supplement_insurance(value) for value in values])
@@ -0,0 +1,58 @@
+import re
+import zipfile
+
+import openpyxl
+import pytest
+
+import wagesCalculation
+import workbookSession
+
+AREAS = {'测试': '运营中心!B2+运营中心!C2'}
+
+
+def _write_formula_workbook(path, days):
+    """B列为公式 =A*3 并带有Excel保存的计算结果，C列为普通数字"""
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = '运营中心'
+    sheet.append(['基数', '公式', '数字'])
+    for day in range(1, days + 1):
+        sheet.append([day * 10, f'=A{day + 1}*3', day])
+    wb.save(path)
+
+    # openpyxl不计算公式，补上Excel保存时会写入的缓存值
+    with zipfile.ZipFile(path) as source:
+        contents = {name: source.read(name) for name in source.namelist()}
+    sheet_xml = contents['xl/worksheets/sheet1.xml'].decode('utf-8')
+    sheet_xml = re.sub(r'<c r="B(\d+)"([^>]*)><f>([^<]*)</f><v\s*/?>(?:</v>)?',
+                       lambda m: f'<c r="B{m.group(1)}"{m.group(2)}><f>{m.group(3)}</f>'
+                                 f'<v>{(int(m.group(1)) - 1) * 30}</v>', sheet_xml)
+    contents['xl/worksheets/sheet1.xml'] = sheet_xml.encode('utf-8')
+    with zipfile.ZipFile(path, 'w') as target:
+        for name, data in contents.items():
+            target.writestr(name, data)
+
+
+@pytest.fixture
+def formula_workbook(tmp_path):
+    path = str(tmp_path / '总商薪资摊销.xlsx')
+    _write_formula_workbook(path, 31)
+    yield path
+    workbookSession.close_sessions(path)
+
+
+def test_xlsx_formula_cells_use_cached_values(formula_workbook):
+    wb = workbookSession.workbook(workbookSession.open_session(formula_workbook))
+    headers, rows = wagesCalculation.build_salary_summary(wb, 3, 5, year=2025, areas=AREAS)
+    assert headers == ['日期', '测试', '合计']
+    # 公式的计算结果（day*30）加上C列的数字，而不是从公式文本 '=A2*3' 中提取的数字
+    assert [row[1] for row in rows[:5]] == [day * 31 for day in range(1, 6)]
+    assert rows[5][1:] == [None, None]
+
+
+def test_session_workbook_matches_openpyxl_data_only(formula_workbook):
+    # 改用工作簿会话之前，xlsx文件由 openpyxl.load_workbook(data_only=True) 打开
+    expected = wagesCalculation.build_salary_summary(openpyxl.load_workbook(formula_workbook, data_only=True), 3, 31,
+                                                     year=2025, areas=AREAS)
+    wb = workbookSession.workbook(workbookSession.open_session(formula_workbook))
+    assert wagesCalculation.build_salary_summary(wb, 3, 31, year=2025, areas=AREAS) == expected
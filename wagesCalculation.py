@@ -2,16 +2,24 @@ import os
 import calendar
 from datetime import datetime
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+from tkinter import filedialog, simpledialog
 import re
+import json
 
 try:
+    import numpy as np
+    import pandas as pd
     import openpyxl
     import xlrd
 except ImportError:
-    print("请先安装依赖库：pip install openpyxl xlrd")
+    print("请先安装依赖库：pip install numpy pandas openpyxl xlrd")
     raise
 
+import backgroundTask
+import regionRegistry
+import workbookSession
+from profiling import count, format_report, profiled_run, span
+
 
 def safe_numeric_convert(value):
     """
@@ -85,6 +93,72 @@ def get_cell_value(workbook, sheet_name, cell_ref):
         return 0
 
 
+NUMBER_PATTERN = r'([-+]?(?:\d+(?:\.\d*)?|\.\d+))'
+
+
+def to_numeric_array(rows):
+    """
+    safe_numeric_convert的向量化版本，将整张工作表的值一次性转换为数字
+
+    :param rows: 工作表各行的值，各行长度可以不同
+    :return: 二维浮点数组，无法转换的值为0
+    """
+    frame = pd.DataFrame(rows, dtype=object)
+    if frame.empty:
+        return np.zeros((0, 0))
+    kinds = frame.map(type).to_numpy()
+    values = frame.to_numpy(dtype=object)
+
+    # 数字和布尔值直接转换
+    result = np.zeros(values.shape)
+    numeric_mask = (kinds == int) | (kinds == float) | (kinds == bool)
+    result[numeric_mask] = values[numeric_mask].astype(float)
+
+    # 字符串去掉空格和逗号后提取第一个数字
+    str_mask = kinds == str
+    if str_mask.any():
+        cleaned = pd.Series(values[str_mask]).str.replace(' ', '').str.replace(',', '')
+        extracted = cleaned.str.extract(NUMBER_PATTERN)[0].astype(float)
+        result[str_mask] = extracted.fillna(0).to_numpy()
+    return result
+
+
+def read_sheet_rows(workbook, sheet_name):
+    """读取工作表中所有行的值，支持openpyxl和xlrd工作簿"""
+    if isinstance(workbook, openpyxl.workbook.workbook.Workbook):
+        return list(workbook[sheet_name].iter_rows(values_only=True))
+    elif isinstance(workbook, xlrd.book.Book):
+        sheet = workbook.sheet_by_name(sheet_name)
+        return [sheet.row_values(row_index) for row_index in range(sheet.nrows)]
+    else:
+        raise ValueError("不支持的工作簿类型")
+
+
+def load_sheet_arrays(workbook, sheet_names):
+    """
+    将引用到的工作表各读取一次并转换为数值二维数组
+
+    :return: {工作表名称: 二维数组}，读取失败的工作表对应空数组
+    """
+    sheet_arrays = {}
+    for sheet_name in sheet_names:
+        try:
+            sheet_arrays[sheet_name] = to_numeric_array(read_sheet_rows(workbook, sheet_name))
+        except Exception as e:
+            print(f"读取工作表时出错: {sheet_name}, {e}")
+            sheet_arrays[sheet_name] = np.zeros((0, 0))
+    return sheet_arrays
+
+
+def column_slice(sheet_array, col_index, start_row, count):
+    """取出某列从start_row开始的count个值，超出工作表范围的部分补0"""
+    values = np.zeros(count)
+    if col_index < sheet_array.shape[1]:
+        available = sheet_array[start_row:start_row + count, col_index]
+        values[:len(available)] = available
+    return values
+
+
 def calculate_area_salary(workbook, area_formula):
     """
     根据给定的Excel工作簿和地区计算公式计算工资
@@ -107,70 +181,151 @@ def calculate_area_salary(workbook, area_formula):
         return 0.00
 
 
-def generate_salary_summary(input_file, output_file, month, end_day, text_widget):
+# 各地区工资计算公式（对应每月1日所在行），来自地区配置（见regionRegistry）
+AREAS = regionRegistry.salary_areas()
+
+
+CELL_REF_PATTERN = re.compile(r'^([A-Za-z]+)(\d+)$')
+
+
+def compile_area_formula(formula):
     """
-    生成工资计提汇总表
+    将地区工资公式编译为引用计划
 
-    :param input_file: 输入的Excel文件路径
-    :param output_file: 输出的Excel文件路径
+    :param formula: 如 '运营中心!W6+摊销人员!E6'，行号为每月1日所在行
+    :return: [(工作表名称, 列索引, 1日所在行索引)]，索引均从0开始
+    """
+    plan = []
+    for part in formula.split('+'):
+        part = part.strip()
+        sheet_name, cell_ref = part.split('!')
+        match = CELL_REF_PATTERN.match(cell_ref.strip())
+        if not match:
+            raise ValueError(f"无效的单元格引用: {part}")
+        col_str, row_str = match.groups()
+        plan.append((sheet_name.strip(), excel_column_to_index(col_str), int(row_str) - 1))
+    return plan
+
+
+def compile_areas(areas):
+    """编译所有地区的工资公式，返回 {地区: 引用计划}"""
+    return {area: compile_area_formula(formula) for area, formula in areas.items()}
+
+
+def load_areas(config_path):
+    """
+    从JSON文件读取地区工资公式，格式与AREAS相同，例如 {"高碑店": "运营中心!W6+配送总表!B3"}
+
+    :return: {地区: 公式}，保持文件中的顺序
+    """
+    with open(config_path, encoding='utf-8') as f:
+        areas = json.load(f)
+    compile_areas(areas)  # 提前检查公式格式
+    return areas
+
+
+def evaluate_plan(sheet_arrays, plan, days):
+    """
+    按引用计划计算多天的地区工资
+
+    :param sheet_arrays: load_sheet_arrays返回的 {工作表名称: 二维数组}
+    :param plan: compile_area_formula返回的引用计划
+    :param days: 天数，计算1日到days日
+    :return: 每天的工资列表（保留两位小数）
+    """
+    totals = np.zeros(days)
+    for sheet_name, col_index, base_row in plan:
+        totals += column_slice(sheet_arrays[sheet_name], col_index, base_row, days)
+    return [round(float(total), 2) for total in totals]
+
+
+def build_salary_summary(wb, month, end_day, year=None, areas=None):
+    """
+    根据工资摊销工作簿计算每日各地区的计提工资
+
+    :param wb: 工作簿对象
     :param month: 计算的月份
     :param end_day: 截止日期
-    :param text_widget: 用于显示信息的Text组件
-    """
-    wb = load_workbook(input_file)
-    areas = {
-        '高碑店': '运营中心!W6+摊销人员!E6+后线及站长!M6+业务侧薪资汇总!B3+配送总表!B3',
-        '白沟': '运营中心!X6+摊销人员!F6+后线及站长!AC6+业务侧薪资汇总!C3+配送总表!C3',
-        '新城': '新城工资!F2+配送总表!D3',
-        '霸州': '运营中心!Y6+摊销人员!M6+后线及站长!O46+业务侧薪资汇总!E3+配送总表!E3',
-        '胜芳': '运营中心!Z6+摊销人员!N6+后线及站长!X46+业务侧薪资汇总!F3+配送总表!F3',
-        '霸州乡镇': '配送总表!G3',
-        '邢台': '运营中心!AA6+后线及站长!AD86+业务侧薪资汇总!G3+配送总表!H3',
-        '下花园': '运营中心!AC6+摊销人员!U6+后线及站长!G125+业务侧薪资汇总!H3+配送总表!I3',
-        '万全': '运营中心!AD6+摊销人员!T6+后线及站长!O125+业务侧薪资汇总!I3+配送总表!J3'
-    }
+    :param year: 计算的年份，默认为当前年份
+    :param areas: {地区: 公式}，默认为AREAS
+    :return: (表头列表, 每日数据行列表)，截止日期之后的行数值为None
+    """
+    if year is None:
+        year = datetime.now().year
+    areas = areas or AREAS
+    headers = ['日期'] + list(areas.keys()) + ['合计']
+    _, max_days = calendar.monthrange(year, month)
+    end_day = min(end_day, max_days)
+
+    # 每个地区的公式只编译一次，引用到的工作表各读取一次，并一次计算所有日期
+    plans = compile_areas(areas)
+    with span('读取工作表'):
+        sheet_arrays = load_sheet_arrays(wb, {sheet_name for plan in plans.values() for sheet_name, _, _ in plan})
+    with span('计算'):
+        area_values = [evaluate_plan(sheet_arrays, plan, end_day) for plan in plans.values()]
+
+    rows = []
+    for day in range(1, max_days + 1):
+        row = [f"{month}月{day}日"]
+        if day <= end_day:
+            salaries = [values[day - 1] for values in area_values]
+            row.extend(salaries)
+            row.append(round(sum(salaries), 2))
+        else:
+            row.extend([None] * (len(headers) - 1))
+        rows.append(row)
+    return headers, rows
+
+
+def write_salary_summary(headers, rows, output_file):
+    """将工资计提汇总写入Excel文件"""
     new_wb = openpyxl.Workbook()
     sheet = new_wb.active
     sheet.title = '工资计提汇总'
-    headers = ['日期'] + list(areas.keys()) + ['合计']
     for col, header in enumerate(headers, 1):
         sheet.cell(row=1, column=col, value=header)
-    _, max_days = calendar.monthrange(datetime.now().year, month)
-    for day in range(1, max_days + 1):
-        row = day + 1
-        sheet.cell(row=row, column=1, value=f"{month}月{day}日")
-        if day <= end_day:
-            row_total = 0
-            for col, (area, formula) in enumerate(areas.items(), 2):
-                adjusted_formula = []
-                for part in formula.split('+'):
-                    part = part.strip()
-                    sheet_name, cell_ref = part.split('!')
-                    col_str = ''.join(filter(str.isalpha, cell_ref))
-                    row_num = ''.join(filter(str.isdigit, cell_ref))
-                    if row_num:
-                        new_row_num = str(int(row_num) + (day - 1))
-                        adjusted_cell = f"{col_str}{new_row_num}"
-                        adjusted_formula.append(f"{sheet_name}!{adjusted_cell}")
-                    else:
-                        adjusted_formula.append(part)
-                adjusted_formula = '+'.join(adjusted_formula)
-                salary = calculate_area_salary(wb, adjusted_formula)
-                sheet.cell(row=row, column=col, value=round(salary, 2))
-                row_total += salary
-            sheet.cell(row=row, column=len(headers), value=round(row_total, 2))
-        else:
-            for col in range(2, len(headers) + 1):
-                sheet.cell(row=row, column=col, value="")
+    for row_idx, row in enumerate(rows, 2):
+        for col, value in enumerate(row, 1):
+            sheet.cell(row=row_idx, column=col, value="" if value is None else value)
     new_wb.save(output_file)
-    text_widget.insert(tk.END, f"工资计提汇总表已生成: {output_file}\n")
-    text_widget.see(tk.END)
+    count('cells_written', len(headers) * (len(rows) + 1))
 
 
-def select_input_file(text_widget):
+def generate_salary_summary(input_file, output_file, month, end_day, log=print, progress=None):
     """
-    通过文件对话框选择输入文件
+    生成工资计提汇总表，可在后台线程中执行
+
+    :param input_file: 输入的Excel文件路径
+    :param output_file: 输出的Excel文件路径
+    :param month: 计算的月份
+    :param end_day: 截止日期
+    :param log: 输出处理信息的函数
+    :param progress: 报告进度的函数 progress(已完成, 总数, 说明)
     """
+    progress = progress or (lambda done, total=None, label=None: None)
+    try:
+        with profiled_run('wagesCalculation', os.path.dirname(output_file)) as run:
+            progress(0, 3, '读取工作簿')
+            wb = workbookSession.workbook(workbookSession.open_session(input_file))
+            progress(1, 3, '计算工资')
+            headers, rows = build_salary_summary(wb, month, end_day)
+            progress(2, 3, '写出汇总表')
+            with span('写出汇总表'):
+                write_salary_summary(headers, rows, output_file)
+            progress(3, 3, '写出汇总表')
+    finally:
+        workbookSession.close_sessions(input_file)
+    log(f"工资计提汇总表已生成: {output_file}")
+    log(format_report(run))
+
+
+def ask_inputs(log=print):
+    """
+    通过对话框选择输入文件、月份、截止日期和输出文件，需要在主线程中调用
+
+    :return: 输入参数字典，取消选择时返回None
+    """
+    log("请选择Excel输入文件")
     input_file = filedialog.askopenfilename(
         title="选择Excel输入文件(总商薪资摊销2025.3终(1))",
         filetypes=[
@@ -179,7 +334,7 @@ def select_input_file(text_widget):
         ]
     )
     if not input_file:
-        return
+        return None
     month = simpledialog.askinteger(
         "选择月份",
         "请输入要计算的月份(1-12):",
@@ -188,7 +343,7 @@ def select_input_file(text_widget):
         initialvalue=datetime.now().month
     )
     if not month:
-        return
+        return None
     _, max_days = calendar.monthrange(datetime.now().year, month)
     end_day = simpledialog.askinteger(
         "选择截止日期",
@@ -198,48 +353,41 @@ def select_input_file(text_widget):
         initialvalue=max_days
     )
     if not end_day:
-        return
+        return None
     output_file = filedialog.asksaveasfilename(
         title="保存工资汇总表",
         defaultextension=".xlsx",
         filetypes=[("Excel文件", "*.xlsx")]
     )
     if not output_file:
-        return
-    try:
-        generate_salary_summary(input_file, output_file, month, end_day, text_widget)
-    except Exception as e:
-        messagebox.showerror("错误", str(e))
+        return None
+    return {'input_file': input_file, 'output_file': output_file, 'month': month, 'end_day': end_day}
 
 
-def load_workbook(file_path):
+def run_stage(inputs, log=print, progress=None):
     """
-    根据文件扩展名加载不同类型的Excel文件
+    生成工资计提汇总表，可在后台线程中执行
 
-    :param file_path: Excel文件路径
-    :return: 工作簿对象
+    :param inputs: ask_inputs返回的输入参数
+    :return: 输出文件路径
     """
-    file_extension = os.path.splitext(file_path)[1].lower()
-    if file_extension in ['.xlsx', '.xlsm', '.xltx', '.xltm']:
-        return openpyxl.load_workbook(file_path, data_only=True)
-    elif file_extension in ['.xls', '.xlsb']:
-        return xlrd.open_workbook(file_path)
-    else:
-        raise ValueError(f"不支持的文件类型: {file_extension}")
+    generate_salary_summary(inputs['input_file'], inputs['output_file'], inputs['month'], inputs['end_day'],
+                            log, progress)
+    return inputs['output_file']
 
 
 def main():
+    # 处理在后台线程中执行，窗口保持响应
     root = tk.Tk()
     root.title("工资计提汇总表生成程序")
-    text_widget = tk.Text(root, height=20, width=80)
-    text_widget.pack()
+    panel = backgroundTask.create_panel(root)
 
-    def append_text(message):
-        text_widget.insert(tk.END, message + "\n")
-        text_widget.see(tk.END)
+    inputs = ask_inputs(panel['log'])
+    if not inputs:
+        root.mainloop()
+        return
 
-    append_text("请选择Excel输入文件")
-    select_input_file(text_widget)
+    backgroundTask.start_task(panel, lambda task: run_stage(inputs, task['log'], task['progress']))
     root.mainloop()
 
 
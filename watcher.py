@@ -0,0 +1,295 @@
+"""
+监控文件夹：新的日账单、海豚_合作商商家数据或乡镇商家明细放入收件文件夹后自动处理
+
+    日账单（文件名含 yyyy-mm-dd 和“日账单”）   添加组织结构、拆分为分组文件、生成当日汇总并写入每月汇总存储
+    海豚_合作商商家数据（文件名含“海豚”）       替换导出时间更早的商家索引，之后的日账单使用新的组织结构
+    乡镇商家明细（文件名含“乡镇商家”）          替换当前使用的乡镇商家列表
+
+Excel打开文件时产生的 ~$ 开头的临时文件会被忽略。文件大小和修改时间在 --debounce 秒内不再变化后
+才会处理，避免读取尚未下载完成的文件。待处理文件放入容量有限的队列，由一个后台线程依次处理，
+队列中的文件全部处理完后才导出一次每月总表。
+处理成功的文件记录在输出文件夹的 .watcher_state.json 中，重启后不会重复处理；文件内容变化后会重新处理。
+出错的文件在本次运行中不再重试，重启或文件变化后重新处理；商家索引为空时日账单暂缓处理，
+放入海豚_合作商商家数据文件后自动处理。
+每天的日账单处理后按商家汇总并合并进汇总立方体（默认为输出文件夹下的“汇总立方体”，查询方法见rollupCube）。
+
+用法：python watcher.py 收件文件夹 输出文件夹 --township 乡镇商家明细.xlsx
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import billSchema
+import dataPreprocessing
+import merchantIndex
+import pipeline
+import regionRegistry
+import statisticDay
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls', '.xlsm')
+STATE_FILE = '.watcher_state.json'
+# 同一轮中先处理商家数据，再按日期处理日账单
+KIND_ORDER = {'township': 0, 'merchant_base': 1, 'bill': 2}
+
+
+def classify_file(file_name):
+    """
+    根据文件名判断文件类型
+
+    :return: 'bill'、'merchant_base'、'township'，无需处理的文件返回None
+    """
+    if file_name.startswith(('~$', '.')) or not file_name.lower().endswith(EXCEL_EXTENSIONS):
+        return None
+    if '乡镇商家' in file_name:
+        return 'township'
+    if '海豚' in file_name:
+        return 'merchant_base'
+    if '日账单' in file_name and statisticDay.BILL_DATE_PATTERN.search(file_name):
+        return 'bill'
+    return None
+
+
+def file_signature(path):
+    """文件大小和修改时间，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_state(output_folder):
+    """读取已处理文件的记录 {文件路径: 处理时的文件签名}"""
+    path = os.path.join(output_folder, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(output_folder, state):
+    temp_path = os.path.join(output_folder, STATE_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, os.path.join(output_folder, STATE_FILE))
+
+
+def scan_inbox(inbox, pending, state, queued, debounce, now=None):
+    """
+    扫描收件文件夹，返回已稳定且尚未处理的文件
+
+    :param pending: {文件路径: (文件签名, 签名首次出现的时间)}，在多次扫描之间保留
+    :param state: 已处理文件的记录（也包括本次运行中出错或暂缓处理的文件），签名相同的文件不再返回
+    :param queued: 已在队列中的文件路径
+    :return: [(类型, 文件路径)]，按处理顺序排列
+    """
+    now = time.monotonic() if now is None else now
+    ready = []
+    seen = set()
+    for entry in os.scandir(inbox):
+        kind = classify_file(entry.name) if entry.is_file() else None
+        if kind is None:
+            continue
+        path = entry.path
+        seen.add(path)
+        signature = file_signature(path)
+        if signature is None or state.get(path) == signature or path in queued:
+            continue
+        previous = pending.get(path)
+        if previous is None or previous[0] != signature:
+            pending[path] = (signature, now)
+        elif now - previous[1] >= debounce:
+            ready.append((kind, path))
+
+    # 已删除的文件不再等待
+    for path in list(pending):
+        if path not in seen:
+            del pending[path]
+
+    return sorted(ready, key=lambda item: processing_order(*item))
+
+
+def processing_order(kind, path):
+    """处理顺序：先处理商家数据，再按日期处理日账单"""
+    match = statisticDay.BILL_DATE_PATTERN.search(os.path.basename(path))
+    return KIND_ORDER[kind], match.group(0) if match else '', path
+
+
+def run_watcher(inbox, output_folder, township_merchants=None, index_dir=None, company=None, regions=None,
+                interval=2.0, debounce=5.0, queue_size=100, write_full_copy=False, log=print, stop_event=None,
+                cube_dir=None):
+    """
+    持续监控收件文件夹，直到stop_event被设置或按下Ctrl+C
+
+    :param township_merchants: 初始的乡镇商家明细文件，也可以之后放入收件文件夹
+    :param index_dir: 商家索引文件夹，默认为输出文件夹下的“商家索引”
+    :param company: 地区配置中的合作商公司，默认为第一个
+    :param interval: 扫描间隔（秒）
+    :param debounce: 文件保持不变多少秒后才处理
+    :param queue_size: 待处理队列的容量，队列满时暂停扫描
+    :param cube_dir: 汇总立方体文件夹，默认为输出文件夹下的“汇总立方体”
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    index_dir = index_dir or os.path.join(output_folder, '商家索引')
+    entry = regionRegistry.get_company(company, regionRegistry.load_registry(regions))
+    config = {
+        'output_folder': output_folder,
+        'organizations': entry['organizations'],
+        'township_org': entry.get('township_org'),
+        'write_full_copy': write_full_copy,
+        'rollup_cube': cube_dir or os.path.join(output_folder, '汇总立方体'),
+    }
+    # 处理线程和扫描线程共享的数据
+    context = {
+        'df1': None,
+        'index': merchantIndex.load_index(index_dir),
+        'state': load_state(output_folder),
+        # 已写入每月汇总存储、尚未导出每月总表的月份 (月份文件夹, 月份, 年份)
+        'unexported': set(),
+        # 本次运行中出错的文件 {路径: 签名}，不写入状态文件：文件内容变化或重启后重新处理
+        'failed': {},
+        # 商家索引为空时暂缓处理的日账单 {路径: 签名}，导入海豚文件后自动处理
+        'deferred': {},
+    }
+    if township_merchants:
+        context['df1'] = billSchema.read_bill(township_merchants, columns=[dataPreprocessing.MERCHANT_ID_COL],
+                                             log=log)
+
+    stop_event = stop_event or threading.Event()
+    work_queue = queue.Queue(maxsize=queue_size)
+    queued = set()
+    state_lock = threading.Lock()
+
+    def handle(kind, path):
+        if kind == 'township':
+            context['df1'] = billSchema.read_bill(path, columns=[dataPreprocessing.MERCHANT_ID_COL], log=log)
+            log(f"已更新乡镇商家明细，共 {len(context['df1'])} 个商家")
+        elif kind == 'merchant_base':
+            context['index'] = merchantIndex.update_index(index_dir, path, log)
+        else:
+            if not len(context['index']['ids']):
+                # 商家索引为空时所有商家都会归入未知组织结构，等导入海豚文件后再处理
+                return False
+            match = statisticDay.BILL_DATE_PATTERN.search(os.path.basename(path))
+            year, month, day = int(match.group(1)), str(int(match.group(2))), str(int(match.group(3)))
+            month_folder = statisticDay.create_monthly_folder(output_folder, month, year)
+            _, summary_data = pipeline.process_bill(dict(config, year=year, month=month), path, day, month_folder,
+                                                    context['df1'], None, context['index'], log)
+            statisticDay.update_monthly_summary(month_folder, month, day, summary_data, year)
+            context['unexported'].add((month_folder, month, year))
+        return True
+
+    def export_months():
+        # 每月总表在队列中的文件全部处理完后才导出，连续放入多天的账单时只导出一次
+        for month_folder, month, year in sorted(context['unexported']):
+            try:
+                statisticDay.export_monthly_summary(month_folder, month, year)
+                log(f"{month}月汇总表已更新")
+            except Exception as e:
+                log(f"导出{month}月汇总表时出错: {e}")
+        context['unexported'].clear()
+
+    def process(kind, path, signature):
+        start = time.perf_counter()
+        log(f"\n开始处理 {os.path.basename(path)}")
+        try:
+            done = handle(kind, path)
+        except Exception as e:
+            log(f"处理 {os.path.basename(path)} 时出错: {e}")
+            outcome = 'failed'
+        else:
+            outcome = 'done' if done else 'deferred'
+        with state_lock:
+            queued.discard(path)
+            context['failed'].pop(path, None)
+            context['deferred'].pop(path, None)
+            # 只记录处理成功的文件；出错或暂缓的文件不写入状态文件，重启后会重新处理
+            if outcome == 'done':
+                context['state'][path] = signature
+                save_state(output_folder, context['state'])
+            else:
+                context[outcome][path] = signature
+        if outcome == 'done':
+            log(f"处理完成，用时 {time.perf_counter() - start:.1f} 秒")
+        elif outcome == 'deferred':
+            log("商家索引为空，暂缓处理该日账单，放入海豚_合作商商家数据文件后自动处理")
+
+        if outcome == 'done' and kind == 'merchant_base' and len(context['index']['ids']):
+            with state_lock:
+                deferred = sorted(context['deferred'].items(), key=lambda item: processing_order('bill', item[0]))
+            if deferred:
+                log(f"商家索引已可用，开始处理暂缓的 {len(deferred)} 个日账单")
+            for bill_path, bill_signature in deferred:
+                if stop_event.is_set():
+                    break
+                process('bill', bill_path, bill_signature)
+
+    def worker():
+        # 停止时只等待当前文件处理完成，队列中剩余的文件下次启动时重新处理
+        while not stop_event.is_set():
+            try:
+                kind, path, signature = work_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                process(kind, path, signature)
+            finally:
+                work_queue.task_done()
+            if work_queue.empty():
+                export_months()
+        export_months()
+
+    worker_thread = threading.Thread(target=worker, daemon=True)
+    worker_thread.start()
+    log(f"开始监控 {inbox}，按 Ctrl+C 停止")
+
+    pending = {}
+    try:
+        while not stop_event.is_set():
+            with state_lock:
+                known = dict(context['state'], **context['failed'], **context['deferred'])
+                ready = scan_inbox(inbox, pending, known, queued, debounce)
+            for kind, path in ready:
+                signature = pending.pop(path)[0]
+                with state_lock:
+                    queued.add(path)
+                    # 内容变化后重新排队的文件不再作为暂缓的文件处理
+                    context['deferred'].pop(path, None)
+                # 队列已满时等待，处理跟不上时不会继续堆积
+                while not stop_event.is_set():
+                    try:
+                        work_queue.put((kind, path, signature), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+            stop_event.wait(interval)
+    except KeyboardInterrupt:
+        log("正在停止，等待当前文件处理完成...")
+    finally:
+        stop_event.set()
+        worker_thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监控收件文件夹，自动处理新的日账单和商家数据")
+    parser.add_argument('inbox', help="收件文件夹")
+    parser.add_argument('output_folder', help="输出文件夹")
+    parser.add_argument('--township', help="乡镇商家明细文件")
+    parser.add_argument('--index', help="商家索引文件夹，默认为输出文件夹下的“商家索引”")
+    parser.add_argument('--regions', help="地区配置文件")
+    parser.add_argument('--company', help="地区配置中的合作商公司，默认为第一个")
+    parser.add_argument('--interval', type=float, default=2.0, help="扫描间隔（秒）")
+    parser.add_argument('--debounce', type=float, default=5.0, help="文件保持不变多少秒后才处理")
+    parser.add_argument('--queue-size', type=int, default=100, help="待处理队列的容量")
+    parser.add_argument('--full-copy', action='store_true', help="同时输出完整的 updated_ 日账单")
+    parser.add_argument('--cube', help="汇总立方体文件夹，默认为输出文件夹下的“汇总立方体”")
+    args = parser.parse_args()
+    run_watcher(args.inbox, args.output_folder, args.township, args.index, args.company, args.regions,
+                args.interval, args.debounce, args.queue_size, args.full_copy, cube_dir=args.cube)
+
+
+if __name__ == '__main__':
+    main()
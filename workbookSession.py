@@ -0,0 +1,92 @@
+"""
+工作簿只解析一次，供多个阶段共用
+
+同一个文件（按路径、大小和修改时间区分）只打开一次，工作表名称、解析后的工作表和底层工作簿对象
+（xlrd或openpyxl）都从这一次解析中获得。例如总商薪资摊销同时用于工资计提（wagesCalculation）和
+配送单量（Statistics），在同一次运行中只会被解压和解析一次。
+
+用法：
+    session = open_session(file_path)
+    names = sheet_names(session)
+    df = read_sheet(session, '配送单量', header=1)
+    ...
+    close_sessions()
+"""
+import os
+
+import pandas as pd
+
+from profiling import count, span
+
+_sessions = {}
+
+
+def _session_key(file_path):
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def open_session(file_path):
+    """
+    打开工作簿，已打开且文件未变化时直接返回已有的会话
+
+    :return: 会话字典
+    """
+    key = _session_key(file_path)
+    session = _sessions.get(key)
+    if session is None:
+        # 同一路径的旧版本文件已失效
+        for old_key in [k for k in _sessions if k[0] == key[0]]:
+            _close(_sessions.pop(old_key))
+        with span('打开工作簿'):
+            session = {'path': file_path, 'excel_file': pd.ExcelFile(file_path), 'frames': {}}
+        count('bytes_read', key[1])
+        _sessions[key] = session
+    return session
+
+
+def sheet_names(session):
+    """工作表名称列表"""
+    return session['excel_file'].sheet_names
+
+
+def read_sheet(session, sheet_name=0, header=0):
+    """
+    读取一个工作表，同一工作表和表头行只解析一次
+
+    :return: DataFrame的副本，调用方可以直接修改
+    """
+    key = (sheet_name, header)
+    if key not in session['frames']:
+        with span('解析工作表'):
+            session['frames'][key] = session['excel_file'].parse(sheet_name, header=header)
+        count('rows_read', len(session['frames'][key]))
+    return session['frames'][key].copy()
+
+
+def read_sheets(session, names=None, header=0):
+    """
+    读取多个工作表
+
+    :param names: 工作表名称列表，默认为全部工作表
+    :return: {工作表名称: DataFrame}，顺序与names一致
+    """
+    names = sheet_names(session) if names is None else names
+    return {name: read_sheet(session, name, header) for name in names}
+
+
+def workbook(session):
+    """底层的工作簿对象（.xls为xlrd.Book，.xlsx为只读的openpyxl.Workbook）"""
+    return session['excel_file'].book
+
+
+def _close(session):
+    session['excel_file'].close()
+    session['frames'].clear()
+
+
+def close_sessions(file_path=None):
+    """关闭某个文件的会话，不指定文件时关闭全部会话"""
+    for key in list(_sessions):
+        if file_path is None or key[0] == os.path.abspath(file_path):
+            _close(_sessions.pop(key))
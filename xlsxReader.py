@@ -0,0 +1,137 @@
+"""
+流式读取xlsx文件
+
+使用openpyxl的只读模式逐行解析工作表，只保留需要的列，不构建完整的单元格对象，
+适合只用到少数几列的大型日账单文件。
+
+读取结果与pd.read_excel一致：重复的表头按pandas的规则重命名为 X.1、X.2，空表头命名为 Unnamed: n，
+中间的空行保留为全空的行，末尾的空行去掉。与pd.read_excel不同的是，表头统一转换为字符串。
+"""
+import os
+from collections import defaultdict
+
+import openpyxl
+import pandas as pd
+
+STREAMABLE_EXTENSIONS = ['.xlsx', '.xlsm', '.xltx', '.xltm']
+
+
+def _column_selector(columns):
+    """将列名列表或判断函数统一为判断函数，None表示保留全部列"""
+    if columns is None:
+        return lambda name: True
+    if callable(columns):
+        return columns
+    wanted = set(columns)
+    return lambda name: name in wanted
+
+
+def _header_names(header_row):
+    """生成与pd.read_excel一致的列名，空表头命名为 Unnamed: n，重复的表头依次加 .1、.2 后缀"""
+    names = [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header_row)]
+    unnamed = [i for i, value in enumerate(header_row) if value is None]
+    # 与pandas的python解析器相同：先处理有表头的列，再处理空表头的列；后缀已被其他表头占用时继续加1
+    counts = defaultdict(int)
+    for i in [i for i in range(len(names)) if i not in unnamed] + unnamed:
+        name = original = names[i]
+        current = counts[name]
+        while current > 0:
+            counts[original] = current + 1
+            name = f"{original}.{current}"
+            current = current + 1 if name in names else counts[name]
+        names[i] = name
+        counts[name] = current + 1
+    return names
+
+
+def _convert_value(value):
+    """与pd.read_excel保持一致：整数值的浮点数转换为int"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_rows(file_path, columns=None, sheet_name=0, header=0):
+    """
+    逐行读取工作表中选定的列
+
+    :param file_path: xlsx文件路径
+    :param columns: 需要的列名列表，或以列名为参数的判断函数，None表示全部列
+    :param sheet_name: 工作表名称或序号
+    :param header: 表头所在行（从0开始）
+    :return: 生成器，第一个元素为选中的列名列表，之后每个元素为一行数据的元组（工作表末尾的空行会被跳过）
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+
+        header_row = ()
+        for _ in range(header + 1):
+            header_row = next(rows, ())
+        names = _header_names(header_row)
+
+        select = _column_selector(columns)
+        indices = [i for i, name in enumerate(names) if select(name)]
+        yield [names[i] for i in indices]
+
+        # 整行（包括未选中的列）都为空时先暂存，后面还有数据时才输出，与pd.read_excel去掉末尾空行一致
+        blank_rows = 0
+        empty = tuple(None for _ in indices)
+        for row in rows:
+            if all(value is None for value in row):
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                yield empty
+            blank_rows = 0
+            yield tuple(_convert_value(row[i]) if i < len(row) else None for i in indices)
+    finally:
+        wb.close()
+
+
+def read_columns(file_path, columns=None, sheet_name=0, header=0):
+    """
+    以流式方式读取选定的列并返回DataFrame，非xlsx文件退化为pd.read_excel
+
+    :param columns: 需要的列名列表，或以列名为参数的判断函数
+    :return: 只包含选定列的DataFrame
+    """
+    if os.path.splitext(file_path)[1].lower() not in STREAMABLE_EXTENSIONS:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, header=header)
+        select = _column_selector(columns)
+        return df[[col for col in df.columns if select(str(col))]]
+
+    rows = iter_rows(file_path, columns, sheet_name, header)
+    names = next(rows)
+    return pd.DataFrame.from_records(list(rows), columns=names)
+
+
+def iter_frames(file_path, columns=None, sheet_name=0, header=0, batch_size=50000):
+    """
+    按固定行数分批读取选定的列，内存占用只与批大小有关
+
+    :param batch_size: 每批的行数
+    :return: 生成器，每个元素为一批数据的DataFrame（列名相同）；没有数据行时只输出一个只有列名的空DataFrame，
+             调用方仍然可以得到表头
+    """
+    if os.path.splitext(file_path)[1].lower() not in STREAMABLE_EXTENSIONS:
+        df = read_columns(file_path, columns, sheet_name, header)
+        if df.empty:
+            yield df
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size]
+        return
+
+    rows = iter_rows(file_path, columns, sheet_name, header)
+    names = next(rows)
+    batch = []
+    yielded = False
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch, columns=names)
+            yielded = True
+            batch = []
+    if batch or not yielded:
+        yield pd.DataFrame.from_records(batch, columns=names)